@@ -1,20 +1,77 @@
-from django.core.management import execute_from_command_line
+from django.core.management import call_command
+from contextlib import redirect_stdout
+from io import StringIO
 import os
+import pkgutil
+import re
 import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bankproject.settings')
 django.setup()
 
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.recorder import MigrationRecorder
+from importlib import import_module
+
+# Migrations on disk never change within a deployed instance, so they are listed once
+_migration_files = None
+
+# migrate's own per-migration timing line at verbosity 2
+APPLIED_LINE = re.compile(r'Applying (\S+)\.\.\. OK \(([\d.]+)s\)')
+
+def migration_files():
+    """(app, name) of every migration on disk, found without building the migration graph"""
+    global _migration_files
+    if _migration_files is None:
+        found = set()
+        for app_config in apps.get_app_configs():
+            module_name, _ = MigrationLoader.migrations_module(app_config.label)
+            try:
+                module = import_module(module_name)
+            except ImportError:
+                continue
+            for info in pkgutil.iter_modules(getattr(module, '__path__', [])):
+                if not info.ispkg and info.name[0] not in '_~':
+                    found.add((app_config.label, info.name))
+        _migration_files = frozenset(found)
+    return _migration_files
+
+def unapplied_migrations(database=DEFAULT_DB_ALIAS):
+    """Migrations on disk missing from a database's django_migrations, read with a single query"""
+    try:
+        applied = set(MigrationRecorder(connections[database]).migration_qs.values_list('app', 'name'))
+    except DatabaseError:
+        # No django_migrations table yet: a fresh database
+        return migration_files()
+    return migration_files() - applied
+
 def handler(request):
     """Vercel function to run Django migrations"""
     try:
-        execute_from_command_line(['manage.py', 'migrate'])
+        # The default database, then each user shard (see banking/sharding.py)
+        pending = [database for database in [DEFAULT_DB_ALIAS] + settings.SHARDS if unapplied_migrations(database)]
+        if not pending:
+            return {
+                'statusCode': 200,
+                'body': 'No migrations to apply'
+            }
+
+        timings = []
+        for database in pending:
+            output = StringIO()
+            # post_migrate handlers print their own progress at this verbosity
+            with redirect_stdout(output):
+                call_command('migrate', database=database, interactive=False, verbosity=2, stdout=output)
+            timings += [f'{database} {name}: {seconds}s' for name, seconds in APPLIED_LINE.findall(output.getvalue())]
         return {
             'statusCode': 200,
-            'body': 'Migrations completed successfully'
+            'body': '\n'.join(['Migrations completed successfully'] + timings)
         }
     except Exception as e:
         return {
             'statusCode': 500,
             'body': f'Migration failed: {str(e)}'
-        } 
\ No newline at end of file
+        }
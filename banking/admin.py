@@ -1,7 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import BankAccount, Transaction, CreditCard
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+from .models import (
+    BankAccount, Transaction, CreditCard, TransactionArchive, OutboxEvent, CardAuthorization, SettlementBatch,
+    ExternalPayout, AuditEntry, Job,
+)
+from .search import matching_transaction_ids
 
 class BankAccountInline(admin.TabularInline):
     model = BankAccount
@@ -13,7 +19,7 @@ class CreditCardInline(admin.TabularInline):
     model = CreditCard
     extra = 0
     verbose_name_plural = 'Credit Cards'
-    fields = ('card_number', 'expiration_date', 'credit_limit', 'current_balance', 'available_credit', 'apr', 'status')
+    fields = ('card_number', 'expiration_date', 'credit_limit', 'current_balance', 'held_amount', 'available_credit', 'apr', 'status')
 
 class CustomUserAdmin(UserAdmin):
     inlines = (BankAccountInline, CreditCardInline)
@@ -53,7 +59,7 @@ class CreditCardAdmin(admin.ModelAdmin):
     list_display = ('card_number_masked', 'user', 'credit_limit', 'current_balance', 'available_credit', 'status', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('card_number', 'user__username', 'user__email')
-    readonly_fields = ('available_credit', 'created_at', 'updated_at')
+    readonly_fields = ('available_credit', 'held_amount', 'created_at', 'updated_at')
     
     def card_number_masked(self, obj):
         return f"**** **** **** {obj.card_number[-4:]}"
@@ -62,9 +68,16 @@ class CreditCardAdmin(admin.ModelAdmin):
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('get_account_info', 'transaction_type', 'amount', 'status', 'timestamp', 'description')
     list_filter = ('transaction_type', 'status', 'timestamp')
-    search_fields = ('account__account_number', 'credit_card__card_number', 'description')
+    # Descriptions are matched through the full-text index in get_search_results
+    search_fields = ('account__account_number',)
     readonly_fields = ('timestamp',)
     
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(id__in=matching_transaction_ids(search_term))
+        return results, may_have_duplicates
+    
     def get_account_info(self, obj):
         if obj.account:
             return f"{obj.account.account_type}: {obj.account.account_number}"
@@ -73,9 +86,90 @@ class TransactionAdmin(admin.ModelAdmin):
         return "-"
     get_account_info.short_description = 'Account'
 
+class TransactionArchiveAdmin(admin.ModelAdmin):
+    list_display = ('account', 'month', 'transaction_count', 'totals_by_type', 'archived_at')
+    list_filter = ('month',)
+    search_fields = ('account__account_number', 'account__user__username')
+    exclude = ('payload',)
+    readonly_fields = ('account', 'month', 'transaction_count', 'totals_by_type', 'archived_at')
+
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'status', 'attempts', 'available_at', 'created_at', 'delivered_at')
+    list_filter = ('status', 'topic')
+    readonly_fields = ('topic', 'payload', 'attempts', 'last_error', 'created_at', 'delivered_at')
+
+class CardAuthorizationAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'credit_card', 'merchant', 'amount', 'status', 'created_at', 'settled_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('reference', 'merchant')
+    readonly_fields = ('created_at', 'settled_at')
+
+class SettlementBatchAdmin(admin.ModelAdmin):
+    list_display = ('reference', 'payout_count', 'total_amount', 'settled_count', 'failed_count', 'exported_at', 'imported_at')
+    search_fields = ('reference',)
+    readonly_fields = ('exported_at', 'imported_at')
+
+class ExternalPayoutAdmin(admin.ModelAdmin):
+    list_display = ('id', 'account', 'recipient_account_number', 'amount', 'status', 'batch', 'created_at', 'settled_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('recipient_account_number', 'account__account_number', 'batch__reference')
+    raw_id_fields = ('transaction', 'account', 'batch')
+    readonly_fields = ('created_at', 'settled_at')
+
+class AuditEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'action', 'actor_id', 'created_at', 'entry_hash')
+    list_filter = ('action',)
+
+    # Append-only: entries are written by banking.audit and checked by verify_audit_log
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'priority', 'attempts', 'run_at', 'worker', 'duration')
+    list_filter = ('status', 'name')
+    readonly_fields = ('attempts', 'worker', 'last_error', 'created_at', 'started_at', 'finished_at')
+    actions = ['retry_jobs']
+
+    def duration(self, obj):
+        if obj.started_at and obj.finished_at:
+            return obj.finished_at - obj.started_at
+        return '-'
+
+    @admin.action(description='Run selected jobs again')
+    def retry_jobs(self, request, queryset):
+        retried = queryset.exclude(status='RUNNING').update(status='PENDING', attempts=0, run_at=timezone.now())
+        self.message_user(request, f'{retried} jobs queued again.')
+
+    def changelist_view(self, request, extra_context=None):
+        # Queue health per job name, shown above the list
+        ran_for = ExpressionWrapper(F('finished_at') - F('started_at'), output_field=DurationField())
+        metrics = Job.objects.values('name').annotate(
+            pending=Count('id', filter=Q(status='PENDING')),
+            running=Count('id', filter=Q(status='RUNNING')),
+            done=Count('id', filter=Q(status='DONE')),
+            failed=Count('id', filter=Q(status='FAILED')),
+            retried=Count('id', filter=Q(attempts__gt=1)),
+            average_duration=Avg(ran_for, filter=Q(status='DONE')),
+            oldest_due=Min('run_at', filter=Q(status='PENDING', run_at__lte=timezone.now())),
+        ).order_by('name')
+        return super().changelist_view(request, {'job_metrics': metrics, **(extra_context or {})})
+
 # Unregister the default UserAdmin and register our custom one
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(BankAccount, BankAccountAdmin)
 admin.site.register(CreditCard, CreditCardAdmin)
 admin.site.register(Transaction, TransactionAdmin)
+admin.site.register(TransactionArchive, TransactionArchiveAdmin)
+admin.site.register(OutboxEvent, OutboxEventAdmin)
+admin.site.register(CardAuthorization, CardAuthorizationAdmin)
+admin.site.register(SettlementBatch, SettlementBatchAdmin)
+admin.site.register(ExternalPayout, ExternalPayoutAdmin)
+admin.site.register(AuditEntry, AuditEntryAdmin)
+admin.site.register(Job, JobAdmin)
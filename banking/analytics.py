@@ -0,0 +1,92 @@
+from collections import defaultdict
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from .archive import archive_cutoff, archived_transactions
+from .models import BankAccount, Transaction
+import datetime
+
+INTERVALS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# The same periods for archived rows: the day, the Monday of its week, the first of its month
+PERIOD_START = {
+    'day': lambda day: day,
+    'week': lambda day: day - timedelta(days=day.weekday()),
+    'month': lambda day: day.replace(day=1),
+}
+
+CENTS = Decimal('0.01')
+
+# Cached summaries live for an hour at most; completed transactions bump the
+# user's generation so stale entries are never read again
+CACHE_TIMEOUT = 60 * 60
+
+def generation_key(user_id):
+    return f'analytics:generation:{user_id}'
+
+def invalidate_user_analytics(user_id):
+    """Make every cached summary for this user unreachable"""
+    try:
+        cache.incr(generation_key(user_id))
+    except ValueError:
+        cache.set(generation_key(user_id), 1, None)
+
+def spending_buckets(user, start, end, interval='week'):
+    """Completed transaction totals per period, account and type, aggregated in SQL"""
+    truncate = INTERVALS[interval]
+    # Datetime bounds rather than a date cast, so the (account, -timestamp) index applies
+    start_at = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min))
+    end_at = timezone.make_aware(datetime.datetime.combine(end + timedelta(days=1), datetime.time.min))
+    rows = (
+        Transaction.objects.filter(
+            account__user=user,
+            status='COMPLETED',
+            timestamp__gte=start_at,
+            timestamp__lt=end_at,
+        )
+        .annotate(period=truncate('timestamp'))
+        .values('period', 'account__account_number', 'transaction_type')
+        .annotate(total=Sum('amount'), count=Count('id'))
+    )
+    totals = defaultdict(lambda: [Decimal('0'), 0])
+    for row in rows:
+        bucket = totals[(row['period'].date(), row['account__account_number'], row['transaction_type'])]
+        bucket[0] += row['total']
+        bucket[1] += row['count']
+
+    # Closed months past the hot window live in TransactionArchive; sum those in Python
+    if start < archive_cutoff():
+        for txn in archived_transactions(BankAccount.objects.filter(user=user), start, end):
+            if txn.status != 'COMPLETED':
+                continue
+            period = PERIOD_START[interval](timezone.localtime(txn.timestamp).date())
+            bucket = totals[(period, txn.account.account_number, txn.transaction_type)]
+            bucket[0] += txn.amount
+            bucket[1] += 1
+
+    return [
+        {
+            'period': period.isoformat(),
+            'account': account_number,
+            'type': transaction_type,
+            'total': str(total.quantize(CENTS)),
+            'count': count,
+        }
+        for (period, account_number, transaction_type), (total, count) in sorted(totals.items())
+    ]
+
+def cached_spending_buckets(user, start, end, interval='week'):
+    generation = cache.get(generation_key(user.id), 0)
+    key = f'analytics:{user.id}:{generation}:{interval}:{start}:{end}'
+    buckets = cache.get(key)
+    if buckets is None:
+        buckets = spending_buckets(user, start, end, interval)
+        cache.set(key, buckets, CACHE_TIMEOUT)
+    return buckets
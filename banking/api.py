@@ -0,0 +1,215 @@
+from django.db.models import F
+from django.db.models.functions import Right
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from functools import wraps
+from decimal import Decimal, InvalidOperation
+from .balance_history import SERIES_DAYS, balance_series
+from .cards import AuthorizationDeclined, authorize
+from .conditional import conditional_account_page
+from .models import BankAccount, CreditCard, ScheduledPayment, Transaction
+from .sharding import locate_card, use_shard
+import base64
+import hmac
+import json
+
+API_VERSION = 'v1'
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 100
+
+# Public field name -> ORM lookup or expression, per resource. Sparse field
+# selection picks from these, and only the chosen columns are fetched.
+ACCOUNT_FIELDS = {
+    'id': F('id'),
+    'account_type': F('account_type'),
+    'account_number': F('account_number'),
+    'balance': F('balance'),
+    'held_amount': F('held_amount'),
+    'interest_rate': F('interest_rate'),
+    'is_primary': F('is_primary'),
+    'created_at': F('created_at'),
+    'updated_at': F('updated_at'),
+}
+
+CREDIT_CARD_FIELDS = {
+    'id': F('id'),
+    'last4': Right('card_number', 4),
+    'expiration_date': F('expiration_date'),
+    'credit_limit': F('credit_limit'),
+    'current_balance': F('current_balance'),
+    'available_credit': F('available_credit'),
+    'apr': F('apr'),
+    'status': F('status'),
+    'created_at': F('created_at'),
+}
+
+TRANSACTION_FIELDS = {
+    'id': F('id'),
+    'account_id': F('account_id'),
+    'account_number': F('account__account_number'),
+    'transaction_type': F('transaction_type'),
+    'amount': F('amount'),
+    'status': F('status'),
+    'description': F('description'),
+    'timestamp': F('timestamp'),
+}
+
+SCHEDULED_PAYMENT_FIELDS = {
+    'id': F('id'),
+    'credit_card_id': F('credit_card_id'),
+    'card_last4': Right('credit_card__card_number', 4),
+    'source_account_id': F('source_account_id'),
+    'amount': F('amount'),
+    'scheduled_date': F('scheduled_date'),
+    'schedule_id': F('schedule_id'),
+    'status': F('status'),
+    'created_at': F('created_at'),
+}
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+def api_view(view):
+    """JSON errors instead of login redirects and error pages"""
+    conditional_view = conditional_account_page(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_response({'error': 'Authentication required.'}, status=401)
+        if request.method != 'GET':
+            return api_response({'error': 'Method not allowed.'}, status=405)
+        try:
+            return conditional_view(request, *args, **kwargs)
+        except ApiError as e:
+            return api_response({'error': str(e)}, status=e.status)
+    return wrapper
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ApiError('Invalid cursor.')
+
+def selected_fields(request, available):
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(available)
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}.')
+    return fields
+
+def paginate(request, queryset, available):
+    """Keyset pagination on descending id, returning only the requested fields"""
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise ApiError('limit must be an integer.')
+    if limit < 1:
+        raise ApiError('limit must be positive.')
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        queryset = queryset.filter(id__lt=decode_cursor(cursor))
+
+    fields = selected_fields(request, available)
+    # The cursor needs the id even when the client did not ask for it
+    columns = {f'_{name}': available[name] for name in set(fields) | {'id'}}
+    rows = list(queryset.order_by('-id').values(**columns)[:limit + 1])
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return api_response({
+        'data': [{name: row[f'_{name}'] for name in fields} for row in rows],
+        'next_cursor': encode_cursor(rows[-1]['_id']) if has_more else None,
+    })
+
+@api_view
+def accounts(request):
+    return paginate(request, BankAccount.objects.filter(user=request.user), ACCOUNT_FIELDS)
+
+@api_view
+def balance_history(request, account_id):
+    """Daily closing balances as one array starting at 'start', ending with today's live balance"""
+    account = BankAccount.objects.filter(id=account_id, user=request.user).first()
+    if account is None:
+        raise ApiError('Account not found.', status=404)
+    try:
+        days = min(int(request.GET.get('days', SERIES_DAYS)), SERIES_DAYS)
+    except ValueError:
+        raise ApiError('days must be an integer.')
+    if days < 1:
+        raise ApiError('days must be positive.')
+    return api_response({'account_id': account.id, **balance_series(account, days)})
+
+@api_view
+def credit_cards(request):
+    return paginate(request, CreditCard.objects.filter(user=request.user), CREDIT_CARD_FIELDS)
+
+@api_view
+def transactions(request):
+    queryset = Transaction.objects.filter(account__user=request.user)
+    account_id = request.GET.get('account_id')
+    if account_id:
+        if not account_id.isdigit():
+            raise ApiError('account_id must be an integer.')
+        queryset = queryset.filter(account_id=account_id)
+    if request.GET.get('type'):
+        queryset = queryset.filter(transaction_type=request.GET['type'])
+    return paginate(request, queryset, TRANSACTION_FIELDS)
+
+@api_view
+def scheduled_payments(request):
+    return paginate(request, ScheduledPayment.objects.filter(user=request.user), SCHEDULED_PAYMENT_FIELDS)
+
+@csrf_exempt
+def card_authorizations(request, card_number):
+    """Card network entry point: place a hold, authenticated by a shared key rather than a session
+
+    There is no signed-in user to pick the shard, so the card number is looked up in the card directory.
+    """
+    key = settings.CARD_NETWORK_KEY
+    supplied = request.headers.get('X-Card-Network-Key', '')
+    if not key or not hmac.compare_digest(supplied, key):
+        return api_response({'error': 'Forbidden.'}, status=403)
+    if request.method != 'POST':
+        return api_response({'error': 'Method not allowed.'}, status=405)
+
+    try:
+        body = json.loads(request.body)
+        amount = Decimal(str(body['amount']))
+        merchant = str(body['merchant'])[:100]
+        reference = str(body['reference'])[:64]
+    except (ValueError, KeyError, TypeError, InvalidOperation):
+        return api_response({'error': 'Expected JSON with amount, merchant and reference.'}, status=400)
+
+    shard = locate_card(card_number)
+    if shard is None:
+        return api_response({'error': 'Card not found.'}, status=404)
+    with use_shard(shard):
+        card_id = CreditCard.objects.filter(card_number=card_number).values_list('id', flat=True).first()
+        if card_id is None:
+            return api_response({'error': 'Card not found.'}, status=404)
+        try:
+            authorization = authorize(card_id, amount, merchant, reference)
+        except AuthorizationDeclined as e:
+            return api_response({'status': 'DECLINED', 'reason': str(e)}, status=402)
+
+    return api_response({
+        'id': authorization.id,
+        'status': authorization.status,
+        'amount': authorization.amount,
+        'reference': authorization.reference,
+        'expires_at': authorization.expires_at,
+    }, status=201)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BankingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'banking'
+
+    def ready(self):
+        from . import jobs, shard_transfers, signals  # noqa: F401
@@ -0,0 +1,134 @@
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import timedelta
+from decimal import Decimal
+from .models import Transaction, TransactionArchive
+import datetime
+import json
+import zlib
+
+# Almost every read touches the last 90 days, so that much always stays hot
+HOT_DAYS = 90
+
+# A month with rows still waiting on a reviewer is not closed yet
+OPEN_STATUSES = ['PENDING']
+
+# Nor is one with an external payout the receiving bank has not settled or returned yet
+UNRESOLVED_PAYOUT_STATUSES = ['APPROVED', 'EXPORTED']
+
+def archive_cutoff(keep_days=HOT_DAYS):
+    """First day of the oldest month that has to stay in the hot table"""
+    return (timezone.now() - timedelta(days=keep_days)).date().replace(day=1)
+
+def month_bounds(month):
+    """Aware datetimes for the start of month and the start of the following month"""
+    next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    start = timezone.make_aware(datetime.datetime.combine(month, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(next_month, datetime.time.min))
+    return start, end
+
+def pack_transactions(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), 9)
+
+def unpack_transactions(archive):
+    """Rebuild an archive's rows as unsaved Transaction instances"""
+    rows = json.loads(zlib.decompress(bytes(archive.payload))) if archive.payload else []
+    return [
+        Transaction(
+            id=row['id'],
+            account=archive.account,
+            transaction_type=row['transaction_type'],
+            amount=Decimal(row['amount']),
+            timestamp=parse_datetime(row['timestamp']),
+            description=row['description'],
+            status=row['status'],
+        )
+        for row in rows
+    ]
+
+def signed_amount(row):
+    return Transaction(
+        transaction_type=row['transaction_type'], amount=Decimal(row['amount']), description=row['description']
+    ).signed_amount
+
+def closed_months(keep_days=HOT_DAYS):
+    """(account_id, month) pairs that are old enough and have nothing pending"""
+    start, _ = month_bounds(archive_cutoff(keep_days))
+    old_rows = Transaction.objects.filter(account__isnull=False, timestamp__lt=start).annotate(
+        month=TruncMonth('timestamp')
+    )
+    months = set(old_rows.values_list('account_id', 'month').distinct())
+    still_open = set(old_rows.filter(
+        Q(status__in=OPEN_STATUSES) | Q(external_payout__status__in=UNRESOLVED_PAYOUT_STATUSES)
+    ).values_list('account_id', 'month').distinct())
+    return sorted((account_id, month.date()) for account_id, month in months - still_open)
+
+@transaction.atomic
+def archive_month(account_id, month):
+    """Move one account's transactions for month into its TransactionArchive row"""
+    start, end = month_bounds(month)
+    hot_rows = Transaction.objects.filter(account_id=account_id, timestamp__gte=start, timestamp__lt=end)
+    rows = [
+        {
+            'id': row['id'],
+            'transaction_type': row['transaction_type'],
+            'amount': str(row['amount']),
+            'timestamp': row['timestamp'].isoformat(),
+            'description': row['description'],
+            'status': row['status'],
+        }
+        for row in hot_rows.order_by('timestamp').values(
+            'id', 'transaction_type', 'amount', 'timestamp', 'description', 'status'
+        )
+    ]
+    if not rows:
+        return 0
+
+    archive, created = TransactionArchive.objects.select_for_update().get_or_create(
+        account_id=account_id, month=month
+    )
+    # Backdated rows can land in a month that was already archived
+    if not created and archive.payload:
+        rows = json.loads(zlib.decompress(bytes(archive.payload))) + rows
+
+    totals = {}
+    net = Decimal('0')
+    for row in rows:
+        total = Decimal(totals.get(row['transaction_type'], '0')) + Decimal(row['amount'])
+        totals[row['transaction_type']] = str(total)
+        if row['status'] == 'COMPLETED':
+            net += signed_amount(row)
+
+    archive.payload = pack_transactions(rows)
+    archive.transaction_count = len(rows)
+    archive.totals_by_type = totals
+    archive.net_amount = net
+    archive.save()
+
+    archived = hot_rows.filter(id__in=[row['id'] for row in rows]).delete()[0]
+    return archived
+
+def archived_transactions(accounts, start_date, end_date=None, transaction_type=None):
+    """Archived transactions for accounts within a date range, newest first"""
+    start = parse_date(start_date) if isinstance(start_date, str) else start_date
+    end = parse_date(end_date) if isinstance(end_date, str) else end_date
+    if not start:
+        return []
+
+    archives = TransactionArchive.objects.filter(account__in=accounts, month__gte=start.replace(day=1))
+    if end:
+        archives = archives.filter(month__lte=end)
+
+    matches = []
+    for archive in archives.select_related('account'):
+        for txn in unpack_transactions(archive):
+            day = txn.timestamp.date()
+            if day < start or (end and day > end):
+                continue
+            if transaction_type and txn.transaction_type != transaction_type:
+                continue
+            matches.append(txn)
+    return sorted(matches, key=lambda txn: txn.timestamp, reverse=True)
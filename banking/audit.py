@@ -0,0 +1,148 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, OperationalError, close_old_connections, router, transaction
+from django.utils import timezone
+from .locking import money_movement
+from .models import AuditEntry
+from .sharding import current_shard, is_sharded
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# previous_hash of the first entry in the chain
+GENESIS = '0' * 64
+
+# The writer INSERTs up to BATCH_SIZE entries at once, waiting at most FLUSH_INTERVAL seconds to fill a batch
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+
+# Requests wait on a full queue rather than drop entries when the database falls behind
+QUEUE_SIZE = 10000
+
+# Tries per batch when another process extends the chain first or holds the write lock,
+# RETRY_DELAY seconds apart and growing
+MAX_ATTEMPTS = 10
+RETRY_DELAY = 0.05
+
+VERIFY_CHUNK = 2000
+
+def chain_hash(previous_hash, entry):
+    """sha256 over the previous entry's hash and this entry's canonical JSON"""
+    body = json.dumps({
+        'action': entry.action,
+        'actor_id': entry.actor_id,
+        'details': entry.details,
+        'created_at': entry.created_at.isoformat(),
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{previous_hash}{body}'.encode()).hexdigest()
+
+class AuditWriter:
+    """Background thread turning queued entries into batched INSERTs, chaining each batch onto the log's head"""
+
+    def __init__(self):
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.start_lock = threading.Lock()
+        self.thread = None
+
+    def put(self, entry):
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        self.queue.put(entry)
+
+    def start(self):
+        with self.start_lock:
+            # Also restarts the thread in a process forked after it started
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='audit-writer', daemon=True)
+                self.thread.start()
+
+    def take_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + FLUSH_INTERVAL
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            try:
+                write_entries(batch)
+            except Exception:
+                logger.exception('Dropped %d audit entries: %s', len(batch),
+                                 [(entry.action, entry.actor_id, entry.details) for entry in batch])
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def flush(self):
+        """Block until every queued entry has been written"""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.join()
+
+writer = AuditWriter()
+# Management commands exit right after their last change; write what they queued first
+atexit.register(writer.flush)
+
+def write_entries(entries):
+    """Append entries to the chain in one INSERT, retrying from the new head if another process got there first"""
+    using = router.db_for_write(AuditEntry)
+    close_old_connections()
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with money_movement(using=using):
+                previous = (
+                    AuditEntry.objects.using(using).order_by('-id').values_list('entry_hash', flat=True).first()
+                    or GENESIS
+                )
+                for entry in entries:
+                    entry.previous_hash = previous
+                    entry.entry_hash = previous = chain_hash(previous, entry)
+                AuditEntry.objects.using(using).bulk_create(entries)
+            return
+        except (IntegrityError, OperationalError):
+            # previous_hash is unique, so a concurrent append fails the whole batch; so does a busy SQLite lock
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(RETRY_DELAY * (attempt + 1))
+
+def audit_entry(action, actor, details):
+    if is_sharded():
+        details = {**details, 'shard': current_shard()}
+    # Stored exactly as it reads back from the JSON column, so the hash can be recomputed
+    details = json.loads(json.dumps(details, cls=DjangoJSONEncoder))
+    return AuditEntry(action=action, actor_id=actor, details=details, created_at=timezone.now())
+
+def record(action, actor=None, **details):
+    """Queue an audit entry for when the surrounding transaction commits; the request never waits on the INSERT"""
+    entry = audit_entry(action, actor, details)
+    transaction.on_commit(lambda: writer.put(entry))
+
+def record_many(action, details_list, actor=None):
+    """record() for bulk ledger changes, one entry per details dict"""
+    entries = [audit_entry(action, actor, details) for details in details_list]
+
+    def queue_entries():
+        for entry in entries:
+            writer.put(entry)
+    transaction.on_commit(queue_entries)
+
+def verify_chain(chunk_size=VERIFY_CHUNK):
+    """Stream the log in id order; yields (entry, problem) per entry, problem None when its link holds"""
+    previous = GENESIS
+    for entry in AuditEntry.objects.order_by('id').iterator(chunk_size=chunk_size):
+        if entry.previous_hash != previous:
+            yield entry, 'does not follow the entry before it (an entry was removed or reordered)'
+        elif chain_hash(entry.previous_hash, entry) != entry.entry_hash:
+            yield entry, 'contents no longer match its hash (the entry was edited)'
+        else:
+            yield entry, None
+        previous = entry.entry_hash
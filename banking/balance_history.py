@@ -0,0 +1,94 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from .archive import month_bounds
+from .models import AccountDailyBalance, BankAccount, Transaction, TransactionArchive, SIGNED_AMOUNT
+from .reconcile import account_ranges
+import datetime
+
+# Longest series the dashboard and the API serve: two years of days
+SERIES_DAYS = 730
+
+# Daily rows built in memory per account-id range; backfills get narrower ranges
+ROWS_PER_PASS = 100000
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+def backfill_floor():
+    """First day whose transactions are all still in the hot table, or None when nothing is archived"""
+    latest = TransactionArchive.objects.aggregate(month=Max('month'))['month']
+    return timezone.localdate(month_bounds(latest)[1]) if latest else None
+
+@transaction.atomic
+def close_range(start, end, first_day, last_day):
+    """Write closing balances for first_day..last_day for one account id range, working back from the live balance"""
+    nets = defaultdict(Decimal)
+    later = defaultdict(Decimal)
+    completed = Transaction.objects.filter(
+        status='COMPLETED', account_id__gte=start, account_id__lt=end, timestamp__gte=day_start(first_day)
+    )
+    for account_id, day, net in (
+        completed.annotate(day=TruncDate('timestamp')).values('account_id', 'day')
+        .annotate(net=Sum(SIGNED_AMOUNT)).values_list('account_id', 'day', 'net')
+    ):
+        if day > last_day:
+            later[account_id] += net
+        else:
+            nets[account_id, day] += net
+
+    rows = []
+    accounts = BankAccount.objects.filter(id__gte=start, id__lt=end)
+    for account_id, balance, created_at in accounts.values_list('id', 'balance', 'created_at'):
+        closing = balance - later[account_id]
+        day = last_day
+        # Newest first, each day's closing is the next day's minus that next day's movement
+        while day >= max(first_day, timezone.localdate(created_at)):
+            rows.append(AccountDailyBalance(account_id=account_id, day=day, closing_balance=closing))
+            closing -= nets[account_id, day]
+            day -= timedelta(days=1)
+
+    AccountDailyBalance.objects.filter(
+        account_id__gte=start, account_id__lt=end, day__gte=first_day, day__lte=last_day
+    ).delete()
+    AccountDailyBalance.objects.bulk_create(rows, batch_size=5000)
+    return len(rows)
+
+def close_days(first_day, last_day):
+    """Record every account's closing balance for each day in first_day..last_day; yields rows written per range"""
+    days = (last_day - first_day).days + 1
+    for start, end in account_ranges(max(1, ROWS_PER_PASS // days)):
+        yield close_range(start, end, first_day, last_day)
+
+def record_backdated(account_id, day, amount):
+    """A transaction completing after its day was closed moves that day's closing balance and every later one"""
+    AccountDailyBalance.objects.filter(account_id=account_id, day__gte=day).update(
+        closing_balance=F('closing_balance') + amount
+    )
+
+def balance_series(account, days=SERIES_DAYS):
+    """{'start': ISO date, 'balances': [closing balance per day..., live balance]} ending today"""
+    today = timezone.localdate()
+    rows = AccountDailyBalance.objects.filter(
+        account=account, day__gte=today - timedelta(days=days), day__lt=today
+    ).order_by('day').values_list('day', 'closing_balance')
+
+    start = None
+    balances = []
+    for day, closing in rows:
+        if start is None:
+            start = day
+        # A day the nightly close missed keeps the previous closing balance
+        while start + timedelta(days=len(balances)) < day:
+            balances.append(balances[-1])
+        balances.append(closing)
+    if start is None:
+        start = today
+    while balances and start + timedelta(days=len(balances)) < today:
+        balances.append(balances[-1])
+    balances.append(account.balance)
+    return {'start': start.isoformat(), 'balances': [str(balance) for balance in balances]}
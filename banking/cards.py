@@ -0,0 +1,104 @@
+from collections import defaultdict
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from .audit import record_many
+from .locking import money_movement
+from .models import CardAuthorization, CreditCard, per_row_amount
+
+# Holds nobody settles are released after this long
+HOLD_PERIOD = timedelta(days=7)
+
+SETTLE_BATCH = 1000
+
+class AuthorizationDeclined(Exception):
+    pass
+
+def authorize(card_id, amount, merchant, reference, hold_for=HOLD_PERIOD):
+    """Place a hold on a card; one conditional UPDATE and one INSERT, no row locks held"""
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise AuthorizationDeclined('Amount must be positive.')
+
+    try:
+        with money_movement():
+            placed = CreditCard.objects.filter(
+                id=card_id, status='ACTIVE', available_credit__gte=amount
+            ).update(
+                available_credit=F('available_credit') - amount,
+                held_amount=F('held_amount') + amount,
+                updated_at=timezone.now(),
+            )
+            if not placed:
+                # A retry of an earlier authorization may find the credit already held by it
+                original = CardAuthorization.objects.filter(reference=reference).first()
+                if original:
+                    return original
+                raise AuthorizationDeclined('Card is not active or has insufficient available credit.')
+            return CardAuthorization.objects.create(
+                credit_card_id=card_id,
+                amount=amount,
+                merchant=merchant,
+                reference=reference,
+                expires_at=timezone.now() + hold_for,
+            )
+    except IntegrityError:
+        # A retried reference: the hold above was rolled back, hand back the original
+        return CardAuthorization.objects.get(reference=reference)
+
+def claim_holds(holds, batch_size):
+    if connection.features.has_select_for_update_skip_locked:
+        holds = holds.select_for_update(skip_locked=True)
+    batch = list(holds.order_by('id').values_list('id', 'credit_card_id', 'amount')[:batch_size])
+    totals = defaultdict(Decimal)
+    for _, card_id, amount in batch:
+        totals[card_id] += amount
+    return [hold_id for hold_id, _, _ in batch], totals
+
+@transaction.atomic
+def settle_batch(before=None, batch_size=SETTLE_BATCH):
+    """Post one batch of held authorizations to card balances; returns how many were settled"""
+    holds = CardAuthorization.objects.filter(status='HELD')
+    if before is not None:
+        holds = holds.filter(created_at__lt=before)
+    hold_ids, totals = claim_holds(holds, batch_size)
+    if not hold_ids:
+        return 0
+
+    now = timezone.now()
+    # Settling moves money from held to posted; available credit is unchanged
+    CreditCard.objects.filter(id__in=totals).update(
+        current_balance=F('current_balance') + per_row_amount(totals),
+        held_amount=F('held_amount') - per_row_amount(totals),
+        updated_at=now,
+    )
+    CardAuthorization.objects.filter(id__in=hold_ids).update(status='SETTLED', settled_at=now)
+    record_many('card.settled', [{'credit_card_id': card_id, 'amount': total} for card_id, total in totals.items()])
+    return len(hold_ids)
+
+@transaction.atomic
+def release_expired(batch_size=SETTLE_BATCH):
+    """Give the credit of one batch of expired holds back to their cards"""
+    now = timezone.now()
+    hold_ids, totals = claim_holds(CardAuthorization.objects.filter(status='HELD', expires_at__lt=now), batch_size)
+    if not hold_ids:
+        return 0
+
+    CreditCard.objects.filter(id__in=totals).update(
+        available_credit=F('available_credit') + per_row_amount(totals),
+        held_amount=F('held_amount') - per_row_amount(totals),
+        updated_at=now,
+    )
+    CardAuthorization.objects.filter(id__in=hold_ids).update(status='RELEASED')
+    return len(hold_ids)
+
+def apply_payment(card_id, amount):
+    """Credit a payment to a card; touches only the balance columns, so holds placed meanwhile survive"""
+    amount = Decimal(str(amount))
+    CreditCard.objects.filter(id=card_id).update(
+        current_balance=F('current_balance') - amount,
+        available_credit=F('available_credit') + amount,
+        updated_at=timezone.now(),
+    )
@@ -0,0 +1,66 @@
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, OuterRef, Subquery
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .models import BankAccount, CreditCard, ScheduledPayment, Transaction, TransactionArchive
+import hashlib
+
+STATE_FIELDS = (
+    'accounts_updated', 'cards_updated', 'payments_updated', 'last_transaction', 'last_transaction_at', 'archived',
+    'pending',
+)
+
+# The timestamps among them, for Last-Modified
+MODIFIED_FIELDS = ('accounts_updated', 'cards_updated', 'payments_updated', 'last_transaction_at', 'archived')
+
+def latest(queryset, field):
+    return Subquery(queryset.order_by(f'-{field}').values(field)[:1])
+
+def account_state(request):
+    """Everything a user's pages are built from, summarised in one query and memoised per request"""
+    if not hasattr(request, '_account_state'):
+        user = request.user
+        state = None
+        if user.is_authenticated:
+            owned = {'user': OuterRef('pk')}
+            pending = (
+                Transaction.objects.filter(account__user=OuterRef('pk'), status='PENDING')
+                .values('account__user').annotate(count=Count('id')).values('count')
+            )
+            # 'default' is the user's shard when sharded, which keeps a copy of its users
+            state = User.objects.using(DEFAULT_DB_ALIAS).filter(pk=user.pk).annotate(
+                accounts_updated=latest(BankAccount.objects.filter(**owned), 'updated_at'),
+                cards_updated=latest(CreditCard.objects.filter(**owned), 'updated_at'),
+                payments_updated=latest(ScheduledPayment.objects.filter(**owned), 'updated_at'),
+                last_transaction=latest(Transaction.objects.filter(account__user=OuterRef('pk')), 'id'),
+                # New transactions, such as an incoming pending deposit, leave every updated_at alone
+                last_transaction_at=latest(Transaction.objects.filter(account__user=OuterRef('pk')), 'timestamp'),
+                # Archiving moves rows out of the hot table without touching the accounts
+                archived=latest(TransactionArchive.objects.filter(account__user=OuterRef('pk')), 'archived_at'),
+                pending=Subquery(pending),
+            ).values(*STATE_FIELDS).first()
+        request._account_state = state
+    return request._account_state
+
+def account_state_etag(request, *args, **kwargs):
+    state = account_state(request)
+    # Flash messages are shown once, so a page carrying one must be rendered
+    if state is None or len(messages.get_messages(request)):
+        return None
+    parts = [request.user.pk, request.session.session_key] + [state[key] for key in sorted(state)]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+def account_state_last_modified(request, *args, **kwargs):
+    if account_state_etag(request) is None:
+        return None
+    state = account_state(request)
+    stamps = [state[key] for key in MODIFIED_FIELDS if state[key]]
+    return max(stamps) if stamps else None
+
+def conditional_account_page(view):
+    """Answer repeat GETs with 304 Not Modified while the user's accounts are unchanged"""
+    view = condition(etag_func=account_state_etag, last_modified_func=account_state_last_modified)(view)
+    # Browsers must revalidate every time, and shared caches must never keep the page
+    return cache_control(private=True, no_cache=True)(view)
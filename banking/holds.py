@@ -0,0 +1,42 @@
+from django.db.models import F
+from django.utils import timezone
+from decimal import Decimal
+from .models import BankAccount
+
+def place_hold(account_id, amount):
+    """Reserve amount for a pending transfer; one conditional UPDATE, False if it is not available"""
+    amount = Decimal(str(amount))
+    return bool(BankAccount.objects.filter(id=account_id, balance__gte=F('held_amount') + amount).update(
+        held_amount=F('held_amount') + amount,
+        updated_at=timezone.now(),
+    ))
+
+def capture_hold(account_id, amount):
+    """Turn an approved transfer's reservation into the actual debit"""
+    BankAccount.objects.filter(id=account_id).update(
+        balance=F('balance') - amount,
+        held_amount=F('held_amount') - amount,
+        updated_at=timezone.now(),
+    )
+
+def release_hold(transaction_obj):
+    """Give back what a rejected pending transfer reserved; only the outgoing leg holds funds"""
+    if transaction_obj.transaction_type == 'WITHDRAWAL' and transaction_obj.account_id:
+        BankAccount.objects.filter(id=transaction_obj.account_id).update(
+            held_amount=F('held_amount') - transaction_obj.amount,
+            updated_at=timezone.now(),
+        )
+
+def debit(account_id, amount):
+    """Take amount out of what is available right away; one conditional UPDATE, False if it is not available"""
+    amount = Decimal(str(amount))
+    return bool(BankAccount.objects.filter(id=account_id, balance__gte=F('held_amount') + amount).update(
+        balance=F('balance') - amount,
+        updated_at=timezone.now(),
+    ))
+
+def credit(account_id, amount):
+    BankAccount.objects.filter(id=account_id).update(
+        balance=F('balance') + Decimal(str(amount)),
+        updated_at=timezone.now(),
+    )
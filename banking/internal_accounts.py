@@ -0,0 +1,104 @@
+from collections import deque
+from .models import AccountDirectory, BankAccount
+from .sharding import is_sharded, locate_account
+import hashlib
+import math
+import threading
+import time
+
+FALSE_POSITIVE_RATE = 0.01
+
+# Smallest filter built; rebuilt at twice the account count once it fills up
+MIN_CAPACITY = 10000
+
+# Accounts opened by other processes are picked up by an id range read at most this often (seconds)
+REFRESH_INTERVAL = 5
+
+# Ids can commit out of order, so each read goes back to the high-water mark of this many seconds ago
+COMMIT_MARGIN = 300
+
+# Full reload, which also drops numbers that were changed or deleted (seconds)
+REBUILD_INTERVAL = 3600
+
+class BloomFilter:
+    """Set membership in a bit array: never a false negative, about error_rate false positives up to capacity"""
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        # Double hashing: two 64-bit halves of one digest stand in for hash_count hash functions
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+class InternalAccountNumbers:
+    """Per-process filter of every account number this bank holds, topped up as accounts are opened"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+        self.loaded = 0
+        self.high_water = 0
+        self.refreshed_at = 0
+        self.built_at = 0
+        # (time, high_water) after each read, for the overlap of later reads
+        self.marks = deque()
+
+    def source(self):
+        # With shards only the directory lists every shard's accounts
+        return AccountDirectory.objects.all() if is_sharded() else BankAccount.objects.all()
+
+    def rescan_from(self, now):
+        """Id a read starts after: the high-water mark as it was COMMIT_MARGIN seconds ago, or at the last rebuild"""
+        while len(self.marks) > 1 and now - self.marks[1][0] >= COMMIT_MARGIN:
+            self.marks.popleft()
+        return self.marks[0][1]
+
+    def refresh(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.filter is None or self.loaded > self.filter.capacity or now - self.built_at > REBUILD_INTERVAL:
+                # Past capacity the false positive rate climbs, so start over with room to grow; the
+                # periodic rebuild also catches anything still uncommitted during the last one
+                self.filter = BloomFilter(max(MIN_CAPACITY, 2 * self.source().count()))
+                self.loaded = self.high_water = 0
+                # Reads within COMMIT_MARGIN of the rebuild go back to the start
+                self.marks = deque([(now, 0)])
+                self.built_at = now
+            # Rows below the high-water mark that committed late are read again; adding twice is harmless
+            new = self.source().filter(id__gt=self.rescan_from(now)).order_by('id').values_list('id', 'account_number')
+            for account_id, account_number in new.iterator(chunk_size=5000):
+                self.filter.add(account_number)
+                if account_id > self.high_water:
+                    self.loaded += 1
+                    self.high_water = account_id
+            self.marks.append((now, self.high_water))
+            self.refreshed_at = now
+
+    def might_exist(self, account_number):
+        """False only for numbers that are certainly not ours, without a query in most calls"""
+        if self.filter is None or time.monotonic() - self.refreshed_at > REFRESH_INTERVAL:
+            self.refresh()
+        return account_number in self.filter
+
+    def add(self, account_number):
+        # Before the first refresh there is nothing to add to; that refresh loads it
+        if self.filter is not None:
+            self.filter.add(account_number)
+
+internal_accounts = InternalAccountNumbers()
+
+def is_internal(account_number):
+    """Definite answer from the database: an account of this bank on this shard or, through the directory, another"""
+    return BankAccount.objects.filter(account_number=account_number).exists() or locate_account(account_number) is not None
@@ -0,0 +1,133 @@
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from .locking import money_movement
+from .models import Job
+from .outbox import retry_delay
+from .sharding import each_shard
+import django
+import logging
+import os
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+# name -> callable taking the job's kwargs
+JOBS = {}
+
+DEFAULT_PRIORITY = 100
+MAX_ATTEMPTS = 5
+
+# Jobs a worker runs on one shard before giving the next shard a turn
+SHARD_TURN = 20
+
+# A job RUNNING this long belongs to a worker that died; it goes back in the queue
+STALE_AFTER = timedelta(hours=6)
+
+def job(name):
+    """Register a function to run as the job called name (at least once, so keep it idempotent)"""
+    def register(func):
+        JOBS[name] = func
+        return func
+    return register
+
+def enqueue(name, priority=DEFAULT_PRIORITY, delay=None, max_attempts=MAX_ATTEMPTS, **kwargs):
+    """Queue a job; inside transaction.atomic workers only see it once that commits"""
+    if name not in JOBS:
+        raise ValueError(f'No job registered as {name}')
+    return Job.objects.create(name=name, kwargs=kwargs, priority=priority, max_attempts=max_attempts,
+                              run_at=timezone.now() + (delay or timedelta()))
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def claim(worker):
+    """Mark the most urgent due job RUNNING for worker and return it, or None"""
+    now = timezone.now()
+    with money_movement():
+        due = Job.objects.filter(status='PENDING', run_at__lte=now).order_by('priority', 'run_at', 'id')
+        # Concurrent workers each lock a different row and never wait on one another
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        job = due.first()
+        # Without SKIP LOCKED the status check keeps a second worker from taking the same job
+        if job is None or not Job.objects.filter(id=job.id, status='PENDING').update(
+            status='RUNNING', worker=worker, started_at=now, finished_at=None,
+        ):
+            return None
+    job.status, job.worker, job.started_at = 'RUNNING', worker, now
+    return job
+
+def run(job):
+    """Run a claimed job and record the outcome; returns True when it succeeded"""
+    try:
+        func = JOBS.get(job.name)
+        if func is None:
+            raise LookupError(f'No job registered as {job.name}')
+        func(**job.kwargs)
+    except Exception as e:
+        job.attempts += 1
+        job.last_error = f'{type(e).__name__}: {e}'
+        if job.attempts >= job.max_attempts:
+            job.status = 'FAILED'
+            logger.error('Job %s (%s) failed permanently: %s', job.id, job.name, job.last_error)
+        else:
+            job.status = 'PENDING'
+            job.run_at = timezone.now() + retry_delay(job.attempts)
+    else:
+        job.attempts += 1
+        job.status = 'DONE'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'attempts', 'last_error', 'run_at', 'finished_at'])
+    return job.status == 'DONE'
+
+def requeue_stale(stale_after=STALE_AFTER):
+    """Put jobs of workers that died mid-run back in the queue; returns how many"""
+    stale = Job.objects.filter(status='RUNNING', started_at__lt=timezone.now() - stale_after)
+    # A job that keeps killing its worker still runs out of attempts
+    stale.filter(attempts__gte=F('max_attempts') - 1).update(
+        status='FAILED', attempts=F('attempts') + 1, last_error='Worker stopped while running it',
+        finished_at=timezone.now(),
+    )
+    return stale.update(status='PENDING', attempts=F('attempts') + 1, last_error='Worker stopped while running it')
+
+def work(loop=False, interval=1.0):
+    """Run due jobs on every shard until none are left, or until interrupted with loop; returns (done, failed)"""
+    worker = worker_name()
+    done = failed = 0
+    try:
+        while True:
+            ran = 0
+            for _ in each_shard():
+                requeue_stale()
+                for _ in range(SHARD_TURN):
+                    job = claim(worker)
+                    if job is None:
+                        break
+                    ran += 1
+                    if run(job):
+                        done += 1
+                    else:
+                        failed += 1
+            if not ran:
+                if not loop:
+                    break
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return done, failed
+
+def worker_process(loop, interval):
+    # Forked workers must not share the parent's database connections;
+    # spawned ones start without Django configured at all
+    connections.close_all()
+    django.setup()
+    work(loop, interval)
+
+@job('manage')
+def run_command(command, args=()):
+    """Run a maintenance command (statements, reconciliation, schedules...) on the worker's shard"""
+    call_command(command, *args)
@@ -0,0 +1,17 @@
+from contextlib import contextmanager
+from django.db import transaction
+
+@contextmanager
+def money_movement(using=None):
+    """transaction.atomic() that takes the write lock when it begins on the SQLite profile (BEGIN IMMEDIATE)
+
+    Works as a decorator too. Other backends, and the stock SQLite backend, ignore the hint.
+    """
+    connection = transaction.get_connection(using)
+    connection.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            connection.begin_immediate = False
+            yield
+    finally:
+        connection.begin_immediate = False
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from banking.archive import HOT_DAYS, archive_month, closed_months
+
+class Command(BaseCommand):
+    help = 'Move closed months of transactions out of the hot table into compressed monthly archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=HOT_DAYS,
+                            help=f'Days of history to keep in the hot table (default {HOT_DAYS})')
+        parser.add_argument('--dry-run', action='store_true', help='List the months that would be archived')
+
+    def handle(self, *args, **options):
+        months = closed_months(options['keep_days'])
+        if options['dry_run']:
+            for account_id, month in months:
+                self.stdout.write(f'account {account_id}: {month:%Y-%m}')
+            self.stdout.write(f'{len(months)} account-months would be archived')
+            return
+
+        moved = 0
+        for account_id, month in months:
+            moved += archive_month(account_id, month)
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} transactions across {len(months)} account-months'))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from banking.locking import money_movement
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import random
+import tempfile
+import time
+
+ACCOUNTS = 100
+
+PROFILES = {
+    'stock': 'django.db.backends.sqlite3',
+    'high-concurrency': 'bankproject.sqlite',
+}
+
+SCHEMA = [
+    'CREATE TABLE account (id INTEGER PRIMARY KEY, balance INTEGER NOT NULL)',
+    'CREATE TABLE ledger (id INTEGER PRIMARY KEY, account_id INTEGER NOT NULL, amount INTEGER NOT NULL)',
+]
+
+def transfer(alias):
+    """A send_money-shaped write: read the sender, move the money, record both legs"""
+    sender, recipient = random.sample(range(1, ACCOUNTS + 1), 2)
+    amount = random.randint(1, 100)
+    with money_movement(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT balance FROM account WHERE id = %s', [sender])
+            cursor.fetchone()
+            cursor.execute('UPDATE account SET balance = balance - %s WHERE id = %s', [amount, sender])
+            cursor.execute('UPDATE account SET balance = balance + %s WHERE id = %s', [amount, recipient])
+            cursor.execute('INSERT INTO ledger (account_id, amount) VALUES (%s, %s), (%s, %s)',
+                           [sender, -amount, recipient, amount])
+
+def worker(alias, transfers):
+    completed = locked = 0
+    for _ in range(transfers):
+        try:
+            transfer(alias)
+            completed += 1
+        except OperationalError:
+            # "database is locked": what users see as a failed transfer
+            locked += 1
+    connections[alias].close()
+    return completed, locked
+
+class Command(BaseCommand):
+    help = 'Compare concurrent write throughput of the stock SQLite backend and the high-concurrency profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=200, help='Transfers per thread')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as scratch:
+            for name, engine in PROFILES.items():
+                alias = f'benchmark_{name}'
+                connections.settings[alias] = connections.configure_settings({
+                    'default': connections.settings['default'],
+                    alias: {'ENGINE': engine, 'NAME': str(Path(scratch) / f'{name}.sqlite3')},
+                })[alias]
+
+                with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                    for statement in SCHEMA:
+                        cursor.execute(statement)
+                    cursor.executemany('INSERT INTO account (id, balance) VALUES (%s, %s)',
+                                       [(account_id, 1000000) for account_id in range(1, ACCOUNTS + 1)])
+                connections[alias].close()
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                    results = list(pool.map(worker, [alias] * options['threads'],
+                                            [options['transfers']] * options['threads']))
+                elapsed = time.perf_counter() - started
+
+                completed = sum(done for done, _ in results)
+                locked = sum(failed for _, failed in results)
+                self.stdout.write(
+                    f'{name:>16}: {completed / elapsed:8.1f} transfers/s, '
+                    f'{completed} completed, {locked} failed with "database is locked" ({elapsed:.2f}s)'
+                )
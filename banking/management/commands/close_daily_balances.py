@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from banking.balance_history import SERIES_DAYS, backfill_floor, close_days
+import datetime
+
+class Command(BaseCommand):
+    help = 'End of day: record every account\'s closing balance for the balance-over-time series'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to close as YYYY-MM-DD (default: yesterday)')
+        parser.add_argument('--backfill-days', type=int, default=0,
+                            help=f'Also rebuild this many days before it (up to {SERIES_DAYS} for the full chart)')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            last_day = parse_date(options['date'])
+            if last_day is None:
+                raise CommandError('--date must look like YYYY-MM-DD')
+        else:
+            last_day = timezone.localdate() - datetime.timedelta(days=1)
+        if last_day >= timezone.localdate():
+            raise CommandError('Only finished days can be closed')
+
+        first_day = last_day - datetime.timedelta(days=options['backfill_days'])
+        # Archived months only keep monthly totals, so days inside them cannot be rebuilt
+        floor = backfill_floor()
+        if floor and first_day < floor:
+            if last_day < floor:
+                raise CommandError(f'Days before {floor} are archived and cannot be rebuilt')
+            self.stderr.write(f'Starting at {floor}: earlier days are archived')
+            first_day = floor
+
+        written = sum(close_days(first_day, last_day))
+        self.stdout.write(self.style.SUCCESS(f'Recorded {written} daily balances for {first_day} to {last_day}'))
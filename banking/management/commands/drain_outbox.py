@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from banking.outbox import BATCH_SIZE, deliver_batch
+from banking.sharding import each_shard
+import time
+
+class Command(BaseCommand):
+    help = 'Deliver pending outbox events in batches, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep draining until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty (with --loop)')
+
+    def handle(self, *args, **options):
+        total_delivered = total_failed = 0
+        try:
+            while True:
+                delivered = failed = 0
+                # Each shard keeps its own outbox
+                for _ in each_shard():
+                    shard_delivered, shard_failed = deliver_batch(options['batch_size'])
+                    delivered += shard_delivered
+                    failed += shard_failed
+                total_delivered += delivered
+                total_failed += failed
+                if delivered + failed == 0:
+                    if not options['loop']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Delivered {total_delivered} events, {total_failed} failed attempts'))
@@ -0,0 +1,23 @@
+from django.core.management import get_commands
+from django.core.management.base import BaseCommand, CommandError
+from banking.jobs import DEFAULT_PRIORITY, enqueue
+from banking.sharding import each_shard
+from datetime import timedelta
+import argparse
+
+class Command(BaseCommand):
+    help = 'Queue another management command as a background job for run_jobs, once per shard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--priority', type=int, default=DEFAULT_PRIORITY, help='Lower runs first')
+        parser.add_argument('--delay', type=int, default=0, help='Seconds before it may start')
+        parser.add_argument('command_name', help='Command to run, e.g. generate_statements')
+        parser.add_argument('command_args', nargs=argparse.REMAINDER, help='Arguments passed on to it')
+
+    def handle(self, *args, **options):
+        if options['command_name'] not in get_commands():
+            raise CommandError(f"Unknown command: {options['command_name']}")
+        for _ in each_shard():
+            job = enqueue('manage', priority=options['priority'], delay=timedelta(seconds=options['delay']),
+                          command=options['command_name'], args=options['command_args'])
+            self.stdout.write(f'Queued job {job.id}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from banking.schedules import EXPAND_BATCH, HORIZON_DAYS, expand_due
+
+class Command(BaseCommand):
+    help = 'Create the scheduled payments of every recurring payment falling due within the horizon'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=HORIZON_DAYS,
+                            help=f'Create occurrences due within this many days (default {HORIZON_DAYS})')
+        parser.add_argument('--batch-size', type=int, default=EXPAND_BATCH)
+
+    def handle(self, *args, **options):
+        until = timezone.localdate() + timedelta(days=options['days'])
+        created = expand_due(until, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Created {created} scheduled payments due by {until}'))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from banking.models import SettlementBatch
+from banking.settlement import export_batch, write_batch
+
+class Command(BaseCommand):
+    help = 'Export every approved external transfer not yet sent out as one settlement batch file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output-dir', default='settlements', help='Directory to write the batch file into')
+        parser.add_argument('--rewrite', metavar='REFERENCE',
+                            help='Write the file of an already exported batch again, e.g. after a failed write')
+
+    def handle(self, *args, **options):
+        if options['rewrite']:
+            try:
+                batch = SettlementBatch.objects.get(reference=options['rewrite'])
+            except SettlementBatch.DoesNotExist:
+                raise CommandError(f'No settlement batch {options["rewrite"]}')
+            try:
+                path = write_batch(batch, options['output_dir'])
+            except OSError as e:
+                raise CommandError(f'Cannot write batch {batch.reference}: {e}')
+            self.stdout.write(self.style.SUCCESS(f'Wrote batch {batch.reference} to {path}'))
+            return
+
+        try:
+            batch, path = export_batch(options['output_dir'])
+        except OSError as e:
+            # The batch committed before the write; its payouts are EXPORTED and wait for the file
+            raise CommandError(f'The batch was recorded but its file could not be written ({e}); '
+                               f'run again with --rewrite and the reference shown in the admin')
+        if batch is None:
+            self.stdout.write('No approved external transfers to settle')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {batch.payout_count} payouts totalling ${batch.total_amount:,.2f} to {path}'
+        ))
+
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from banking.archive import month_bounds
+from banking.models import BankAccount
+from banking.rollups import rebuild_month
+from banking.statements import render_statements
+import datetime
+
+class Command(BaseCommand):
+    help = 'Render HTML monthly statements for every account from the monthly rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Statement month as YYYY-MM (default: last month)')
+        parser.add_argument('--output-dir', default='statements', help='Directory to write statements into')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the month\'s rollups from transactions before rendering')
+
+    def handle(self, *args, **options):
+        if options['month']:
+            try:
+                month = datetime.datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--month must look like YYYY-MM')
+        else:
+            month = (timezone.now().date().replace(day=1) - datetime.timedelta(days=1)).replace(day=1)
+
+        if options['rebuild']:
+            start, end = month_bounds(month)
+            active = BankAccount.objects.filter(
+                transactions__timestamp__gte=start, transactions__timestamp__lt=end
+            ).values_list('id', flat=True).distinct()
+            for account_id in active:
+                rebuild_month(account_id, month)
+
+        rendered = render_statements(month, options['output_dir'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} statements for {month:%B %Y}'))
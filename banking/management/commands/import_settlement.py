@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from banking.settlement import SettlementError, apply_results, read_results
+
+class Command(BaseCommand):
+    help = 'Apply a settlement result file: mark payouts settled or failed and reverse failed ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='CSV with payout_id, status (SETTLED or FAILED) and reason columns')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file'], newline='', encoding='utf-8') as source:
+                settled, failed, unknown = apply_results(read_results(source))
+        except OSError as e:
+            raise CommandError(f'Cannot read {options["file"]}: {e}')
+        except SettlementError as e:
+            raise CommandError(str(e))
+
+        if unknown:
+            self.stderr.write(f'{len(unknown)} rows had an unrecognised status, e.g. payout {unknown[0]}')
+        self.stdout.write(self.style.SUCCESS(f'{settled} payouts settled, {failed} failed and reversed'))
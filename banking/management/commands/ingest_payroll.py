@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from decimal import Decimal
+import csv
+from banking.payroll import CHUNK_SIZE, file_digest, ingest, parse_csv, parse_nacha
+
+class Command(BaseCommand):
+    help = 'Post a payroll / direct-deposit batch file (CSV or NACHA fixed-width) as deposits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=['csv', 'nacha'],
+                            help='File format (default: csv for .csv files, nacha otherwise)')
+        parser.add_argument('--company', default='', help='Originator name for CSV files without a company column')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--rejects', help='Write entries that could not be posted to this CSV file')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'nacha')
+
+        try:
+            batch = file_digest(path)
+            source = open(path, newline='', encoding='utf-8')
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+        posted, total, rejects, skipped = 0, Decimal('0'), [], 0
+        with source:
+            entries = parse_csv(source, options['company']) if file_format == 'csv' else parse_nacha(source)
+            for count, amount, rejected, already_posted in ingest(entries, batch, options['chunk_size']):
+                posted += count
+                total += amount
+                rejects.extend(rejected)
+                skipped += already_posted
+                self.stdout.write(f'{posted} deposits posted...')
+
+        if options['rejects'] and rejects:
+            with open(options['rejects'], 'w', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow(['line', 'account_number', 'amount', 'name', 'company', 'error'])
+                writer.writerows(rejects)
+
+        for entry in rejects[:10]:
+            self.stderr.write(f'line {entry.line}: {entry.error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Posted {posted} deposits totalling ${total:,.2f}; {len(rejects)} entries rejected, '
+            f'{skipped} already posted by an earlier run'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from banking.sharding import each_shard
+import argparse
+
+class Command(BaseCommand):
+    help = 'Run another management command once per user shard, with that shard as the default database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('command_name', help='Command to run, e.g. reconcile_balances')
+        parser.add_argument('command_args', nargs=argparse.REMAINDER, help='Arguments passed on to it')
+
+    def handle(self, *args, **options):
+        for alias in each_shard():
+            self.stderr.write(f'{alias}:')
+            call_command(options['command_name'], *options['command_args'])
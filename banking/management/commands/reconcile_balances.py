@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from decimal import Decimal
+import csv
+import sys
+from banking.reconcile import DRIFT_COLUMNS, RANGE_SIZE, reconcile
+
+class Command(BaseCommand):
+    help = 'Compare every account balance with its completed transactions and report drift as CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='CSV file for drifted accounts (default: stdout)')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--range-size', type=int, default=RANGE_SIZE,
+                            help=f'Account ids per GROUP BY pass (default {RANGE_SIZE})')
+
+    def handle(self, *args, **options):
+        out = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        checked, drifted, total_drift = 0, 0, Decimal('0')
+        try:
+            writer = csv.writer(out)
+            writer.writerow(DRIFT_COLUMNS)
+            for count, rows in reconcile(options['workers'], options['range_size']):
+                checked += count
+                drifted += len(rows)
+                total_drift += sum(row[-1] for row in rows)
+                writer.writerows(rows)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        # The summary goes to stderr so stdout stays valid CSV
+        style = self.style.SUCCESS if not drifted else self.style.WARNING
+        self.stderr.write(f'Checked {checked} accounts: {drifted} drifted, net drift ${total_drift:,.2f}',
+                          style_func=style)
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from banking.jobs import work, worker_process
+import multiprocessing
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, most urgent first, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes claiming jobs in parallel')
+        parser.add_argument('--loop', action='store_true', help='Keep waiting for new jobs until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty (with --loop)')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes > 1 and not connection.features.has_select_for_update_skip_locked:
+            # SQLite has a single writer; more workers would only queue up behind its lock
+            self.stderr.write('This database cannot skip locked rows; running a single worker')
+            processes = 1
+
+        if processes == 1:
+            done, failed = work(options['loop'], options['interval'])
+            self.stdout.write(self.style.SUCCESS(f'Ran {done} jobs, {failed} failed attempts'))
+            return
+
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=worker_process, args=(options['loop'], options['interval']))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # The workers got the same interrupt and stop after their current job
+            for worker in workers:
+                worker.join()
+        self.stdout.write(self.style.SUCCESS(f'{processes} workers stopped'))
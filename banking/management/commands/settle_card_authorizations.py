@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from banking.cards import SETTLE_BATCH, release_expired, settle_batch
+
+class Command(BaseCommand):
+    help = 'Post held card authorizations to card balances in bulk and release expired holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=0,
+                            help='Only settle holds at least this many minutes old')
+        parser.add_argument('--batch-size', type=int, default=SETTLE_BATCH)
+
+    def handle(self, *args, **options):
+        # Expired holds are released first so they are never posted
+        released = 0
+        while True:
+            count = release_expired(options['batch_size'])
+            if not count:
+                break
+            released += count
+
+        before = timezone.now() - timedelta(minutes=options['older_than'])
+        settled = 0
+        while True:
+            count = settle_batch(before=before, batch_size=options['batch_size'])
+            if not count:
+                break
+            settled += count
+
+        self.stdout.write(self.style.SUCCESS(f'Settled {settled} authorizations, released {released} expired holds'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from banking.audit import VERIFY_CHUNK, verify_chain
+
+class Command(BaseCommand):
+    help = 'Walk the audit log hash chain and report any entry that was edited, removed or reordered'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=VERIFY_CHUNK, help='Entries read per query')
+        parser.add_argument('--max-problems', type=int, default=20, help='Stop after reporting this many')
+
+    def handle(self, *args, **options):
+        checked = problems = 0
+        head = None
+        for entry, problem in verify_chain(options['chunk_size']):
+            checked += 1
+            head = entry.entry_hash
+            if problem:
+                problems += 1
+                self.stderr.write(f'Entry {entry.id} ({entry.action}): {problem}')
+                if problems >= options['max_problems']:
+                    break
+
+        if problems:
+            raise CommandError(f'{problems} broken links in the first {checked} entries')
+        # Removing entries from the end leaves a valid chain; compare the head with one kept elsewhere
+        self.stdout.write(self.style.SUCCESS(f'Verified {checked} entries; head {head or "(empty log)"}'))
@@ -0,0 +1,62 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS banking_transaction_fts USING fts5(
+        description, content='banking_transaction', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS banking_transaction_fts_ai AFTER INSERT ON banking_transaction BEGIN
+        INSERT INTO banking_transaction_fts(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS banking_transaction_fts_ad AFTER DELETE ON banking_transaction BEGIN
+        INSERT INTO banking_transaction_fts(banking_transaction_fts, rowid, description) VALUES ('delete', old.id, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS banking_transaction_fts_au AFTER UPDATE OF description ON banking_transaction BEGIN
+        INSERT INTO banking_transaction_fts(banking_transaction_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO banking_transaction_fts(rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    "INSERT INTO banking_transaction_fts(banking_transaction_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS banking_transaction_fts_au',
+    'DROP TRIGGER IF EXISTS banking_transaction_fts_ad',
+    'DROP TRIGGER IF EXISTS banking_transaction_fts_ai',
+    'DROP TABLE IF EXISTS banking_transaction_fts',
+]
+
+POSTGRES_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS banking_transaction_description_fts ON banking_transaction USING GIN (to_tsvector('english', description))",
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS banking_transaction_description_fts',
+]
+
+def run_statements(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+def create_search_index(apps, schema_editor):
+    run_statements(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+
+def drop_search_index(apps, schema_editor):
+    run_statements(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0005_scheduledpayment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index, hints={'model_name': 'transaction'}),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0006_transaction_description_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the archived month')),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('totals_by_type', models.JSONField(default=dict, help_text='Total amount per transaction type')),
+                ('payload', models.BinaryField(help_text='zlib-compressed JSON of the archived transactions')),
+                ('archived_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-timestamp'], name='banking_txn_account_ts_idx'),
+        ),
+        migrations.AddField(
+            model_name='transactionarchive',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_archives', to='banking.bankaccount'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='transactionarchive',
+            unique_together={('account', 'month')},
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0007_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('opening_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('closing_balance', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('totals_by_type', models.JSONField(default=dict, help_text='Total amount per transaction type')),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_rollups', to='banking.bankaccount')),
+            ],
+            options={
+                'ordering': ['-month'],
+                'unique_together': {('account', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0008_accountmonthlyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status'], name='banking_txn_status_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:25
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0010_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditcard',
+            name='held_amount',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Authorized but not yet settled', max_digits=10),
+        ),
+        migrations.CreateModel(
+            name='CardAuthorization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('merchant', models.CharField(max_length=100)),
+                ('reference', models.CharField(help_text='Network reference; repeats return the original authorization', max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('HELD', 'Held'), ('SETTLED', 'Settled'), ('RELEASED', 'Released')], default='HELD', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField()),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('credit_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='authorizations', to='banking.creditcard')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='banking_auth_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:36
+
+from django.db import migrations, models
+from decimal import Decimal
+import json
+import zlib
+
+
+def backfill_net_amount(apps, schema_editor):
+    # Same rule as Transaction.signed_amount; model methods are not available here
+    TransactionArchive = apps.get_model('banking', 'TransactionArchive')
+    for archive in TransactionArchive.objects.using(schema_editor.connection.alias).iterator():
+        rows = json.loads(zlib.decompress(bytes(archive.payload))) if archive.payload else []
+        net = Decimal('0')
+        for row in rows:
+            if row['status'] != 'COMPLETED':
+                continue
+            amount = Decimal(row['amount'])
+            credit = row['transaction_type'] in ('DEPOSIT', 'INTEREST') or (
+                row['transaction_type'] == 'TRANSFER' and row['description'].startswith('Transfer from')
+            )
+            net += amount if credit else -amount
+        archive.net_amount = net
+        archive.save(update_fields=['net_amount'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0011_card_authorizations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactionarchive',
+            name='net_amount',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Net balance effect of the archived completed transactions', max_digits=12),
+        ),
+        migrations.RunPython(backfill_net_amount, migrations.RunPython.noop, hints={'model_name': 'transactionarchive'}),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0012_transactionarchive_net_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SettlementBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=32, unique=True)),
+                ('payout_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('settled_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('exported_at', models.DateTimeField(auto_now_add=True)),
+                ('imported_at', models.DateTimeField(blank=True, help_text='When the latest result file was applied', null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'settlement batches',
+                'ordering': ['-exported_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExternalPayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient_account_number', models.CharField(max_length=34)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('APPROVED', 'Approved'), ('EXPORTED', 'Exported'), ('SETTLED', 'Settled'), ('FAILED', 'Failed')], default='APPROVED', max_length=10)),
+                ('failure_reason', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_payouts', to='banking.bankaccount')),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payouts', to='banking.settlementbatch')),
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='external_payout', to='banking.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='banking_payout_status_idx')],
+            },
+        ),
+    ]
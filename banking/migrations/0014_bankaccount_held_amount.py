@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:39
+
+from django.db import migrations, models
+
+
+def hold_pending_withdrawals(apps, schema_editor):
+    # Transfers already waiting for review reserve their amount like new ones will
+    BankAccount = apps.get_model('banking', 'BankAccount')
+    Transaction = apps.get_model('banking', 'Transaction')
+    db_alias = schema_editor.connection.alias
+    pending = (
+        Transaction.objects.using(db_alias).filter(status='PENDING', transaction_type='WITHDRAWAL', account__isnull=False)
+        .values('account_id').annotate(total=models.Sum('amount')).values_list('account_id', 'total')
+    )
+    for account_id, total in pending:
+        BankAccount.objects.using(db_alias).filter(id=account_id).update(held_amount=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0013_settlement_batches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankaccount',
+            name='held_amount',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Reserved by pending outgoing transfers', max_digits=10),
+        ),
+        migrations.RunPython(hold_pending_withdrawals, migrations.RunPython.noop, hints={'model_name': 'bankaccount'}),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0014_bankaccount_held_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('closing_balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='banking.bankaccount')),
+            ],
+            options={
+                'ordering': ['-day'],
+                'unique_together': {('account', 'day')},
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('banking', '0015_accountdailybalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('frequency', models.CharField(choices=[('MONTHLY', 'Monthly'), ('BIWEEKLY', 'Every two weeks')], max_length=10)),
+                ('day_of_month', models.PositiveSmallIntegerField(blank=True, help_text='Monthly payment day; later than the month has means its last day', null=True)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('next_due', models.DateField(blank=True, help_text='Earliest occurrence not yet created; empty once finished', null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['next_due'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='scheduledpayment',
+            index=models.Index(fields=['user', 'scheduled_date'], name='banking_payment_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='scheduledpayment',
+            index=models.Index(fields=['status', 'scheduled_date'], name='banking_payment_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='paymentschedule',
+            name='credit_card',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='banking.creditcard'),
+        ),
+        migrations.AddField(
+            model_name='paymentschedule',
+            name='source_account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='banking.bankaccount'),
+        ),
+        migrations.AddField(
+            model_name='paymentschedule',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_schedules', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='scheduledpayment',
+            name='schedule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='occurrences', to='banking.paymentschedule'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scheduledpayment',
+            unique_together={('schedule', 'scheduled_date')},
+        ),
+        migrations.AddIndex(
+            model_name='paymentschedule',
+            index=models.Index(fields=['is_active', 'next_due'], name='banking_schedule_due_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0016_payment_schedules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_number', models.CharField(max_length=20, unique=True)),
+                ('shard', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'account directory',
+            },
+        ),
+        migrations.CreateModel(
+            name='InboundTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(help_text='Sending shard and its withdrawal id', max_length=64, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('COMPLETED', 'Completed'), ('CANCELLED', 'Cancelled')], default='PENDING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbound_transfers', to='banking.bankaccount')),
+                ('deposit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='inbound_transfer', to='banking.transaction')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0017_sharding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=50)),
+                ('actor_id', models.IntegerField(blank=True, help_text='Staff user behind an admin decision', null=True)),
+                ('details', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField()),
+                ('previous_hash', models.CharField(help_text='Unique, so two writers can never extend the chain from the same entry', max_length=64, unique=True)),
+                ('entry_hash', models.CharField(max_length=64, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'audit entries',
+                'ordering': ['id'],
+            },
+        ),
+    ]
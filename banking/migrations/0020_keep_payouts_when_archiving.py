@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0019_job_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='externalpayout',
+            name='transaction',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='external_payout', to='banking.transaction'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:17
+
+from django.db import migrations, models
+from importlib import import_module
+
+# SQLite adds and removes this column by rebuilding banking_transaction, which
+# drops the search triggers; put them back and reindex either way
+search_index = import_module('banking.migrations.0006_transaction_description_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0021_keep_inbound_transfers_when_archiving'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, search_index.create_search_index,
+                             hints={'model_name': 'transaction'}),
+        migrations.AddField(
+            model_name='transaction',
+            name='review_reasons',
+            field=models.JSONField(blank=True, default=list, help_text='Velocity limits the transfer went over, for reviewers'),
+        ),
+        migrations.RunPython(search_index.create_search_index, migrations.RunPython.noop,
+                             hints={'model_name': 'transaction'}),
+    ]
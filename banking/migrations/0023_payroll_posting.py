@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0022_transaction_review_reasons'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(help_text='Digest of the payroll file and the line number', max_length=80, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_postings', to='banking.bankaccount')),
+            ],
+        ),
+    ]
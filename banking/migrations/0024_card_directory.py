@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 07:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def register_cards(apps, schema_editor):
+    # Runs once per shard (the hint routes it with the cards): list the cards already there,
+    # on the directory that 'migrate' has already brought up to date
+    db_alias = schema_editor.connection.alias
+    if db_alias not in settings.SHARDS:
+        return
+    CreditCard = apps.get_model('banking', 'CreditCard')
+    CardDirectory = apps.get_model('banking', 'CardDirectory')
+    card_numbers = CreditCard.objects.using(db_alias).values_list('card_number', flat=True)
+    CardDirectory.objects.using('directory').bulk_create(
+        [CardDirectory(card_number=card_number, shard=db_alias) for card_number in card_numbers],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0023_payroll_posting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('card_number', models.CharField(max_length=16, unique=True)),
+                ('shard', models.CharField(max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'card directory',
+            },
+        ),
+        migrations.RunPython(register_cards, migrations.RunPython.noop, hints={'model_name': 'creditcard'}),
+    ]
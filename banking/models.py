@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 import random
 import string
 from decimal import Decimal
@@ -25,6 +26,8 @@ class BankAccount(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_primary = models.BooleanField(default=False, help_text='Designates whether this is the primary account for the user')
+    held_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0,
+                                      help_text='Reserved by pending outgoing transfers')
 
     class Meta:
         unique_together = ['user', 'account_type']
@@ -32,6 +35,10 @@ class BankAccount(models.Model):
     def __str__(self):
         return f"{self.user.username}'s {self.get_account_type_display()} ({self.account_number})"
 
+    @property
+    def available_balance(self):
+        return self.balance - self.held_amount
+
 class SavingsAccount(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     account_number = models.CharField(max_length=20, unique=True)
@@ -63,6 +70,7 @@ class CreditCard(models.Model):
     credit_limit = models.DecimalField(max_digits=10, decimal_places=2)
     current_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     available_credit = models.DecimalField(max_digits=10, decimal_places=2)
+    held_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text='Authorized but not yet settled')
     apr = models.DecimalField(max_digits=5, decimal_places=2, help_text='Annual Percentage Rate (%)')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -73,9 +81,29 @@ class CreditCard(models.Model):
     
     def save(self, *args, **kwargs):
         # Calculate available credit when saving
-        self.available_credit = self.credit_limit - self.current_balance
+        self.available_credit = self.credit_limit - self.current_balance - self.held_amount
         super().save(*args, **kwargs)
 
+# Transaction types that add to the balance. TRANSFER rows are written in pairs
+# and only the description tells the incoming leg from the outgoing one.
+CREDIT_TYPES = ('DEPOSIT', 'INTEREST')
+
+# SQL counterpart of Transaction.signed_amount, for use in aggregates
+SIGNED_AMOUNT = models.Case(
+    models.When(transaction_type__in=CREDIT_TYPES, then=models.F('amount')),
+    models.When(transaction_type='TRANSFER', description__startswith='Transfer from', then=models.F('amount')),
+    default=models.F('amount') * -1,
+    output_field=models.DecimalField(max_digits=12, decimal_places=2),
+)
+
+def per_row_amount(totals):
+    """CASE expression giving each row's share of a batch, keyed by id, for one UPDATE over all of them"""
+    return models.Case(
+        *[models.When(id=row_id, then=models.Value(total)) for row_id, total in totals.items()],
+        default=models.Value(Decimal('0')),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
         ('DEPOSIT', 'Deposit'),
@@ -98,11 +126,276 @@ class Transaction(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     description = models.CharField(max_length=200)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='COMPLETED')
+    review_reasons = models.JSONField(default=list, blank=True, help_text='Velocity limits the transfer went over, for reviewers')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', '-timestamp'], name='banking_txn_account_ts_idx'),
+            models.Index(fields=['status'], name='banking_txn_status_idx'),
+        ]
 
     def __str__(self):
         account = self.account or self.savings_account
         return f"{self.transaction_type} of {self.amount} on {self.timestamp} ({self.status})"
 
+    @property
+    def signed_amount(self):
+        """Amount as it moves the account balance: positive in, negative out"""
+        if self.transaction_type in CREDIT_TYPES:
+            return self.amount
+        if self.transaction_type == 'TRANSFER' and self.description.startswith('Transfer from'):
+            return self.amount
+        return -self.amount
+
+class TransactionArchive(models.Model):
+    """A closed month of one account's transactions, moved out of the hot Transaction table"""
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='transaction_archives')
+    month = models.DateField(help_text='First day of the archived month')
+    transaction_count = models.PositiveIntegerField(default=0)
+    totals_by_type = models.JSONField(default=dict, help_text='Total amount per transaction type')
+    net_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0,
+                                     help_text='Net balance effect of the archived completed transactions')
+    payload = models.BinaryField(help_text='zlib-compressed JSON of the archived transactions')
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['account', 'month']
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.account.account_number} archive for {self.month:%B %Y} ({self.transaction_count} transactions)"
+
+class AccountMonthlyRollup(models.Model):
+    """Running per-account, per-month totals of completed transactions, used for statements"""
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='monthly_rollups')
+    month = models.DateField(help_text='First day of the month')
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    closing_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    totals_by_type = models.JSONField(default=dict, help_text='Total amount per transaction type')
+    transaction_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['account', 'month']
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.account.account_number} rollup for {self.month:%B %Y}"
+
+class AccountDailyBalance(models.Model):
+    """One account's closing balance for one day, read back as the balance-over-time series"""
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='daily_balances')
+    day = models.DateField()
+    closing_balance = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        # Also the index a chart's date-range read walks
+        unique_together = ['account', 'day']
+        ordering = ['-day']
+
+    def __str__(self):
+        return f"{self.account.account_number} closing balance on {self.day}"
+
+class CardAuthorization(models.Model):
+    """A hold placed against a card's available credit, settled later in bulk"""
+    STATUS_CHOICES = [
+        ('HELD', 'Held'),
+        ('SETTLED', 'Settled'),
+        ('RELEASED', 'Released'),
+    ]
+
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.CASCADE, related_name='authorizations')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    merchant = models.CharField(max_length=100)
+    reference = models.CharField(max_length=64, unique=True, help_text='Network reference; repeats return the original authorization')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='HELD')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='banking_auth_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.merchant} hold of {self.amount} on card ending in {self.credit_card.card_number[-4:]} ({self.status})"
+
+class SettlementBatch(models.Model):
+    """One end-of-day file of approved external transfers sent out for payment"""
+    reference = models.CharField(max_length=32, unique=True)
+    payout_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    settled_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    exported_at = models.DateTimeField(auto_now_add=True)
+    imported_at = models.DateTimeField(null=True, blank=True, help_text='When the latest result file was applied')
+
+    class Meta:
+        ordering = ['-exported_at']
+        verbose_name_plural = 'settlement batches'
+
+    def __str__(self):
+        return f"Settlement batch {self.reference} ({self.payout_count} payouts)"
+
+class ExternalPayout(models.Model):
+    """An approved external transfer waiting for, or carried by, a settlement batch"""
+    STATUS_CHOICES = [
+        ('APPROVED', 'Approved'),
+        ('EXPORTED', 'Exported'),
+        ('SETTLED', 'Settled'),
+        ('FAILED', 'Failed'),
+    ]
+
+    # Archiving removes old transactions from the hot table; the payout record has to outlive them
+    transaction = models.OneToOneField(Transaction, on_delete=models.SET_NULL, null=True, blank=True,
+                                       related_name='external_payout')
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='external_payouts')
+    recipient_account_number = models.CharField(max_length=34)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='APPROVED')
+    batch = models.ForeignKey(SettlementBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name='payouts')
+    failure_reason = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='banking_payout_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Payout of {self.amount} to {self.recipient_account_number} ({self.status})"
+
+class OutboxEvent(models.Model):
+    """Side effect recorded in the same database transaction as the ledger change that caused it"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('DELIVERED', 'Delivered'),
+        ('FAILED', 'Failed'),
+    ]
+
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now, help_text='Not delivered before this time (retry backoff)')
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='banking_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.id} ({self.status})"
+
+class AccountDirectory(models.Model):
+    """Which shard each account number lives on; kept on the directory database, not on a shard"""
+    account_number = models.CharField(max_length=20, unique=True)
+    shard = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'account directory'
+
+    def __str__(self):
+        return f"{self.account_number} on {self.shard}"
+
+class CardDirectory(models.Model):
+    """Which shard each card number lives on, for the card network; kept on the directory database"""
+    card_number = models.CharField(max_length=16, unique=True)
+    shard = models.CharField(max_length=50)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'card directory'
+
+    def __str__(self):
+        return f"{self.card_number} on {self.shard}"
+
+class InboundTransfer(models.Model):
+    """A transfer from an account on another shard, applied here once per reference"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('COMPLETED', 'Completed'),
+        ('CANCELLED', 'Cancelled'),
+    ]
+
+    reference = models.CharField(max_length=64, unique=True, help_text='Sending shard and its withdrawal id')
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='inbound_transfers')
+    # Outlives its deposit when that is archived: redelivered events must still find the reference
+    deposit = models.OneToOneField(Transaction, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='inbound_transfer')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Inbound transfer {self.reference} ({self.status})"
+
+class PayrollPosting(models.Model):
+    """A payroll file entry that has been credited, so running the same file again skips it"""
+    reference = models.CharField(max_length=80, unique=True, help_text='Digest of the payroll file and the line number')
+    # Not tied to the deposit, which archiving may delete
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='payroll_postings')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Payroll posting {self.reference}"
+
+class AuditEntry(models.Model):
+    """Append-only record of a balance change or admin decision, chained to the entry before it by hash"""
+    action = models.CharField(max_length=50)
+    actor_id = models.IntegerField(null=True, blank=True, help_text='Staff user behind an admin decision')
+    details = models.JSONField(default=dict)
+    created_at = models.DateTimeField()
+    previous_hash = models.CharField(max_length=64, unique=True,
+                                     help_text='Unique, so two writers can never extend the chain from the same entry')
+    entry_hash = models.CharField(max_length=64, unique=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name_plural = 'audit entries'
+
+    def __str__(self):
+        return f"#{self.id} {self.action} at {self.created_at}"
+
+class PaymentSchedule(models.Model):
+    """A recurring card payment, expanded into ScheduledPayment occurrences as they come due"""
+    FREQUENCIES = [
+        ('MONTHLY', 'Monthly'),
+        ('BIWEEKLY', 'Every two weeks'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payment_schedules')
+    credit_card = models.ForeignKey(CreditCard, on_delete=models.CASCADE)
+    source_account = models.ForeignKey(BankAccount, on_delete=models.CASCADE)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES)
+    day_of_month = models.PositiveSmallIntegerField(null=True, blank=True,
+                                                    help_text='Monthly payment day; later than the month has means its last day')
+    start_date = models.DateField()
+    end_date = models.DateField(null=True, blank=True)
+    next_due = models.DateField(null=True, blank=True, help_text='Earliest occurrence not yet created; empty once finished')
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_due']
+        indexes = [
+            models.Index(fields=['is_active', 'next_due'], name='banking_schedule_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_frequency_display()} payment of ${self.amount} for card ending in {self.credit_card.card_number[-4:]}"
+
 class ScheduledPayment(models.Model):
     PAYMENT_STATUS = [
         ('PENDING', 'Pending'),
@@ -117,11 +410,50 @@ class ScheduledPayment(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     scheduled_date = models.DateField()
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default='PENDING')
+    schedule = models.ForeignKey(PaymentSchedule, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='occurrences')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-scheduled_date']
+        indexes = [
+            models.Index(fields=['user', 'scheduled_date'], name='banking_payment_user_date_idx'),
+            models.Index(fields=['status', 'scheduled_date'], name='banking_payment_due_idx'),
+        ]
+        # Expanding a schedule twice must not pay twice
+        unique_together = ['schedule', 'scheduled_date']
     
     def __str__(self):
         return f"Scheduled payment of ${self.amount} for card ending in {self.credit_card.card_number[-4:]} on {self.scheduled_date}"
+
+class Job(models.Model):
+    """Work queued for the run_jobs workers instead of running inside a request"""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100, help_text='Function registered with banking.jobs.job')
+    kwargs = models.JSONField(default=dict)
+    priority = models.SmallIntegerField(default=100, help_text='Lower runs first')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now, help_text='Not started before this time (delay or retry backoff)')
+    worker = models.CharField(max_length=100, blank=True, help_text='host:pid of the worker that ran it last')
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['priority', 'run_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_at'], name='banking_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
@@ -0,0 +1,82 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import timedelta
+from .models import OutboxEvent
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+
+# Backoff doubles per attempt from BASE_DELAY, capped at MAX_DELAY (seconds)
+BASE_DELAY = 5
+MAX_DELAY = 60 * 60
+
+# topic -> list of callables taking the event payload
+HANDLERS = {}
+
+def handler(topic):
+    """Register a function to run for every event of a topic (at least once, so keep it idempotent)"""
+    def register(func):
+        HANDLERS.setdefault(topic, []).append(func)
+        return func
+    return register
+
+def publish(topic, **payload):
+    """Record an event; call inside the transaction.atomic block that makes the change"""
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+def publish_many(topic, payloads):
+    """Record one event per payload in a single INSERT, for bulk ledger changes"""
+    return OutboxEvent.objects.bulk_create([OutboxEvent(topic=topic, payload=payload) for payload in payloads])
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(BASE_DELAY * 2 ** (attempts - 1), MAX_DELAY))
+
+def claim_batch(batch_size=BATCH_SIZE):
+    due = OutboxEvent.objects.filter(status='PENDING', available_at__lte=timezone.now()).order_by('id')
+    # Several workers can drain the same table when the database can skip locked rows
+    if connection.features.has_select_for_update_skip_locked:
+        due = due.select_for_update(skip_locked=True)
+    return list(due[:batch_size])
+
+def deliver(event):
+    for func in HANDLERS.get(event.topic, []):
+        func(event.payload)
+
+def deliver_batch(batch_size=BATCH_SIZE):
+    """Deliver one batch of due events; returns (delivered, failed)"""
+    delivered = failed = 0
+    with transaction.atomic():
+        events = claim_batch(batch_size)
+        now = timezone.now()
+        for event in events:
+            try:
+                with transaction.atomic():
+                    deliver(event)
+            except Exception as e:
+                event.attempts += 1
+                event.last_error = f'{type(e).__name__}: {e}'
+                if event.attempts >= MAX_ATTEMPTS:
+                    event.status = 'FAILED'
+                    logger.error('Outbox event %s (%s) failed permanently: %s', event.id, event.topic, event.last_error)
+                else:
+                    event.available_at = now + retry_delay(event.attempts)
+                failed += 1
+            else:
+                event.attempts += 1
+                event.status = 'DELIVERED'
+                event.delivered_at = now
+                delivered += 1
+        OutboxEvent.objects.bulk_update(events, ['status', 'attempts', 'last_error', 'available_at', 'delivered_at'])
+    return delivered, failed
+
+@handler('transfer.completed')
+@handler('transfer.rejected')
+@handler('card.payment')
+@handler('transfer.flagged')
+@handler('transfer.blocked')
+@handler('transfer.returned')
+def log_event(payload):
+    logger.info('Account event: %s', payload)
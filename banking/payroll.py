@@ -0,0 +1,150 @@
+from collections import defaultdict, namedtuple
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from decimal import Decimal, InvalidOperation
+from functools import partial
+from itertools import islice
+import csv
+import hashlib
+from .analytics import invalidate_user_analytics
+from .audit import record_many
+from .models import BankAccount, PayrollPosting, Transaction, per_row_amount
+from .rollups import month_of, rebuild_months
+
+# Entries resolved, inserted and credited per database round trip
+CHUNK_SIZE = 5000
+
+# NACHA entry detail transaction codes that credit the receiver (checking, savings)
+NACHA_CREDIT_CODES = ('22', '32')
+
+PayrollEntry = namedtuple('PayrollEntry', 'line account_number amount name company error')
+
+def parse_amount(value):
+    try:
+        amount = Decimal(value.strip().replace(',', ''))
+    except (InvalidOperation, AttributeError):
+        return None
+    return amount if amount > 0 else None
+
+def parse_csv(lines, company=''):
+    """Yield one entry per row of a CSV with account_number, amount and optional name/company columns"""
+    for line, row in enumerate(csv.DictReader(lines), start=2):
+        account_number = (row.get('account_number') or '').strip()
+        amount = parse_amount(row.get('amount'))
+        error = None
+        if not account_number:
+            error = 'missing account number'
+        elif amount is None:
+            error = f'invalid amount {row.get("amount")!r}'
+        yield PayrollEntry(line, account_number, amount, (row.get('name') or '').strip(),
+                           (row.get('company') or company).strip(), error)
+
+def parse_nacha(lines):
+    """Yield one entry per '6' entry detail record of a NACHA-style fixed-width file"""
+    company = ''
+    for line, record in enumerate(lines, start=1):
+        record = record.rstrip('\r\n')
+        if record.startswith('5'):
+            # Batch header: the originating company for the entries that follow
+            company = record[4:20].strip()
+        elif record.startswith('6'):
+            code = record[1:3]
+            account_number = record[12:29].strip()
+            cents = record[29:39]
+            error = None
+            if code not in NACHA_CREDIT_CODES:
+                error = f'unsupported transaction code {code}'
+            elif not account_number:
+                error = 'missing account number'
+            elif not cents.isdigit() or not int(cents):
+                error = f'invalid amount {cents!r}'
+            amount = Decimal(int(cents)) / 100 if error is None else None
+            yield PayrollEntry(line, account_number, amount, record[54:76].strip(), company, error)
+
+def chunked(entries, size):
+    entries = iter(entries)
+    while True:
+        chunk = list(islice(entries, size))
+        if not chunk:
+            return
+        yield chunk
+
+def file_digest(path):
+    """Names a payroll file by its content, so running it again is recognised whatever it is called"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(partial(source.read, 1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def posting_reference(batch, entry):
+    return f'{batch}:{entry.line}'
+
+def post_chunk(entries, batch):
+    """Credit one chunk of valid entries not yet posted from batch; returns (posted count, total, rejected entries, skipped count)"""
+    posted = set(PayrollPosting.objects.filter(
+        reference__in=[posting_reference(batch, entry) for entry in entries]
+    ).values_list('reference', flat=True))
+    skipped = len(entries)
+    entries = [entry for entry in entries if posting_reference(batch, entry) not in posted]
+    skipped -= len(entries)
+
+    numbers = {entry.account_number for entry in entries}
+    accounts = {
+        number: (account_id, user_id)
+        for number, account_id, user_id in BankAccount.objects.filter(account_number__in=numbers)
+        .values_list('account_number', 'id', 'user_id')
+    }
+
+    deposits = []
+    postings = []
+    totals = defaultdict(Decimal)
+    rejects = []
+    for entry in entries:
+        if entry.account_number not in accounts:
+            rejects.append(entry._replace(error='unknown account number'))
+            continue
+        account_id, _ = accounts[entry.account_number]
+        description = f'Direct deposit from {entry.company}' if entry.company else 'Direct deposit'
+        if entry.name:
+            description = f'{description}: {entry.name}'
+        deposits.append(Transaction(
+            account_id=account_id,
+            transaction_type='DEPOSIT',
+            amount=entry.amount,
+            description=description[:200],
+            status='COMPLETED',
+        ))
+        postings.append(PayrollPosting(reference=posting_reference(batch, entry), account_id=account_id, amount=entry.amount))
+        totals[account_id] += entry.amount
+
+    if not deposits:
+        return 0, Decimal('0'), rejects, skipped
+
+    with transaction.atomic():
+        # The unique reference makes a concurrent run of the same file fail here rather than credit twice
+        PayrollPosting.objects.bulk_create(postings)
+        Transaction.objects.bulk_create(deposits)
+        BankAccount.objects.filter(id__in=totals).update(
+            balance=F('balance') + per_row_amount(totals),
+            updated_at=timezone.now(),
+        )
+        # bulk_create skips post_save, so refresh the month's rollups here
+        rebuild_months(totals, month_of(timezone.now()))
+        record_many('balance.changed', [
+            {'transaction_id': deposit.id, 'account_id': deposit.account_id, 'type': 'DEPOSIT', 'amount': deposit.amount}
+            for deposit in deposits
+        ])
+
+    for user_id in {user_id for account_id, user_id in accounts.values() if account_id in totals}:
+        invalidate_user_analytics(user_id)
+    return len(deposits), sum(totals.values()), rejects, skipped
+
+def ingest(entries, batch, chunk_size=CHUNK_SIZE):
+    """Post a stream of payroll entries chunk by chunk; yields (posted, total, rejects, skipped) per chunk"""
+    # Entries already posted under batch (see file_digest) are skipped, so a run that stopped part way can be started again
+    for chunk in chunked(entries, chunk_size):
+        valid = [entry for entry in chunk if entry.error is None]
+        posted, total, rejects, skipped = post_chunk(valid, batch) if valid else (0, Decimal('0'), [], 0)
+        yield posted, total, [entry for entry in chunk if entry.error is not None] + rejects, skipped
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from functools import wraps
+import hashlib
+import math
+import time
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+# Entries kept in each process's fast-path table before expired ones are swept
+FAST_PATH_SIZE = 10000
+
+def client_ip(request):
+    # Clients can send any X-Forwarded-For they like; only the entries our own proxies
+    # appended, counted from the right, can be trusted
+    hops = settings.TRUSTED_PROXY_COUNT
+    forwarded = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entry.strip()]
+    if hops and len(forwarded) >= hops:
+        return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR', '')
+
+def login_username(request):
+    return request.POST.get('username', '').strip().lower()
+
+def ip_and_username(request):
+    username = login_username(request)
+    # Paired with the address so an attacker cannot lock a victim out from elsewhere
+    return f'{client_ip(request)}:{username}' if username else ''
+
+def session_cookie(request):
+    # Identifies the signed-in user without loading the session or the user
+    return request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+
+class FixedWindow:
+    """Request count per key and window, kept in the shared cache with a per-process shortcut for spent keys"""
+
+    def __init__(self, scope, rate):
+        count, period = rate.split('/')
+        self.scope = scope
+        self.capacity = int(count)
+        self.period = PERIODS[period]
+        self.blocked_until = {}
+
+    def cache_key(self, key, window):
+        return f'ratelimit:{self.scope}:{window}:{hashlib.sha1(key.encode()).hexdigest()}'
+
+    def consume(self, key):
+        """Count a request for key; returns 0 when allowed, else seconds until the window resets"""
+        now = time.time()
+        until = self.blocked_until.get(key)
+        if until is not None:
+            if until > now:
+                return until - now
+            del self.blocked_until[key]
+
+        window = int(now // self.period)
+        cache_key = self.cache_key(key, window)
+        # add() is a no-op when the window already has a count; incr() is atomic on shared caches,
+        # so concurrent requests cannot both read the same count and both get through
+        cache.add(cache_key, 0, self.period * 2)
+        try:
+            count = cache.incr(cache_key)
+        except ValueError:
+            # Evicted between the two calls
+            cache.set(cache_key, 1, self.period * 2)
+            count = 1
+        if count > self.capacity:
+            retry_after = (window + 1) * self.period - now
+            self.block(key, now + retry_after)
+            return retry_after
+        return 0
+
+    def block(self, key, until):
+        if len(self.blocked_until) >= FAST_PATH_SIZE:
+            now = time.time()
+            self.blocked_until = {k: v for k, v in self.blocked_until.items() if v > now}
+        self.blocked_until[key] = until
+
+def ratelimit(scope, rate, keys=(client_ip,), methods=('POST',)):
+    """Reject requests with 429 once any of the keyed counters is over its rate, before the view runs"""
+    counters = [(key_func, FixedWindow(f'{scope}:{key_func.__name__}', rate)) for key_func in keys]
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                for key_func, counter in counters:
+                    key = key_func(request)
+                    if not key:
+                        continue
+                    retry_after = counter.consume(key)
+                    if retry_after:
+                        response = HttpResponse('Too many requests. Please try again shortly.',
+                                                status=429, content_type='text/plain')
+                        response['Retry-After'] = str(math.ceil(retry_after))
+                        return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,52 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.db import connections
+from django.db.models import Max, Min, Sum
+from decimal import Decimal
+from .models import BankAccount, Transaction, TransactionArchive, SIGNED_AMOUNT
+from .statements import init_worker
+
+# Account ids per GROUP BY pass; each pass is one unit of work for the pool
+RANGE_SIZE = 50000
+
+DRIFT_COLUMNS = ['account_id', 'account_number', 'stored_balance', 'expected_balance', 'drift']
+
+def account_ranges(range_size=RANGE_SIZE):
+    """Half-open [start, end) account id ranges covering every account"""
+    bounds = BankAccount.objects.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    return [(start, start + range_size) for start in range(bounds['low'], bounds['high'] + 1, range_size)]
+
+def reconcile_range(start, end):
+    """Compare stored and transaction-derived balances for one id range; returns (accounts checked, drift rows)"""
+    in_range = {'account_id__gte': start, 'account_id__lt': end}
+    expected = dict(
+        Transaction.objects.filter(status='COMPLETED', **in_range).values('account_id')
+        .annotate(net=Sum(SIGNED_AMOUNT)).values_list('account_id', 'net')
+    )
+    # Archived months carry their own net so the payloads never need unpacking
+    for account_id, net in (
+        TransactionArchive.objects.filter(**in_range).values('account_id')
+        .annotate(net=Sum('net_amount')).values_list('account_id', 'net')
+    ):
+        expected[account_id] = expected.get(account_id, 0) + net
+
+    checked = 0
+    drifted = []
+    accounts = BankAccount.objects.filter(id__gte=start, id__lt=end).order_by('id')
+    for account_id, account_number, balance in accounts.values_list('id', 'account_number', 'balance'):
+        checked += 1
+        should_be = Decimal(expected.get(account_id, 0)).quantize(Decimal('0.01'))
+        if balance != should_be:
+            drifted.append([account_id, account_number, balance, should_be, balance - should_be])
+    return checked, drifted
+
+def reconcile(workers=None, range_size=RANGE_SIZE):
+    """Reconcile every account across a process pool; yields (accounts checked, drift rows) per finished range"""
+    ranges = account_ranges(range_size)
+
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(reconcile_range, start, end) for start, end in ranges]
+        for future in as_completed(futures):
+            yield future.result()
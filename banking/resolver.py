@@ -0,0 +1,59 @@
+from django.utils.functional import cached_property
+from .models import BankAccount, CreditCard
+
+class AccountResolver:
+    """The signed-in user's accounts and cards, each loaded by one query on first use and kept for the request"""
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def accounts(self):
+        if not self.user.is_authenticated:
+            return []
+        return list(BankAccount.objects.filter(user=self.user).order_by('id'))
+
+    @cached_property
+    def cards(self):
+        if not self.user.is_authenticated:
+            return []
+        return list(CreditCard.objects.filter(user=self.user).order_by('id'))
+
+    def of_type(self, account_type):
+        # A user has at most one account of each type
+        return next((account for account in self.accounts if account.account_type == account_type), None)
+
+    @property
+    def checking(self):
+        return self.of_type('CHECKING')
+
+    @property
+    def savings(self):
+        return self.of_type('SAVINGS')
+
+    @property
+    def primary(self):
+        return next((account for account in self.accounts if account.is_primary), None) or self.checking
+
+    def get_account(self, account_id):
+        """One of the user's accounts by id (as posted); raises BankAccount.DoesNotExist like .get()"""
+        for account in self.accounts:
+            if str(account.id) == str(account_id):
+                return account
+        raise BankAccount.DoesNotExist
+
+    def get_card(self, card_id):
+        for card in self.cards:
+            if str(card.id) == str(card_id):
+                return card
+        raise CreditCard.DoesNotExist
+
+class AccountResolverMiddleware:
+    """Attach request.accounts; nothing is queried until a view or template reads it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.accounts = AccountResolver(request.user)
+        return self.get_response(request)
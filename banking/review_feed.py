@@ -0,0 +1,120 @@
+from asgiref.sync import sync_to_async
+from collections import deque
+from django.db.models import Max
+from .models import Transaction
+import asyncio
+import json
+import time
+
+# How often the shared feed looks for changes, however many reviewers are connected
+POLL_INTERVAL = 2.0
+
+# Events a slow reviewer may fall behind by before older ones are dropped
+QUEUE_SIZE = 100
+
+# Django 4.2 does not notice a client going away mid-stream, so every stream ends
+# after this many seconds and EventSource reconnects on its own
+STREAM_LIFETIME = 300
+KEEPALIVE_INTERVAL = 15
+
+# Ids can commit out of order, so each poll goes back to the highest id seen this many seconds ago
+COMMIT_MARGIN = 300
+
+EVENT_FIELDS = (
+    'id', 'account__account_number', 'transaction_type', 'amount', 'description', 'status', 'timestamp', 'review_reasons',
+)
+
+def event_payload(row):
+    return {
+        'id': row['id'],
+        'account_number': row['account__account_number'],
+        'transaction_type': row['transaction_type'],
+        'amount': str(row['amount']),
+        'description': row['description'],
+        'status': row['status'],
+        'timestamp': row['timestamp'].isoformat(),
+        'review_reasons': row['review_reasons'],
+    }
+
+class ReviewFeed:
+    """One database poller per process, fanning PENDING changes out to every connected reviewer"""
+
+    def __init__(self, interval=POLL_INTERVAL):
+        self.interval = interval
+        self.subscribers = set()
+        self.task = None
+        self.last_id = None
+        self.pending_ids = set()
+        # (time, last_id) after each poll, and the ids read since the oldest of them, so a re-read is not announced twice
+        self.marks = deque()
+        self.seen_ids = set()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def run(self):
+        # Stops polling once the last reviewer disconnects
+        while self.subscribers:
+            for event in await sync_to_async(self.poll)():
+                self.publish(event)
+            await asyncio.sleep(self.interval)
+
+    def rescan_from(self, now):
+        """Id a poll reads after: last_id as it was COMMIT_MARGIN seconds ago, or when the feed started"""
+        while len(self.marks) > 1 and now - self.marks[1][0] >= COMMIT_MARGIN:
+            self.marks.popleft()
+        return self.marks[0][1]
+
+    def poll(self):
+        """New PENDING rows since the last poll, and pending rows that have since been decided"""
+        now = time.monotonic()
+        if self.last_id is None:
+            self.last_id = Transaction.objects.aggregate(last=Max('id'))['last'] or 0
+            self.pending_ids = set(Transaction.objects.filter(status='PENDING').values_list('id', flat=True))
+            self.marks.append((now, self.last_id))
+            return []
+
+        events = []
+        start = self.rescan_from(now)
+        # Ids at or below the start are never read again
+        self.seen_ids = {row_id for row_id in self.seen_ids if row_id > start}
+        # Rows below last_id that committed late turn up here; ones already read are skipped
+        for row in Transaction.objects.filter(id__gt=start).order_by('id').values(*EVENT_FIELDS):
+            if row['id'] in self.seen_ids:
+                continue
+            self.seen_ids.add(row['id'])
+            self.last_id = max(self.last_id, row['id'])
+            if row['status'] == 'PENDING':
+                self.pending_ids.add(row['id'])
+                events.append(('pending', event_payload(row)))
+
+        if self.pending_ids:
+            watched = Transaction.objects.filter(id__in=self.pending_ids).values(*EVENT_FIELDS)
+            still_pending = set()
+            for row in watched:
+                if row['status'] == 'PENDING':
+                    still_pending.add(row['id'])
+                else:
+                    events.append(('status', event_payload(row)))
+            # Deleted rows simply drop out of the watch list
+            self.pending_ids = still_pending
+        self.marks.append((now, self.last_id))
+        return events
+
+feed = ReviewFeed()
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
@@ -0,0 +1,96 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+from decimal import Decimal
+from .archive import month_bounds
+from .balance_history import record_backdated
+from .models import AccountMonthlyRollup, BankAccount, Transaction, SIGNED_AMOUNT
+
+CENTS = Decimal('0.01')
+
+def month_of(timestamp):
+    return timestamp.date().replace(day=1)
+
+@transaction.atomic
+def rebuild_months(account_ids, month):
+    """Recompute several accounts' rollups for month from completed transactions, in a fixed number of queries"""
+    account_ids = list(account_ids)
+    start, end = month_bounds(month)
+    completed = Transaction.objects.filter(account_id__in=account_ids, status='COMPLETED')
+
+    totals = defaultdict(dict)
+    counts = defaultdict(int)
+    nets = defaultdict(Decimal)
+    month_rows = completed.filter(timestamp__gte=start, timestamp__lt=end)
+    for row in month_rows.values('account_id', 'transaction_type').annotate(
+        total=Sum('amount'), count=Count('id'), net=Sum(SIGNED_AMOUNT)
+    ):
+        totals[row['account_id']][row['transaction_type']] = str(row['total'].quantize(CENTS))
+        counts[row['account_id']] += row['count']
+        nets[row['account_id']] += row['net']
+
+    # Net movement from the start of month until now, to work back from the live balance
+    since = nets
+    if end <= timezone.now():
+        since = dict(
+            completed.filter(timestamp__gte=start).values('account_id')
+            .annotate(net=Sum(SIGNED_AMOUNT)).values_list('account_id', 'net')
+        )
+    previous_closing = Subquery(
+        AccountMonthlyRollup.objects.filter(account=OuterRef('pk'), month__lt=month)
+        .order_by('-month').values('closing_balance')[:1]
+    )
+    accounts = BankAccount.objects.filter(id__in=account_ids).annotate(previous_closing=previous_closing)
+
+    rollups = []
+    for account_id, balance, previous in accounts.values_list('id', 'balance', 'previous_closing'):
+        # Chain from last month's rollup when there is one
+        opening = previous if previous is not None else balance - since.get(account_id, 0)
+        rollups.append(AccountMonthlyRollup(
+            account_id=account_id,
+            month=month,
+            opening_balance=opening,
+            closing_balance=opening + nets[account_id],
+            totals_by_type=totals[account_id],
+            transaction_count=counts[account_id],
+            updated_at=timezone.now(),
+        ))
+
+    # Replacing the rows is two statements however many accounts are rebuilt
+    AccountMonthlyRollup.objects.filter(account_id__in=account_ids, month=month).delete()
+    AccountMonthlyRollup.objects.bulk_create(rollups)
+    return rollups
+
+def rebuild_month(account_id, month):
+    """Recompute one account's rollup for month from that month's completed transactions"""
+    return rebuild_months([account_id], month)[0]
+
+@transaction.atomic
+def record_completed_transaction(transaction_id):
+    """Fold one newly completed transaction into its month's rollup and any closed days' balances"""
+    txn = Transaction.objects.filter(id=transaction_id, status='COMPLETED', account__isnull=False).first()
+    if txn is None:
+        return
+
+    # Days already closed before this transaction completed
+    record_backdated(txn.account_id, timezone.localdate(txn.timestamp), txn.signed_amount)
+
+    month = month_of(txn.timestamp)
+    rollup = AccountMonthlyRollup.objects.select_for_update().filter(account_id=txn.account_id, month=month).first()
+    if rollup is None:
+        # First activity this month: the rebuild already counts this transaction
+        rebuild_month(txn.account_id, month)
+    else:
+        totals = dict(rollup.totals_by_type)
+        totals[txn.transaction_type] = str(Decimal(totals.get(txn.transaction_type, '0')) + txn.amount)
+        rollup.totals_by_type = totals
+        rollup.transaction_count += 1
+        rollup.closing_balance += txn.signed_amount
+        rollup.save()
+
+    # A backdated transaction also moves every later month's balances
+    AccountMonthlyRollup.objects.filter(account_id=txn.account_id, month__gt=month).update(
+        opening_balance=F('opening_balance') + txn.signed_amount,
+        closing_balance=F('closing_balance') + txn.signed_amount,
+    )
@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+from .models import PaymentSchedule, ScheduledPayment
+import calendar
+import datetime
+
+# Occurrences are created this far ahead, so the next one always shows on the listing
+HORIZON_DAYS = 35
+
+# Schedules expanded per transaction by the nightly command
+EXPAND_BATCH = 500
+
+def day_in_month(year, month, day):
+    """day of the given month, or the month's last day when it is shorter"""
+    return datetime.date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+def following(schedule, due):
+    """The occurrence after due"""
+    if schedule.frequency == 'BIWEEKLY':
+        return due + timedelta(days=14)
+    year, month = (due.year + 1, 1) if due.month == 12 else (due.year, due.month + 1)
+    return day_in_month(year, month, schedule.day_of_month)
+
+def horizon():
+    return timezone.localdate() + timedelta(days=HORIZON_DAYS)
+
+@transaction.atomic
+def expand_schedules(schedules, until=None):
+    """Create the occurrences of schedules falling due by until; returns how many were created"""
+    until = until or horizon()
+    occurrences = []
+    expanded = []
+    for schedule in schedules.select_for_update().filter(is_active=True, next_due__lte=until):
+        while schedule.next_due is not None and schedule.next_due <= until:
+            occurrences.append(ScheduledPayment(
+                user_id=schedule.user_id,
+                credit_card_id=schedule.credit_card_id,
+                source_account_id=schedule.source_account_id,
+                amount=schedule.amount,
+                scheduled_date=schedule.next_due,
+                schedule=schedule,
+            ))
+            next_due = following(schedule, schedule.next_due)
+            schedule.next_due = next_due if schedule.end_date is None or next_due <= schedule.end_date else None
+        schedule.is_active = schedule.next_due is not None
+        expanded.append(schedule)
+
+    # A concurrent expansion may have created some already; the unique key skips them
+    ScheduledPayment.objects.bulk_create(occurrences, ignore_conflicts=True)
+    PaymentSchedule.objects.bulk_update(expanded, ['next_due', 'is_active'])
+    return len(occurrences)
+
+def expand_due(until=None, batch_size=EXPAND_BATCH):
+    """Expand every schedule falling due by until, a batch at a time; returns occurrences created"""
+    until = until or horizon()
+    created = 0
+    while True:
+        ids = list(
+            PaymentSchedule.objects.filter(is_active=True, next_due__lte=until)
+            .order_by('next_due').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return created
+        created += expand_schedules(PaymentSchedule.objects.filter(id__in=ids), until)
+
+def create_schedule(user, credit_card, source_account, amount, frequency, start_date, day_of_month=None, end_date=None):
+    """Save a recurring payment and create its occurrences up to the horizon"""
+    schedule = PaymentSchedule(
+        user=user, credit_card=credit_card, source_account=source_account, amount=amount,
+        frequency=frequency, start_date=start_date, end_date=end_date, next_due=start_date,
+    )
+    if frequency == 'MONTHLY':
+        # Monthly payments fall on the start date's day unless another day is chosen
+        schedule.day_of_month = day_of_month or start_date.day
+        first = day_in_month(start_date.year, start_date.month, schedule.day_of_month)
+        schedule.next_due = first if first >= start_date else following(schedule, first)
+    schedule.save()
+    expand_schedules(PaymentSchedule.objects.filter(id=schedule.id))
+    return schedule
+
+@transaction.atomic
+def stop_schedule(schedule):
+    """End a recurring payment and cancel its occurrences that have not been paid yet"""
+    PaymentSchedule.objects.filter(id=schedule.id).update(is_active=False, next_due=None, updated_at=timezone.now())
+    return schedule.occurrences.filter(status='PENDING').update(status='CANCELLED', updated_at=timezone.now())
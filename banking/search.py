@@ -0,0 +1,44 @@
+from django.db import connection
+import re
+
+# SQLite keeps an external-content FTS5 table in step with banking_transaction
+# through triggers; PostgreSQL uses a GIN expression index on the description.
+# Both are created in migration 0006.
+FTS_TABLE = 'banking_transaction_fts'
+SEARCH_CONFIG = 'english'
+
+def fts5_query(query):
+    """Turn free text into a safe FTS5 MATCH expression (every term, prefix matched)"""
+    terms = re.findall(r'\w+', query or '')
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_transactions(queryset, query):
+    """Restrict a Transaction queryset to descriptions matching query, best matches first"""
+    if connection.vendor == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return queryset.none()
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = banking_transaction.id', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+            select={'rank': f'-bm25({FTS_TABLE})'},
+        ).order_by('-rank', '-timestamp')
+
+    if connection.vendor == 'postgresql':
+        vector = f"to_tsvector('{SEARCH_CONFIG}', banking_transaction.description)"
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.extra(
+            where=[f'{vector} @@ {tsquery}'],
+            params=[query],
+            select={'rank': f'ts_rank({vector}, {tsquery})'},
+            select_params=[query],
+        ).order_by('-rank', '-timestamp')
+
+    # Other backends have no index to use, fall back to a plain scan
+    return queryset.filter(description__icontains=query).order_by('-timestamp')
+
+def matching_transaction_ids(query):
+    """Subquery of Transaction ids whose description matches query, for use with id__in"""
+    from .models import Transaction
+    return search_transactions(Transaction.objects.all(), query).values('id')
@@ -0,0 +1,151 @@
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from decimal import Decimal
+from functools import partial
+from pathlib import Path
+import csv
+import secrets
+from .analytics import invalidate_user_analytics
+from .audit import record_many
+from .models import BankAccount, ExternalPayout, SettlementBatch, Transaction, per_row_amount
+from .outbox import publish_many
+from .rollups import month_of, rebuild_months
+
+EXPORT_COLUMNS = ['payout_id', 'transaction_id', 'from_account', 'to_account', 'amount']
+
+# Result file statuses; anything else is reported back as unrecognised
+SETTLED, FAILED = 'SETTLED', 'FAILED'
+
+class SettlementError(Exception):
+    pass
+
+def batch_reference(now):
+    return f'{now:%Y%m%d}-{secrets.token_hex(4)}'
+
+def export_batch(output_dir):
+    """Put every approved, unexported external payout in one batch and write its settlement file; returns (batch, path)"""
+    with transaction.atomic():
+        batch = claim_batch()
+        if batch is None:
+            return None, None
+        # Only a committed batch gets a file, so a rollback cannot leave one behind listing payouts
+        # still APPROVED; if the write fails, write_batch can produce it again from the batch
+        path = batch_path(batch, output_dir)
+        transaction.on_commit(partial(write_batch, batch, output_dir))
+    return batch, path
+
+def claim_batch():
+    payouts = ExternalPayout.objects.filter(status='APPROVED')
+    if connection.features.has_select_for_update_skip_locked:
+        payouts = payouts.select_for_update(skip_locked=True, of=('self',))
+    rows = list(payouts.order_by('id').values_list('id', 'amount'))
+    if not rows:
+        return None
+
+    batch = SettlementBatch.objects.create(
+        reference=batch_reference(timezone.now()),
+        payout_count=len(rows),
+        total_amount=sum(amount for _, amount in rows),
+    )
+    ExternalPayout.objects.filter(id__in=[payout_id for payout_id, _ in rows]).update(status='EXPORTED', batch=batch)
+    return batch
+
+def batch_path(batch, output_dir):
+    return Path(output_dir) / f'settlement-{batch.reference}.csv'
+
+def write_batch(batch, output_dir):
+    """Write a batch's settlement file; it only appears under its final name once complete"""
+    rows = ExternalPayout.objects.filter(batch=batch).order_by('id').values_list(
+        'id', 'transaction_id', 'account__account_number', 'recipient_account_number', 'amount'
+    )
+    path = batch_path(batch, output_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = path.with_name(f'{path.name}.part')
+    with open(partial_path, 'w', newline='') as out:
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_COLUMNS)
+        writer.writerows(rows)
+    partial_path.replace(path)
+    return path
+
+def read_results(lines):
+    """Yield (payout id, status, reason) from a result file with payout_id, status and reason columns"""
+    for line, row in enumerate(csv.DictReader(lines), start=2):
+        try:
+            payout_id = int(row['payout_id'])
+        except (KeyError, TypeError, ValueError):
+            raise SettlementError(f'line {line}: missing or invalid payout_id')
+        yield payout_id, (row.get('status') or '').strip().upper(), (row.get('reason') or '').strip()
+
+@transaction.atomic
+def apply_results(results):
+    """Mark exported payouts settled or failed in bulk, crediting failed ones back to the sender"""
+    settled_ids, failures, unknown = [], {}, []
+    for payout_id, status, reason in results:
+        if status == SETTLED:
+            settled_ids.append(payout_id)
+        elif status == FAILED:
+            failures[payout_id] = reason or 'Returned by the receiving bank'
+        else:
+            unknown.append(payout_id)
+
+    now = timezone.now()
+    exported = ExternalPayout.objects.select_for_update().filter(status='EXPORTED')
+    # Re-importing a file is harmless: payouts already resolved are not EXPORTED any more
+    settled = exported.filter(id__in=settled_ids).update(status=SETTLED, settled_at=now)
+
+    failed = list(exported.filter(id__in=failures).values(
+        'id', 'transaction_id', 'account_id', 'account__user_id', 'recipient_account_number', 'amount'
+    ))
+    if failed:
+        totals = defaultdict(Decimal)
+        by_reason = defaultdict(list)
+        for payout in failed:
+            totals[payout['account_id']] += payout['amount']
+            by_reason[failures[payout['id']]].append(payout['id'])
+
+        BankAccount.objects.filter(id__in=totals).update(
+            balance=F('balance') + per_row_amount(totals),
+            updated_at=now,
+        )
+        reversals = Transaction.objects.bulk_create([
+            Transaction(
+                account_id=payout['account_id'],
+                transaction_type='DEPOSIT',
+                amount=payout['amount'],
+                description=f"Reversal of failed external transfer to {payout['recipient_account_number']}: "
+                            f"{failures[payout['id']]}"[:200],
+                status='COMPLETED',
+            )
+            for payout in failed
+        ])
+        for reason, payout_ids in by_reason.items():
+            ExternalPayout.objects.filter(id__in=payout_ids).update(status=FAILED, failure_reason=reason, settled_at=now)
+        publish_many('transfer.returned', [
+            {'payout_id': payout['id'], 'transaction_id': payout['transaction_id'],
+             'amount': str(payout['amount']), 'reason': failures[payout['id']]}
+            for payout in failed
+        ])
+
+        # bulk_create skips post_save, so refresh rollups and analytics here
+        rebuild_months(totals, month_of(now))
+        record_many('balance.changed', [
+            {'transaction_id': reversal.id, 'account_id': reversal.account_id, 'type': 'DEPOSIT', 'amount': reversal.amount}
+            for reversal in reversals
+        ])
+        for user_id in {payout['account__user_id'] for payout in failed}:
+            transaction.on_commit(partial(invalidate_user_analytics, user_id))
+
+    batch_ids = set(
+        ExternalPayout.objects.filter(id__in=settled_ids + list(failures)).values_list('batch_id', flat=True)
+    ) - {None}
+    for batch in SettlementBatch.objects.filter(id__in=batch_ids).annotate(
+        settled=Count('payouts', filter=Q(payouts__status=SETTLED)),
+        returned=Count('payouts', filter=Q(payouts__status=FAILED)),
+    ):
+        SettlementBatch.objects.filter(id=batch.id).update(
+            settled_count=batch.settled, failed_count=batch.returned, imported_at=now
+        )
+    return settled, len(failed), unknown
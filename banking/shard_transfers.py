@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from decimal import Decimal
+from .models import BankAccount, InboundTransfer, Transaction
+from .outbox import handler, publish
+from . import holds
+from .sharding import current_shard, remote_shard, use_shard
+import re
+
+# A send_money withdrawal whose recipient is an account of this bank
+INTERNAL_TRANSFER = re.compile(r'Pending internal transfer from (\d+) to (\d+):')
+
+# Sending shard -> recipient shard, each step delivered through the sending shard's
+# outbox in the same transaction as the ledger change that caused it:
+#   send_money         -> shard_transfer.opened     pending deposit on the recipient shard
+#   approve withdrawal -> shard_transfer.settled    deposit completed, recipient credited
+#   reject withdrawal  -> shard_transfer.cancelled  deposit cancelled
+# and back, through the recipient shard's outbox:
+#   reject deposit     -> shard_transfer.declined   withdrawal cancelled, or reversed if already approved
+
+def transfer_reference(withdrawal):
+    return f'{current_shard()}-{withdrawal.id}'
+
+def open_outbound(withdrawal, shard, recipient_account_number, description):
+    """Ask the recipient's shard for the pending deposit of a transfer leaving this shard"""
+    publish('shard_transfer.opened', reference=transfer_reference(withdrawal), shard=shard,
+            from_account=withdrawal.account.account_number, to_account=recipient_account_number,
+            amount=str(withdrawal.amount), description=description)
+
+def outbound_shard(withdrawal):
+    """Recipient shard of a pending cross-shard withdrawal, or None for any other transaction"""
+    match = INTERNAL_TRANSFER.match(withdrawal.description)
+    if withdrawal.transaction_type != 'WITHDRAWAL' or not match:
+        return None
+    return remote_shard(match.group(2))
+
+def settle_outbound(withdrawal, shard):
+    publish('shard_transfer.settled', reference=transfer_reference(withdrawal), shard=shard)
+
+def cancel_outbound(withdrawal, shard):
+    publish('shard_transfer.cancelled', reference=transfer_reference(withdrawal), shard=shard)
+
+@handler('shard_transfer.opened')
+def open_inbound(payload):
+    with use_shard(payload['shard']), transaction.atomic():
+        if InboundTransfer.objects.filter(reference=payload['reference']).exists():
+            return
+        account = BankAccount.objects.get(account_number=payload['to_account'])
+        deposit = Transaction.objects.create(
+            account=account,
+            transaction_type='DEPOSIT',
+            amount=Decimal(payload['amount']),
+            status='PENDING',
+            description=f"Pending internal transfer to {account.account_number} from {payload['from_account']}: "
+                        f"{payload['description']}"[:200],
+        )
+        InboundTransfer.objects.create(reference=payload['reference'], account=account, deposit=deposit,
+                                       amount=deposit.amount)
+
+def close_inbound(payload, status):
+    with use_shard(payload['shard']), transaction.atomic():
+        # Raising leaves the event to be retried once the opening event has been applied
+        # deposit is nullable (archived deposits leave the row behind), so only this side can be locked
+        inbound = InboundTransfer.objects.select_for_update(of=('self',)).select_related('deposit').get(
+            reference=payload['reference']
+        )
+        if inbound.status != 'PENDING':
+            return
+        if status == 'COMPLETED':
+            BankAccount.objects.filter(id=inbound.account_id).update(
+                balance=F('balance') + inbound.amount, updated_at=timezone.now(),
+            )
+        inbound.deposit.status = status
+        inbound.deposit.save()
+        inbound.status = status
+        inbound.save(update_fields=['status', 'updated_at'])
+
+def decline_inbound(deposit):
+    """Cancel the transfer behind a pending deposit rejected on this shard; the sending shard undoes its side"""
+    inbound = InboundTransfer.objects.select_for_update().filter(deposit=deposit, status='PENDING').first()
+    if inbound is None:
+        return
+    inbound.status = 'CANCELLED'
+    inbound.save(update_fields=['status', 'updated_at'])
+    shard, withdrawal_id = inbound.reference.rsplit('-', 1)
+    publish('shard_transfer.declined', reference=inbound.reference, shard=shard, withdrawal_id=int(withdrawal_id))
+
+@handler('shard_transfer.settled')
+def settle_inbound(payload):
+    close_inbound(payload, 'COMPLETED')
+
+@handler('shard_transfer.cancelled')
+def cancel_inbound(payload):
+    close_inbound(payload, 'CANCELLED')
+
+@handler('shard_transfer.declined')
+def decline_outbound(payload):
+    with use_shard(payload['shard']), transaction.atomic():
+        withdrawal = Transaction.objects.select_for_update().get(id=payload['withdrawal_id'])
+        if withdrawal.status == 'PENDING':
+            withdrawal.status = 'CANCELLED'
+            withdrawal.save()
+            holds.release_hold(withdrawal)
+            return
+        description = f"Reversal of internal transfer {payload['reference']}: declined by the recipient's bank"
+        if withdrawal.status != 'COMPLETED' or Transaction.objects.filter(description=description).exists():
+            return
+        # Approved here before the decline arrived; its settle event finds the deposit cancelled, so refund it
+        holds.credit(withdrawal.account_id, withdrawal.amount)
+        Transaction.objects.create(account_id=withdrawal.account_id, transaction_type='DEPOSIT',
+                                   amount=withdrawal.amount, status='COMPLETED', description=description)
@@ -0,0 +1,136 @@
+from bisect import bisect
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+import hashlib
+
+# Database that keeps users, sessions and the account directory while shards are
+# swapped in as 'default' (only configured when SHARDS is not empty)
+DIRECTORY = 'directory'
+
+# Points per shard on the hash ring; more points even out the share of users
+VIRTUAL_NODES = 64
+
+# Everything in the banking app is per user except the directories and the audit chain
+UNSHARDED_MODELS = {'accountdirectory', 'carddirectory', 'auditentry'}
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+class HashRing:
+    """Consistent hashing: adding a shard moves only about 1/N of the users"""
+
+    def __init__(self, shards, virtual_nodes=VIRTUAL_NODES):
+        points = sorted((ring_hash(f'{shard}#{n}'), shard) for shard in shards for n in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard_for(self, key):
+        return self.shards[bisect(self.hashes, ring_hash(str(key))) % len(self.shards)]
+
+_ring = None
+
+def is_sharded():
+    return bool(settings.SHARDS)
+
+def shard_for_user(user_id):
+    """Shard holding every banking row of a user"""
+    global _ring
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    if _ring is None:
+        _ring = HashRing(settings.SHARDS)
+    return _ring.shard_for(user_id)
+
+def current_shard():
+    """Alias of the shard currently swapped in as 'default' (DEFAULT_DB_ALIAS when unsharded)"""
+    return connections[DEFAULT_DB_ALIAS].alias
+
+@contextmanager
+def use_shard(alias):
+    """Make alias the default connection, so unrouted queries, atomic() and on_commit() all go to it"""
+    previous = connections[DEFAULT_DB_ALIAS]
+    if alias == previous.alias:
+        yield
+        return
+    connections[DEFAULT_DB_ALIAS] = connections[alias]
+    try:
+        yield
+    finally:
+        connections[DEFAULT_DB_ALIAS] = previous
+
+def shard_aliases():
+    return list(settings.SHARDS) or [DEFAULT_DB_ALIAS]
+
+def each_shard():
+    """Yield each shard alias with that shard as the default connection"""
+    for alias in shard_aliases():
+        with use_shard(alias):
+            yield alias
+
+def locate_account(account_number):
+    """Shard an account number lives on, from the directory; None when unsharded or unknown"""
+    if not is_sharded():
+        return None
+    from .models import AccountDirectory
+    return AccountDirectory.objects.filter(account_number=account_number).values_list('shard', flat=True).first()
+
+def locate_card(card_number):
+    """Shard a card number lives on: DEFAULT_DB_ALIAS when unsharded, None when unknown"""
+    if not is_sharded():
+        return DEFAULT_DB_ALIAS
+    from .models import CardDirectory
+    return CardDirectory.objects.filter(card_number=card_number).values_list('shard', flat=True).first()
+
+def remote_shard(account_number):
+    """The other shard an account number lives on, or None when it is local, external or unsharded"""
+    shard = locate_account(account_number)
+    return shard if shard and shard != current_shard() else None
+
+class ShardRouter:
+    """Users, sessions, the directory and the audit log go to DIRECTORY; banking rows follow the swapped-in default"""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'banking' and model._meta.model_name not in UNSHARDED_MODELS:
+            # Named outright: left to Django, rows built with user=request.user would follow the
+            # user's instance hint to DIRECTORY, and so would related managers like user.bank_accounts
+            return DEFAULT_DB_ALIAS
+        return DIRECTORY
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Shards carry a copy of their users, so user foreign keys resolve locally
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DIRECTORY:
+            # Same database as 'default', which migrates it
+            return False
+        banking = app_label == 'banking' and model_name not in UNSHARDED_MODELS
+        if db == DEFAULT_DB_ALIAS:
+            return not banking
+        # Shards need the user tables their foreign keys point at
+        return banking or app_label in ('auth', 'contenttypes')
+
+class ShardMiddleware:
+    """Route each request's banking queries to the signed-in user's shard
+
+    Staff can look at another shard with ?shard=<alias>; the choice sticks for their session.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return self.get_response(request)
+
+        alias = shard_for_user(user.pk)
+        if user.is_staff:
+            chosen = request.GET.get('shard') or request.session.get('shard')
+            if chosen in settings.SHARDS:
+                request.session['shard'] = alias = chosen
+        with use_shard(alias):
+            return self.get_response(request)
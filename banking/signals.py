@@ -0,0 +1,72 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from .models import AccountDirectory, BankAccount, CardDirectory, CreditCard, Transaction
+from .sharding import DIRECTORY, current_shard, is_sharded, shard_for_user
+from .analytics import invalidate_user_analytics
+from .internal_accounts import internal_accounts
+from . import audit
+from .rollups import record_completed_transaction
+
+@receiver(post_init, sender=Transaction)
+def remember_status(sender, instance, **kwargs):
+    # Status as last loaded or saved, so post_save can spot transitions
+    instance._saved_status = instance.status if instance.pk else None
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, **kwargs):
+    completed_now = instance.status == 'COMPLETED' and instance._saved_status != 'COMPLETED'
+    instance._saved_status = instance.status
+
+    if completed_now:
+        audit.record('balance.changed', transaction_id=instance.pk, account_id=instance.account_id,
+                     savings_account_id=instance.savings_account_id, type=instance.transaction_type,
+                     amount=instance.amount)
+
+    if completed_now and instance.account_id:
+        # Views adjust balances after writing the row, so wait for the commit
+        transaction_id = instance.pk
+        transaction.on_commit(lambda: record_completed_transaction(transaction_id))
+
+        user_id = instance.account.user_id
+        transaction.on_commit(lambda: invalidate_user_analytics(user_id))
+
+# Copied user fields; shards never see passwords
+REPLICATED_USER_FIELDS = ['username', 'first_name', 'last_name', 'email', 'is_active', 'is_staff', 'is_superuser', 'date_joined']
+
+@receiver(post_save, sender=User)
+def replicate_user(sender, instance, using, **kwargs):
+    # Banking rows on a shard reference their user, so the shard keeps a copy
+    if is_sharded() and using == DIRECTORY:
+        User.objects.using(shard_for_user(instance.pk)).update_or_create(
+            pk=instance.pk,
+            defaults={'password': '!', **{field: getattr(instance, field) for field in REPLICATED_USER_FIELDS}},
+        )
+
+@receiver(post_save, sender=BankAccount)
+def remember_account_number(sender, instance, created, using, **kwargs):
+    # Routes transfers to the new account without waiting for the next refresh
+    if created:
+        account_number = instance.account_number
+        transaction.on_commit(lambda: internal_accounts.add(account_number), using=using)
+
+@receiver(post_save, sender=BankAccount)
+def register_account(sender, instance, created, using, **kwargs):
+    if created and is_sharded():
+        # Listed once the shard has committed, so a lookup never finds an account that is not there
+        account_number = instance.account_number
+        shard = current_shard() if using == DEFAULT_DB_ALIAS else using
+        transaction.on_commit(lambda: AccountDirectory.objects.update_or_create(
+            account_number=account_number, defaults={'shard': shard},
+        ), using=using)
+
+@receiver(post_save, sender=CreditCard)
+def register_card(sender, instance, created, using, **kwargs):
+    if created and is_sharded():
+        # The card network only knows the card number, so it is looked up here to find the shard
+        card_number = instance.card_number
+        shard = current_shard() if using == DEFAULT_DB_ALIAS else using
+        transaction.on_commit(lambda: CardDirectory.objects.update_or_create(
+            card_number=card_number, defaults={'shard': shard},
+        ), using=using)
@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.db import connections
+from django.template.loader import render_to_string
+from decimal import Decimal
+from pathlib import Path
+from .archive import archived_transactions, month_bounds
+from .models import AccountMonthlyRollup, BankAccount, Transaction
+import django
+
+def statement_context(account, month):
+    """Everything the statement template needs for one account and month"""
+    rollup = AccountMonthlyRollup.objects.filter(account=account, month=month).first()
+    if rollup is None:
+        # Quiet month: carry the last known closing balance forward
+        previous = AccountMonthlyRollup.objects.filter(account=account, month__lt=month).order_by('-month').first()
+        balance = previous.closing_balance if previous else account.balance
+        rollup = AccountMonthlyRollup(account=account, month=month, opening_balance=balance, closing_balance=balance)
+
+    start, end = month_bounds(month)
+    transactions = list(
+        Transaction.objects.filter(account=account, status='COMPLETED', timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp')
+    )
+    last_day = (end.date() - start.date()).days
+    archived = archived_transactions([account], month, month.replace(day=last_day))
+    transactions += sorted((txn for txn in archived if txn.status == 'COMPLETED'), key=lambda txn: txn.timestamp)
+
+    return {
+        'account': account,
+        'month': month,
+        'rollup': rollup,
+        'totals': sorted((kind, Decimal(total)) for kind, total in rollup.totals_by_type.items()),
+        'transactions': transactions,
+    }
+
+def render_statement(account, month, output_dir):
+    path = Path(output_dir) / f'{month:%Y-%m}' / f'{account.account_number}.html'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(render_to_string('banking/statement.html', statement_context(account, month)))
+    return path
+
+def init_worker():
+    # Forked workers must not share the parent's database connections;
+    # spawned ones start without Django configured at all
+    connections.close_all()
+    django.setup()
+
+def _render_chunk(account_ids, month, output_dir):
+    rendered = 0
+    for account in BankAccount.objects.filter(id__in=account_ids).select_related('user'):
+        render_statement(account, month, output_dir)
+        rendered += 1
+    return rendered
+
+def render_statements(month, output_dir, workers=None, chunk_size=500):
+    """Render a statement for every account, spread across a process pool"""
+    account_ids = list(BankAccount.objects.order_by('id').values_list('id', flat=True))
+    chunks = [account_ids[i:i + chunk_size] for i in range(0, len(account_ids), chunk_size)]
+
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(_render_chunk, chunk, month, output_dir) for chunk in chunks]
+        return sum(future.result() for future in futures)
@@ -1,3 +1,1302 @@
-from django.test import TestCase
+from contextlib import ExitStack, contextmanager
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, models, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+import datetime
+import sqlite3
+import tempfile
+from api import migrate
+from . import (
+    audit, cards, holds, jobs, outbox, payroll, ratelimit, review_feed, rollups, schedules, settlement, shard_transfers, sharding, velocity,
+)
+from .statements import render_statement
+from .archive import archive_month, closed_months
+from .locking import money_movement
+from .models import (
+    AccountDirectory, AccountMonthlyRollup, AuditEntry, BankAccount, CardAuthorization, CardDirectory, CreditCard, ExternalPayout, InboundTransfer,
+    Job, OutboxEvent, PaymentSchedule, ScheduledPayment, Transaction, TransactionArchive,
+)
+from .internal_accounts import BloomFilter, InternalAccountNumbers, is_internal
+from .resolver import AccountResolver
+from .search import FTS_TABLE, search_transactions
+from .sharding import DIRECTORY, current_shard, is_sharded, shard_for_user, use_shard
 
-# Create your tests here.
+# Pages render without running collectstatic first
+plain_static = override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+
+def make_account(username='alice', balance='100.00', account_number='1000000001', **kwargs):
+    user = User.objects.create_user(username, password='secret-pass-123')
+    return BankAccount.objects.create(user=user, account_number=account_number, balance=Decimal(balance), **kwargs)
+
+def refreshed(obj):
+    obj.refresh_from_db()
+    return obj
+
+def make_card(user, credit_limit='1000.00', current_balance='0', **kwargs):
+    return CreditCard.objects.create(user=user, expiration_date=datetime.date(2030, 1, 31), credit_limit=Decimal(credit_limit),
+                                     current_balance=Decimal(current_balance), apr=Decimal('19.99'), **kwargs)
+
+def add_transaction(account, description, transaction_type='DEPOSIT', amount='5.00', status='COMPLETED', **kwargs):
+    return Transaction.objects.create(account=account, transaction_type=transaction_type, amount=Decimal(amount),
+                                      description=description, status=status, **kwargs)
+
+@contextmanager
+def shards(aliases):
+    """Place users on aliases only; the hash ring is rebuilt on the way in and out"""
+    with override_settings(SHARDS=aliases):
+        sharding._ring = None
+        try:
+            yield
+        finally:
+            sharding._ring = None
+
+class BankTestCase(TestCase):
+    """With SQLITE_SHARDS set, runs as is on the first shard: every user is placed there and it stands in for 'default'"""
+    databases = '__all__'
+    # Tests that work across shards keep them all, with the real 'default', and switch shards themselves
+    all_shards = False
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = connections[DIRECTORY] if is_sharded() else None
+        if cls.directory:
+            # The test 'directory' mirrors 'default'; sharing one connection keeps both in the test's transaction
+            connections[DIRECTORY] = connections[DEFAULT_DB_ALIAS]
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if cls.directory:
+            connections[DIRECTORY] = cls.directory
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        self.shard_stack = ExitStack()
+        if is_sharded() and not self.all_shards:
+            self.shard_stack.enter_context(shards(settings.SHARDS[:1]))
+            self.shard_stack.enter_context(use_shard(settings.SHARDS[0]))
+
+    def _post_teardown(self):
+        # Each alias's transaction is rolled back on the connection it was begun on
+        self.shard_stack.close()
+        super()._post_teardown()
+
+@plain_static
+class SearchTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        for description in ['Coffee at Blue Bottle', 'Coffee coffee beans', 'Rent payment']:
+            add_transaction(self.account, description)
+        self.client.force_login(self.account.user)
+
+    def history(self, **params):
+        return self.client.get(reverse('banking:transaction_history'), params)
+
+    def test_history_search_returns_ranked_matches(self):
+        response = self.history(q='coffee')
+        self.assertEqual([txn.description for txn in response.context['transactions']],
+                         ['Coffee coffee beans', 'Coffee at Blue Bottle'])
+
+    def test_terms_are_prefix_matched_and_all_required(self):
+        self.assertEqual(len(self.history(q='cof').context['transactions']), 2)
+        self.assertEqual([txn.description for txn in self.history(q='coffee blue').context['transactions']],
+                         ['Coffee at Blue Bottle'])
+
+    def test_punctuation_only_query_matches_nothing(self):
+        self.assertEqual(list(search_transactions(Transaction.objects.all(), '"*')), [])
+
+    def test_results_are_paginated(self):
+        for n in range(30):
+            add_transaction(self.account, f'Grocery run {n}')
+        first, second = self.history(q='grocery'), self.history(q='grocery', page=2)
+        self.assertEqual((len(first.context['transactions']), len(second.context['transactions'])), (25, 5))
+        self.assertIn('q=grocery', first.context['filter_querystring'])
+
+    def test_admin_search_uses_the_index(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret-pass-123')
+        self.client.login(username='admin', password='secret-pass-123')
+        response = self.client.get(reverse('admin:banking_transaction_changelist'), {'q': 'bottle'})
+        self.assertEqual([txn.description for txn in response.context['cl'].result_list], ['Coffee at Blue Bottle'])
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 triggers are SQLite only')
+class SearchIndexTests(BankTestCase):
+    def matches(self, query):
+        return list(search_transactions(Transaction.objects.all(), query).values_list('description', flat=True))
+
+    def test_triggers_survive_every_migration(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f'{FTS_TABLE}%'])
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, {f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'})
+
+    def test_index_follows_updates_and_deletes(self):
+        txn = add_transaction(make_account(), 'Coffee at Blue Bottle')
+        self.assertEqual(self.matches('bottle'), ['Coffee at Blue Bottle'])
+
+        Transaction.objects.filter(id=txn.id).update(description='Tea at Green Leaf')
+        self.assertEqual((self.matches('bottle'), self.matches('leaf')), ([], ['Tea at Green Leaf']))
+
+        txn.delete()
+        self.assertEqual(self.matches('leaf'), [])
+
+@plain_static
+class ArchiveTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.client.force_login(self.account.user)
+        now = timezone.now()
+        self.old_month = (now - timedelta(days=400)).date().replace(day=1)
+        for description, age in [('coffee refund old', 400), ('coffee refund recent', 2), ('coffee coffee refund', 0)]:
+            txn = add_transaction(self.account, description)
+            Transaction.objects.filter(id=txn.id).update(timestamp=now - timedelta(days=age))
+        self.start_date = (now - timedelta(days=500)).date().isoformat()
+
+    def test_closed_month_moves_out_of_the_hot_table(self):
+        self.assertIn((self.account.id, self.old_month), closed_months())
+        self.assertEqual(archive_month(self.account.id, self.old_month), 1)
+        archive = TransactionArchive.objects.get(account=self.account, month=self.old_month)
+        self.assertEqual(archive.transaction_count, 1)
+        self.assertFalse(Transaction.objects.filter(description='coffee refund old').exists())
+
+    def test_month_with_pending_transfer_stays_open(self):
+        txn = add_transaction(self.account, 'pending', transaction_type='WITHDRAWAL', status='PENDING')
+        Transaction.objects.filter(id=txn.id).update(timestamp=timezone.now() - timedelta(days=400))
+        self.assertNotIn((self.account.id, self.old_month), closed_months())
+
+    def test_search_merges_archive_newest_first(self):
+        archive_month(self.account.id, self.old_month)
+        response = self.client.get(reverse('banking:transaction_history'), {'q': 'coffee', 'start_date': self.start_date})
+        self.assertEqual(
+            [txn.description for txn in response.context['transactions']],
+            ['coffee coffee refund', 'coffee refund recent', 'coffee refund old'],
+        )
+
+    def test_archive_is_not_read_without_start_date(self):
+        archive_month(self.account.id, self.old_month)
+        response = self.client.get(reverse('banking:transaction_history'), {'q': 'coffee'})
+        self.assertEqual(len(response.context['transactions']), 2)
+
+class RollupTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.this_month = rollups.month_of(timezone.now())
+
+    def complete(self, amount, timestamp=None):
+        deposit = add_transaction(self.account, 'Deposit', amount=amount)
+        if timestamp:
+            Transaction.objects.filter(id=deposit.id).update(timestamp=timestamp)
+        BankAccount.objects.filter(id=self.account.id).update(balance=models.F('balance') + Decimal(amount))
+        rollups.record_completed_transaction(deposit.id)
+
+    def test_completed_transaction_is_folded_into_its_month(self):
+        rollups.rebuild_month(self.account.id, self.this_month)
+        self.complete('40')
+        rollup = AccountMonthlyRollup.objects.get(account=self.account, month=self.this_month)
+        self.assertEqual((rollup.opening_balance, rollup.closing_balance), (Decimal('100.00'), Decimal('140.00')))
+        self.assertEqual((rollup.transaction_count, rollup.totals_by_type), (1, {'DEPOSIT': '40.00'}))
+
+    def test_backdated_transaction_shifts_later_months(self):
+        rollups.rebuild_month(self.account.id, self.this_month)
+        backdated = timezone.now() - timedelta(days=62)
+        self.complete('25', timestamp=backdated)
+
+        earlier = AccountMonthlyRollup.objects.get(account=self.account, month=rollups.month_of(backdated))
+        later = AccountMonthlyRollup.objects.get(account=self.account, month=self.this_month)
+        self.assertEqual((earlier.opening_balance, earlier.closing_balance), (Decimal('100.00'), Decimal('125.00')))
+        self.assertEqual((later.opening_balance, later.closing_balance), (Decimal('125.00'), Decimal('125.00')))
+
+    @plain_static
+    def test_statement_is_rendered_from_the_rollup(self):
+        self.complete('40')
+        with tempfile.TemporaryDirectory() as directory:
+            path = render_statement(self.account, self.this_month, directory)
+            html = Path(path).read_text()
+        self.assertEqual(path.name, f'{self.account.account_number}.html')
+        self.assertIn('140.00', html)
+
+class SpendingAnalyticsTests(BankTestCase):
+    def setUp(self):
+        cache.clear()
+        self.account = make_account()
+        self.client.force_login(self.account.user)
+        self.monday = timezone.localdate() - timedelta(days=timezone.localdate().weekday() + 7)
+
+    def add(self, description, day, **kwargs):
+        txn = add_transaction(self.account, description, **kwargs)
+        moment = timezone.make_aware(datetime.datetime.combine(day, datetime.time(12)))
+        Transaction.objects.filter(id=txn.id).update(timestamp=moment)
+        return txn
+
+    def buckets(self, **params):
+        response = self.client.get(reverse('banking:spending_analytics'), params)
+        self.assertEqual(response.status_code, 200)
+        return [(b['period'], b['type'], b['total'], b['count']) for b in response.json()['buckets']]
+
+    def test_totals_per_week_and_type(self):
+        self.add('Pay', self.monday, amount='100.00')
+        self.add('Coffee', self.monday + timedelta(days=2), transaction_type='WITHDRAWAL', amount='4.50')
+        self.add('Lunch', self.monday + timedelta(days=3), transaction_type='WITHDRAWAL', amount='10.00')
+        self.add('Pending', self.monday, transaction_type='WITHDRAWAL', status='PENDING')
+        self.assertEqual(self.buckets(), [
+            (self.monday.isoformat(), 'DEPOSIT', '100.00', 1),
+            (self.monday.isoformat(), 'WITHDRAWAL', '14.50', 2),
+        ])
+
+    def test_end_date_includes_the_whole_day(self):
+        self.add('Pay', self.monday, amount='100.00')
+        self.assertEqual(len(self.buckets(interval='day', start_date=self.monday.isoformat(),
+                                          end_date=self.monday.isoformat())), 1)
+
+    def test_archived_months_are_included(self):
+        old_day = timezone.localdate() - timedelta(days=400)
+        self.add('Old pay', old_day, amount='70.00')
+        archive_month(self.account.id, old_day.replace(day=1))
+        start = (old_day - timedelta(days=5)).isoformat()
+        self.assertEqual(self.buckets(interval='month', start_date=start),
+                         [(old_day.replace(day=1).isoformat(), 'DEPOSIT', '70.00', 1)])
+
+    def test_cached_until_a_transaction_completes(self):
+        self.add('Pay', self.monday, amount='100.00')
+        self.assertEqual(len(self.buckets()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_transaction(self.account, 'Refund', transaction_type='INTEREST')
+        self.assertEqual(len(self.buckets()), 2)
+
+    def test_rejects_unknown_interval(self):
+        response = self.client.get(reverse('banking:spending_analytics'), {'interval': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+class ApiTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.client.force_login(self.account.user)
+        self.other = make_account('bob', account_number='2000000002')
+        add_transaction(self.other, 'Not yours')
+
+    def get(self, name, **params):
+        return self.client.get(reverse(f'banking:api_{name}'), params)
+
+    def test_requires_a_session(self):
+        self.client.logout()
+        self.assertEqual(self.get('accounts').status_code, 401)
+
+    def test_only_reads(self):
+        self.assertEqual(self.client.post(reverse('banking:api_accounts')).status_code, 405)
+
+    def test_sparse_fields_of_own_accounts(self):
+        data = self.get('accounts', fields='account_number,balance').json()
+        self.assertEqual(data, {'data': [{'account_number': '1000000001', 'balance': '100.00'}], 'next_cursor': None})
+
+    def test_cursor_walks_every_transaction_once(self):
+        created = [add_transaction(self.account, f'Deposit {n}').id for n in range(5)]
+        seen, cursor = [], ''
+        while True:
+            params = {'limit': 2, 'fields': 'id'}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.get('transactions', **params).json()
+            seen += [row['id'] for row in page['data']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, sorted(created, reverse=True))
+
+    def test_filters_by_account(self):
+        add_transaction(self.account, 'Mine')
+        rows = self.get('transactions', account_id=self.other.id).json()['data']
+        self.assertEqual(rows, [])
+
+    def test_bad_parameters_are_json_errors(self):
+        for params in [{'fields': 'balance,secret'}, {'cursor': '!!'}, {'limit': 'many'}, {'limit': '0'}]:
+            response = self.get('accounts', **params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+
+@plain_static
+class ConditionalGetTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        # Account rows last changed yesterday, so a newer Last-Modified can only come from elsewhere
+        BankAccount.objects.filter(id=self.account.id).update(updated_at=timezone.now() - timedelta(days=1))
+        self.client.force_login(self.account.user)
+        self.url = reverse('banking:dashboard')
+
+    def test_unchanged_page_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+    def test_new_transaction_changes_both_validators(self):
+        first = self.client.get(self.url)
+        add_transaction(self.account, 'Incoming transfer', status='PENDING')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 200)
+
+    def test_archiving_changes_both_validators(self):
+        old = add_transaction(self.account, 'Old deposit')
+        Transaction.objects.filter(id=old.id).update(timestamp=timezone.now() - timedelta(days=400))
+        add_transaction(self.account, 'Recent deposit')
+        Transaction.objects.filter(account=self.account).update(timestamp=models.F('timestamp') - timedelta(days=2))
+        first = self.client.get(self.url)
+        archive_month(self.account.id, (timezone.now() - timedelta(days=400)).date().replace(day=1))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 200)
+
+    def test_history_and_api_are_conditional_too(self):
+        for url in [reverse('banking:transaction_history'), reverse('banking:api_accounts')]:
+            first = self.client.get(url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304, url)
+
+class ReviewFeedTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.feed = review_feed.ReviewFeed()
+        self.feed.poll()
+
+    def test_new_pending_rows_are_announced_once(self):
+        txn = add_transaction(self.account, 'Wire out', status='PENDING')
+        self.assertEqual([(name, data['id']) for name, data in self.feed.poll()], [('pending', txn.id)])
+        self.assertEqual(self.feed.poll(), [])
+
+    def test_decisions_on_watched_rows_are_announced(self):
+        txn = add_transaction(self.account, 'Wire out', status='PENDING')
+        self.feed.poll()
+        Transaction.objects.filter(id=txn.id).update(status='COMPLETED')
+        self.assertEqual([(name, data['status']) for name, data in self.feed.poll()], [('status', 'COMPLETED')])
+
+    def test_rows_committed_below_the_last_id_are_picked_up(self):
+        early = add_transaction(self.account, 'Slow commit', status='PENDING')
+        early_id = early.id
+        early.delete()
+        later = add_transaction(self.account, 'Fast commit', status='PENDING')
+        self.assertEqual([data['id'] for _, data in self.feed.poll()], [later.id])
+        # The lower id only becomes visible now, as a transaction that committed late would
+        add_transaction(self.account, 'Slow commit', status='PENDING', id=early_id)
+        self.assertEqual([data['id'] for _, data in self.feed.poll()], [early_id])
+        self.assertEqual(self.feed.poll(), [])
+
+@plain_static
+class ReviewStreamTests(BankTestCase):
+    def test_dashboard_points_staff_at_the_stream(self):
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123', is_staff=True))
+        response = self.client.get(reverse('banking:admin_dashboard'))
+        if is_sharded():
+            # The feed polls a single database, so the dashboard leaves it out
+            self.assertNotContains(response, reverse('banking:admin_review_stream'))
+        else:
+            self.assertContains(response, reverse('banking:admin_review_stream'))
+        # Under WSGI the stream declines rather than tie up a worker
+        self.assertEqual(self.client.get(reverse('banking:admin_review_stream')).status_code, 204)
+
+    def test_stream_is_staff_only(self):
+        self.client.force_login(make_account().user)
+        self.assertEqual(self.client.get(reverse('banking:admin_review_stream')).status_code, 403)
+
+@plain_static
+class CardPaymentTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.card = make_card(self.account.user, current_balance='300.00')
+        self.client.force_login(self.account.user)
+
+    def assert_paid(self, description):
+        self.assertEqual(refreshed(self.account).balance, Decimal('50.00'))
+        self.assertEqual(refreshed(self.card).current_balance, Decimal('250.00'))
+        txn = Transaction.objects.get(account=self.account)
+        self.assertEqual((txn.transaction_type, txn.amount, txn.description),
+                         ('WITHDRAWAL', Decimal('50.00'), f'{description} for card ending in {self.card.card_number[-4:]}'))
+        event = OutboxEvent.objects.get(topic='card.payment')
+        self.assertEqual((event.payload['card_id'], event.payload['amount']), (self.card.id, '50.00'))
+
+    def test_payment_today_records_the_withdrawal_and_publishes(self):
+        response = self.client.post(reverse('banking:pay_balance', args=[self.card.id]),
+                                    {'amount': '50.00', 'payment_method': 'checking', 'payment_date': 'today'})
+        self.assertRedirects(response, reverse('banking:dashboard'), fetch_redirect_response=False)
+        self.assert_paid('Credit card payment')
+
+    def test_processing_a_scheduled_payment_records_and_publishes(self):
+        payment = ScheduledPayment.objects.create(user=self.account.user, credit_card=self.card, source_account=self.account,
+                                                  amount=Decimal('50.00'), scheduled_date=timezone.now().date())
+        self.client.post(reverse('banking:scheduled_payments'), {'payment_id': payment.id, 'action': 'process'})
+        self.assertEqual(refreshed(payment).status, 'COMPLETED')
+        self.assert_paid('Scheduled credit card payment')
+
+class OutboxTests(BankTestCase):
+    def test_failed_delivery_backs_off_then_succeeds(self):
+        calls = []
+
+        def flaky(payload):
+            calls.append(payload)
+            if len(calls) == 1:
+                raise RuntimeError('downstream unavailable')
+
+        outbox.HANDLERS['tests.flaky'] = [flaky]
+        self.addCleanup(outbox.HANDLERS.pop, 'tests.flaky')
+        event = outbox.publish('tests.flaky', n=1)
+        self.assertEqual(outbox.deliver_batch(), (0, 1))
+        self.assertEqual(refreshed(event).status, 'PENDING')
+        self.assertEqual(outbox.deliver_batch(), (0, 0))
+        OutboxEvent.objects.filter(id=event.id).update(available_at=timezone.now())
+        self.assertEqual(outbox.deliver_batch(), (1, 0))
+        self.assertEqual((refreshed(event).status, refreshed(event).attempts, calls), ('DELIVERED', 2, [{'n': 1}] * 2))
+
+class RateLimitTests(BankTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_window_allows_the_rate_then_resets(self):
+        counter = ratelimit.FixedWindow('tests', '3/m')
+        with mock.patch.object(ratelimit.time, 'time', return_value=600.0):
+            self.assertEqual([counter.consume('k') for _ in range(3)], [0, 0, 0])
+            self.assertEqual(counter.consume('k'), 60)
+        with mock.patch.object(ratelimit.time, 'time', return_value=660.0):
+            self.assertEqual(counter.consume('k'), 0)
+
+    def test_count_is_shared_between_processes(self):
+        # Each process has its own FixedWindow; only the cache count is shared
+        first, second = ratelimit.FixedWindow('tests', '3/m'), ratelimit.FixedWindow('tests', '3/m')
+        self.assertEqual([first.consume('k'), second.consume('k'), first.consume('k')], [0, 0, 0])
+        self.assertGreater(second.consume('k'), 0)
+
+    def test_client_ip_trusts_only_proxy_hops(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4', REMOTE_ADDR='10.0.0.1')
+        with self.settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(ratelimit.client_ip(request), '1.2.3.4')
+        with self.settings(TRUSTED_PROXY_COUNT=0):
+            self.assertEqual(ratelimit.client_ip(request), '10.0.0.1')
+
+    @plain_static
+    def test_login_is_limited_per_address_and_username(self):
+        login = reverse('banking:login')
+
+        def attempt(username):
+            return self.client.post(login, {'username': username, 'password': 'wrong'}, REMOTE_ADDR='10.9.9.9')
+
+        self.assertEqual({attempt('mallory').status_code for _ in range(5)}, {200})
+        response = attempt('mallory')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 60)
+        self.assertEqual(attempt('trudy').status_code, 200)
+
+class CardTests(BankTestCase):
+    def setUp(self):
+        self.card = make_card(User.objects.create_user('carol', password='secret-pass-123'), credit_limit='500')
+
+    def test_authorize_holds_credit(self):
+        cards.authorize(self.card.id, '120', 'Shop', 'ref-1')
+        card = refreshed(self.card)
+        self.assertEqual((card.available_credit, card.held_amount), (Decimal('380.00'), Decimal('120.00')))
+
+    def test_retried_reference_returns_original(self):
+        first = cards.authorize(self.card.id, '120', 'Shop', 'ref-1')
+        again = cards.authorize(self.card.id, '120', 'Shop', 'ref-1')
+        self.assertEqual(first.id, again.id)
+        self.assertEqual(refreshed(self.card).held_amount, Decimal('120.00'))
+
+    def test_declines_over_available_credit(self):
+        with self.assertRaises(cards.AuthorizationDeclined):
+            cards.authorize(self.card.id, '600', 'Shop', 'ref-1')
+        self.assertFalse(CardAuthorization.objects.exists())
+
+    def test_settle_moves_holds_to_balance(self):
+        cards.authorize(self.card.id, '100', 'Shop', 'ref-1')
+        cards.authorize(self.card.id, '50', 'Shop', 'ref-2')
+        self.assertEqual(cards.settle_batch(), 2)
+        card = refreshed(self.card)
+        self.assertEqual(
+            (card.current_balance, card.held_amount, card.available_credit),
+            (Decimal('150.00'), Decimal('0.00'), Decimal('350.00')),
+        )
+        self.assertEqual(cards.settle_batch(), 0)
+
+    def test_expired_holds_are_released(self):
+        cards.authorize(self.card.id, '100', 'Shop', 'ref-1', hold_for=timedelta(seconds=-1))
+        self.assertEqual(cards.release_expired(), 1)
+        card = refreshed(self.card)
+        self.assertEqual((card.available_credit, card.held_amount), (Decimal('500.00'), Decimal('0.00')))
+
+    def test_payment_keeps_holds(self):
+        cards.authorize(self.card.id, '100', 'Shop', 'ref-1')
+        cards.settle_batch()
+        cards.authorize(self.card.id, '40', 'Shop', 'ref-2')
+        cards.apply_payment(self.card.id, '60')
+        card = refreshed(self.card)
+        self.assertEqual(
+            (card.current_balance, card.held_amount, card.available_credit),
+            (Decimal('40.00'), Decimal('40.00'), Decimal('420.00')),
+        )
+
+@plain_static
+@override_settings(CARD_NETWORK_KEY='network-secret')
+class CardViewTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        with self.captureOnCommitCallbacks(execute=True):
+            # With shards, the card network finds the card through the directory
+            self.card = make_card(self.account.user, credit_limit='500')
+        self.url = reverse('banking:api_card_authorizations', args=[self.card.card_number])
+
+    def authorize(self, amount, reference, key='network-secret'):
+        body = {'amount': amount, 'merchant': 'Shop', 'reference': reference}
+        return self.client.post(self.url, body, content_type='application/json', HTTP_X_CARD_NETWORK_KEY=key)
+
+    def test_network_places_holds_with_its_key(self):
+        self.assertEqual(self.authorize('100', 'ref-1', key='guess').status_code, 403)
+        response = self.authorize('100', 'ref-1')
+        self.assertEqual((response.status_code, response.json()['status']), (201, 'HELD'))
+        self.assertEqual(self.authorize('100', 'ref-1').json()['id'], response.json()['id'])
+        self.assertEqual(self.authorize('450', 'ref-2').status_code, 402)
+
+    def test_paying_the_balance_keeps_open_holds(self):
+        self.authorize('100', 'ref-1')
+        cards.settle_batch()
+        self.authorize('40', 'ref-2')
+        self.client.force_login(self.account.user)
+        self.client.post(reverse('banking:pay_balance', args=[self.card.id]),
+                         {'amount': '60.00', 'payment_method': 'checking', 'payment_date': 'today'})
+        card = refreshed(self.card)
+        self.assertEqual(
+            (card.current_balance, card.held_amount, card.available_credit),
+            (Decimal('40.00'), Decimal('40.00'), Decimal('420.00')),
+        )
+        self.assertEqual(refreshed(self.account).balance, Decimal('40.00'))
+
+class VelocityTests(BankTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_flags_then_blocks_without_counting_blocked(self):
+        decisions = [velocity.reserve_transfer('111', '222', 100) for _ in range(7)]
+        self.assertEqual([d.flagged for d in decisions[:5]], [False, False, False, True, True])
+        self.assertEqual([d.blocked for d in decisions], [False] * 5 + [True, True])
+        count, total = velocity.window_totals('account', '111', timezone.now().timestamp())['1m']
+        self.assertEqual((count, total), (5, Decimal('500')))
+
+    def test_released_transfer_is_taken_back_out(self):
+        decision = velocity.reserve_transfer('111', '222', 100)
+        velocity.release_transfer(decision)
+        self.assertEqual(velocity.window_totals('recipient', '222', timezone.now().timestamp())['1h'], (0, Decimal('0')))
+
+@plain_static
+class VelocityViewTests(BankTestCase):
+    def setUp(self):
+        cache.clear()
+        self.account = make_account()
+        self.client.force_login(self.account.user)
+
+    def send(self):
+        return self.client.post(reverse('banking:send_money'),
+                                {'from_account': self.account.id, 'account_number': '5555555555', 'amount': '1.00'})
+
+    def test_flagged_transfers_reach_reviewers_and_blocked_ones_do_not(self):
+        for _ in range(6):
+            self.send()
+        self.assertEqual([txn.review_reasons != [] for txn in Transaction.objects.order_by('id')],
+                         [False, False, False, True, True])
+        self.assertEqual(OutboxEvent.objects.filter(topic='transfer.flagged').count(), 2)
+        self.assertEqual(OutboxEvent.objects.filter(topic='transfer.blocked').count(), 1)
+
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123', is_staff=True))
+        self.assertContains(self.client.get(reverse('banking:admin_dashboard')), 'Velocity flag')
+
+class PayrollTests(BankTestCase):
+    def entry_record(self, code, account_number, cents, name):
+        return f'6{code}021000021{account_number:<17}{cents:010d}{"ID123":<15}{name:<22}  0000000000000001\n'
+
+    def test_parse_nacha(self):
+        lines = [
+            '101 021000021 1234567892401011200A094101BANK                   EMPLOYER\n',
+            f'5200{"ACME PAYROLL":<16}' + ' ' * 20 + '\n',
+            self.entry_record('22', '1000000001', 123456, 'Jane Doe'),
+            self.entry_record('27', '1000000002', 500, 'Debit'),
+            self.entry_record('32', '1000000003', 0, 'Zero'),
+        ]
+        good, debit, zero = payroll.parse_nacha(lines)
+        self.assertEqual(
+            (good.account_number, good.amount, good.name, good.company, good.error),
+            ('1000000001', Decimal('1234.56'), 'Jane Doe', 'ACME PAYROLL', None),
+        )
+        self.assertEqual(debit.error, 'unsupported transaction code 27')
+        self.assertTrue(zero.error.startswith('invalid amount'))
+
+    def test_ingest_credits_known_accounts(self):
+        account = make_account()
+        entries = payroll.parse_csv(['account_number,amount\n', '1000000001,50.00\n', '9999999999,10\n'])
+        [(posted, total, rejects, skipped)] = payroll.ingest(entries, 'batch-1')
+        self.assertEqual((posted, total, skipped), (1, Decimal('50.00'), 0))
+        self.assertEqual([entry.error for entry in rejects], ['unknown account number'])
+        self.assertEqual(refreshed(account).balance, Decimal('150.00'))
+
+    def test_running_a_file_again_posts_only_what_is_left(self):
+        account = make_account()
+        make_account('bob', account_number='1000000002')
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'payroll.csv'
+            path.write_text('account_number,amount\n1000000001,50.00\n1000000002,20.00\n')
+            # An earlier run that stopped after the first entry
+            [entry] = list(payroll.parse_csv(['account_number,amount\n', '1000000001,50.00\n']))
+            payroll.post_chunk([entry], payroll.file_digest(path))
+            call_command('ingest_payroll', str(path), stdout=StringIO())
+            call_command('ingest_payroll', str(path), stdout=(output := StringIO()))
+        self.assertIn('Posted 0 deposits', output.getvalue())
+        self.assertEqual(refreshed(account).balance, Decimal('150.00'))
+        self.assertEqual(BankAccount.objects.get(account_number='1000000002').balance, Decimal('120.00'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+class SettlementTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account(balance='40.00')
+        withdrawal = add_transaction(self.account, 'External transfer', transaction_type='WITHDRAWAL', amount='60')
+        self.payout = ExternalPayout.objects.create(transaction=withdrawal, account=self.account,
+                                                    recipient_account_number='555', amount=Decimal('60'))
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def export(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            batch, path = settlement.export_batch(self.directory.name)
+        return batch, Path(path).read_text()
+
+    def test_export_marks_payouts_exported(self):
+        batch, contents = self.export()
+        self.assertEqual(refreshed(self.payout).status, 'EXPORTED')
+        self.assertIn(f'{self.payout.id},', contents)
+        self.assertEqual(settlement.export_batch(self.directory.name), (None, None))
+
+    def test_file_is_written_only_once_the_batch_commits(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            settlement.export_batch(self.directory.name)
+            raise RuntimeError('rolled back')
+        self.assertEqual(list(Path(self.directory.name).iterdir()), [])
+        self.assertEqual(refreshed(self.payout).status, 'APPROVED')
+
+    def test_batch_file_can_be_written_again(self):
+        batch, contents = self.export()
+        Path(self.directory.name, f'settlement-{batch.reference}.csv').unlink()
+        call_command('export_settlement', output_dir=self.directory.name, rewrite=batch.reference, stdout=StringIO())
+        self.assertEqual(Path(self.directory.name, f'settlement-{batch.reference}.csv').read_text(), contents)
+
+    def test_failed_payout_is_reversed_once(self):
+        self.export()
+        results = f'payout_id,status,reason\n{self.payout.id},FAILED,Account closed\n'.splitlines(keepends=True)
+        self.assertEqual(settlement.apply_results(settlement.read_results(results)), (0, 1, []))
+        self.assertEqual(settlement.apply_results(settlement.read_results(results)), (0, 0, []))
+
+        self.assertEqual(refreshed(self.account).balance, Decimal('100.00'))
+        payout = refreshed(self.payout)
+        self.assertEqual((payout.status, payout.failure_reason), ('FAILED', 'Account closed'))
+        self.assertTrue(Transaction.objects.filter(description__startswith='Reversal of failed').exists())
+
+    def test_unknown_status_is_reported(self):
+        self.export()
+        results = ['payout_id,status\n', f'{self.payout.id},LOST\n']
+        self.assertEqual(settlement.apply_results(settlement.read_results(results)), (0, 0, [self.payout.id]))
+        self.assertEqual(refreshed(self.payout).status, 'EXPORTED')
+
+class HoldTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+
+    def test_hold_reserves_available_balance(self):
+        self.assertTrue(holds.place_hold(self.account.id, '60'))
+        self.assertFalse(holds.place_hold(self.account.id, '50'))
+        account = refreshed(self.account)
+        self.assertEqual(account.balance, Decimal('100.00'))
+        self.assertEqual(account.available_balance, Decimal('40.00'))
+
+    def test_capture_debits_and_release_gives_back(self):
+        holds.place_hold(self.account.id, '30')
+        holds.capture_hold(self.account.id, Decimal('30'))
+        account = refreshed(self.account)
+        self.assertEqual((account.balance, account.held_amount), (Decimal('70.00'), Decimal('0.00')))
+
+        holds.place_hold(self.account.id, '20')
+        withdrawal = Transaction(account=self.account, transaction_type='WITHDRAWAL', amount=Decimal('20'))
+        holds.release_hold(withdrawal)
+        self.assertEqual(refreshed(self.account).held_amount, Decimal('0.00'))
+
+    def test_debit_leaves_held_funds_alone(self):
+        holds.place_hold(self.account.id, '70')
+        self.assertFalse(holds.debit(self.account.id, 40))
+        self.assertTrue(holds.debit(self.account.id, 30.0))
+        holds.credit(self.account.id, '5')
+        self.assertEqual(refreshed(self.account).balance, Decimal('75.00'))
+
+@plain_static
+class DepositTests(BankTestCase):
+    def setUp(self):
+        # Someone else's account first, so ids of different tables and users do not line up by accident
+        self.other = make_account('bob', account_number='1000000009')
+        self.checking = make_account()
+        self.savings = BankAccount.objects.create(user=self.checking.user, account_number='1000000002',
+                                                  account_type='SAVINGS', balance=Decimal('10.00'))
+        self.client.force_login(self.checking.user)
+
+    def test_deposit_credits_only_the_chosen_account(self):
+        for account_type, expected in [('savings', ('100.00', '35.00')), ('checking', ('125.00', '35.00'))]:
+            self.client.post(reverse('banking:deposit'), {'account_type': account_type, 'amount': '25'})
+            self.assertEqual((refreshed(self.checking).balance, refreshed(self.savings).balance),
+                             tuple(Decimal(balance) for balance in expected))
+        self.assertEqual(refreshed(self.other).balance, Decimal('100.00'))
+        self.assertEqual(Transaction.objects.filter(account=self.savings, description='Deposit to savings account').count(), 1)
+
+    def test_form_shows_both_balances(self):
+        response = self.client.get(reverse('banking:deposit'))
+        self.assertContains(response, 'Checking (Balance: $100.00)')
+        self.assertContains(response, 'Savings (Balance: $10.00)')
+
+class StaticAssetTests(BankTestCase):
+    # static/vendor is downloaded by build_files.sh; empty stand-ins are enough to build the manifest
+    VENDOR_FILES = ['bootstrap/css/bootstrap.min.css', 'bootstrap/js/bootstrap.bundle.min.js', 'fontawesome/css/all.min.css']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        for name in self.VENDOR_FILES:
+            (root / 'vendor' / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / 'vendor' / name).write_text('/* vendor */')
+        static = self.settings(
+            STATICFILES_DIRS=[str(Path(__file__).resolve().parent.parent / 'static'), ('vendor', str(root / 'vendor'))],
+            STATIC_ROOT=str(root / 'collected'),
+        )
+        static.enable()
+        self.addCleanup(static.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.static_root = root / 'collected'
+
+    def test_pages_link_fingerprinted_local_assets(self):
+        pages = [self.client.get(reverse('banking:login'))]
+        self.client.force_login(make_account().user)
+        pages += [self.client.get(reverse('banking:dashboard')), self.client.get(reverse('banking:transaction_history'))]
+        for response in pages:
+            url, content = response.request['PATH_INFO'], response.content.decode()
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotIn('cdn', content, url)
+            self.assertNotIn('<style', content, url)
+            self.assertRegex(content, r'/static/vendor/bootstrap/css/bootstrap\.min\.[0-9a-f]{12}\.css')
+
+    def test_assets_are_precompressed_and_cached_for_good(self):
+        [hashed] = [path for path in (self.static_root / 'css').glob('dashboard.*.css') if path.name.count('.') == 2]
+        self.assertTrue(hashed.with_name(f'{hashed.name}.gz').exists())
+        response = self.client.get(f'/static/css/{hashed.name}', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((response.status_code, response['Content-Encoding']), (200, 'gzip'))
+        self.assertIn('immutable', response['Cache-Control'])
+
+class MigrateHandlerTests(BankTestCase):
+    # The handler checks 'default' itself, so it must not be a shard
+    all_shards = True
+
+    def test_nothing_pending_skips_the_migrator(self):
+        with mock.patch.object(migrate, 'call_command') as call:
+            response = migrate.handler(None)
+        self.assertEqual(response, {'statusCode': 200, 'body': 'No migrations to apply'})
+        call.assert_not_called()
+
+    def test_missing_migration_runs_migrate_and_reports_timings(self):
+        latest = MigrationRecorder.Migration.objects.filter(app='banking').order_by('-name').first()
+        latest.delete()
+
+        def run(*args, stdout, **kwargs):
+            stdout.write(f'  Applying banking.{latest.name}... OK (0.042s)\n')
+
+        with mock.patch.object(migrate, 'call_command', side_effect=run) as call:
+            response = migrate.handler(None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertIn(f'default banking.{latest.name}: 0.042s', response['body'])
+        self.assertEqual(call.call_args.kwargs['database'], 'default')
+
+def forget_database(alias):
+    # TestCase tears down only the aliases it started with, so ones a test adds must be gone by then
+    connections[alias].close()
+    del connections[alias]
+    del connections.settings[alias]
+
+@skipUnless(connection.vendor == 'sqlite', 'The high-concurrency profile is for SQLite')
+class SQLiteProfileTests(BankTestCase):
+    alias = 'tests_high_concurrency'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / 'profile.sqlite3')
+        connections.settings[self.alias] = connections.configure_settings({
+            'default': connections.settings['default'],
+            self.alias: {'ENGINE': 'bankproject.sqlite', 'NAME': self.path},
+        })[self.alias]
+        self.addCleanup(forget_database, self.alias)
+
+    def pragma(self, name):
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_every_connection_is_tuned(self):
+        self.assertEqual(
+            [self.pragma(name) for name in ['journal_mode', 'busy_timeout', 'synchronous']],
+            ['wal', 5000, 1],
+        )
+
+    def test_money_movement_takes_the_write_lock_up_front(self):
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with transaction.atomic(using=self.alias):
+            connections[self.alias].cursor().execute('SELECT 1')
+            # A plain transaction has taken no lock yet
+            other.execute('BEGIN IMMEDIATE')
+            other.execute('ROLLBACK')
+        with money_movement(using=self.alias):
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+
+    def test_benchmark_completes_every_transfer_on_the_profile(self):
+        call_command('benchmark_sqlite_writes', threads=2, transfers=5, stdout=(output := StringIO()))
+        for alias in ['benchmark_stock', 'benchmark_high-concurrency']:
+            forget_database(alias)
+        self.assertRegex(output.getvalue(), r'high-concurrency: .* 10 completed, 0 failed')
+
+@plain_static
+class BalanceHistoryTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.today = timezone.localdate()
+        BankAccount.objects.filter(id=self.account.id).update(created_at=timezone.now() - timedelta(days=10))
+        self.backdate(add_transaction(self.account, 'Paycheck', amount='30.00'), days=2)
+        self.backdate(add_transaction(self.account, 'Groceries', transaction_type='WITHDRAWAL', amount='10.00'), days=1)
+        call_command('close_daily_balances', backfill_days=2, stdout=StringIO())
+        self.client.force_login(self.account.user)
+        self.url = reverse('banking:api_balance_history', args=[self.account.id])
+
+    def backdate(self, txn, days):
+        Transaction.objects.filter(id=txn.id).update(timestamp=timezone.now() - timedelta(days=days))
+        return refreshed(txn)
+
+    def test_series_works_back_from_the_live_balance(self):
+        self.assertEqual(self.client.get(self.url, {'days': 3}).json(), {
+            'account_id': self.account.id,
+            'start': (self.today - timedelta(days=3)).isoformat(),
+            'balances': ['80.00', '110.00', '100.00', '100.00'],
+        })
+
+    def test_backdated_completion_moves_closed_days(self):
+        txn = self.backdate(add_transaction(self.account, 'Late refund', status='PENDING'), days=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            txn.status = 'COMPLETED'
+            txn.save()
+        self.assertEqual(self.client.get(self.url, {'days': 3}).json()['balances'], ['80.00', '115.00', '105.00', '100.00'])
+
+    def test_bad_requests_are_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'days': 'all'}).status_code, 400)
+        other = make_account('bob', account_number='1000000002')
+        self.assertEqual(self.client.get(reverse('banking:api_balance_history', args=[other.id])).status_code, 404)
+
+    def test_dashboard_embeds_the_series(self):
+        response = self.client.get(reverse('banking:dashboard'))
+        self.assertEqual(response.context['balance_series']['balances'][-1], '100.00')
+        self.assertContains(response, 'id="balance-series"')
+
+@plain_static
+class ScheduleTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account()
+        self.card = make_card(self.account.user, current_balance='500.00')
+        self.client.force_login(self.account.user)
+
+    def schedule(self, frequency, start_date, **kwargs):
+        return PaymentSchedule.objects.create(user=self.account.user, credit_card=self.card, source_account=self.account,
+                                              amount=Decimal('25.00'), frequency=frequency, start_date=start_date,
+                                              next_due=start_date, **kwargs)
+
+    def due_dates(self, schedule):
+        return [str(day) for day in schedule.occurrences.order_by('scheduled_date').values_list('scheduled_date', flat=True)]
+
+    def test_monthly_on_a_late_day_falls_on_shorter_months_last_day(self):
+        schedule = self.schedule('MONTHLY', datetime.date(2027, 1, 31), day_of_month=31)
+        schedules.expand_schedules(PaymentSchedule.objects.all(), until=datetime.date(2027, 4, 29))
+        self.assertEqual(self.due_dates(schedule), ['2027-01-31', '2027-02-28', '2027-03-31'])
+        self.assertEqual(refreshed(schedule).next_due, datetime.date(2027, 4, 30))
+        # A later expansion picks up from next_due without repeating any
+        self.assertEqual(schedules.expand_schedules(PaymentSchedule.objects.all(), until=datetime.date(2027, 4, 30)), 1)
+        self.assertEqual(len(self.due_dates(schedule)), 4)
+
+    def test_biweekly_stops_at_its_end_date(self):
+        schedule = self.schedule('BIWEEKLY', datetime.date(2027, 1, 1), end_date=datetime.date(2027, 1, 31))
+        schedules.expand_due(until=datetime.date(2027, 6, 1))
+        self.assertEqual(self.due_dates(schedule), ['2027-01-01', '2027-01-15', '2027-01-29'])
+        self.assertFalse(refreshed(schedule).is_active)
+
+    def test_recurring_payment_from_the_card_page(self):
+        start = timezone.localdate() + timedelta(days=3)
+        self.client.post(reverse('banking:pay_balance', args=[self.card.id]), {
+            'amount': '25.00', 'payment_method': 'checking', 'payment_date': 'scheduled',
+            'scheduled_date': start.isoformat(), 'repeat': 'MONTHLY',
+        })
+        schedule = PaymentSchedule.objects.get()
+        self.assertEqual((schedule.day_of_month, self.due_dates(schedule)[0]), (start.day, start.isoformat()))
+
+        self.client.post(reverse('banking:scheduled_payments'), {'action': 'stop', 'schedule_id': schedule.id})
+        self.assertFalse(refreshed(schedule).is_active)
+        self.assertEqual(set(schedule.occurrences.values_list('status', flat=True)), {'CANCELLED'})
+
+    def test_listing_is_paginated_without_a_query_per_row(self):
+        def listing_queries(count):
+            ScheduledPayment.objects.bulk_create([
+                ScheduledPayment(user=self.account.user, credit_card=self.card, source_account=self.account,
+                                 amount=Decimal('5.00'), scheduled_date=datetime.date(2027, 1, 1) + timedelta(days=n))
+                for n in range(count)
+            ])
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('banking:scheduled_payments'))
+            return len(queries), response
+
+        few, _ = listing_queries(3)
+        many, response = listing_queries(40)
+        self.assertEqual(few, many)
+        self.assertEqual((len(response.context['scheduled_payments']), response.context['page_obj'].paginator.num_pages), (25, 2))
+
+class ShardTransferTests(BankTestCase):
+    # Both ends on one database: the handlers only see the shard alias in the payload
+    def setUp(self):
+        self.recipient = make_account('bob', balance='0.00', account_number='2000000002')
+        self.payload = {
+            'reference': f'{current_shard()}-1', 'shard': current_shard(), 'from_account': '1000000001',
+            'to_account': self.recipient.account_number, 'amount': '25.00', 'description': 'rent',
+        }
+
+    def test_opening_twice_creates_one_deposit(self):
+        shard_transfers.open_inbound(self.payload)
+        shard_transfers.open_inbound(self.payload)
+        deposit = Transaction.objects.get(account=self.recipient)
+        self.assertEqual((deposit.status, deposit.amount), ('PENDING', Decimal('25.00')))
+        self.assertEqual(InboundTransfer.objects.count(), 1)
+
+    def test_settling_credits_once(self):
+        shard_transfers.open_inbound(self.payload)
+        shard_transfers.settle_inbound(self.payload)
+        shard_transfers.settle_inbound(self.payload)
+        self.assertEqual(refreshed(self.recipient).balance, Decimal('25.00'))
+        self.assertEqual(Transaction.objects.get(account=self.recipient).status, 'COMPLETED')
+
+    def test_settling_after_the_deposit_was_declined_credits_nothing(self):
+        shard_transfers.open_inbound(self.payload)
+        shard_transfers.decline_inbound(Transaction.objects.get(account=self.recipient))
+        shard_transfers.settle_inbound(self.payload)
+        self.assertEqual(refreshed(self.recipient).balance, Decimal('0.00'))
+        self.assertEqual(InboundTransfer.objects.get().status, 'CANCELLED')
+
+    def test_closing_before_opening_fails_for_retry(self):
+        with self.assertRaises(InboundTransfer.DoesNotExist):
+            shard_transfers.settle_inbound(self.payload)
+
+def drain():
+    call_command('drain_outbox', stdout=StringIO())
+
+@skipUnless(len(settings.SHARDS) >= 2, 'Needs two user shards, e.g. SQLITE_SHARDS=2')
+@plain_static
+@override_settings(CARD_NETWORK_KEY='network-secret')
+class TwoShardTests(BankTestCase):
+    all_shards = True
+
+    def setUp(self):
+        cache.clear()
+        self.sender_shard, self.recipient_shard = settings.SHARDS[:2]
+        self.alice = self.customer(self.sender_shard, '1000000001')
+        self.bob = self.customer(self.recipient_shard, '2000000002', balance='0.00')
+        self.staff = User.objects.create_user('staff', password='secret-pass-123', is_staff=True)
+
+    def customer(self, shard, account_number, balance='100.00'):
+        # Users are placed by id, so sign up until one lands on the shard
+        while True:
+            user = User.objects.create_user(f'user{User.objects.count()}', password='secret-pass-123')
+            if shard_for_user(user.pk) == shard:
+                break
+        with use_shard(shard), self.captureOnCommitCallbacks(execute=True):
+            return BankAccount.objects.create(user=user, account_number=account_number, balance=Decimal(balance))
+
+    def send(self):
+        self.client.force_login(self.alice.user)
+        self.client.post(reverse('banking:send_money'),
+                         {'from_account': self.alice.id, 'account_number': self.bob.account_number, 'amount': '25.00'})
+        drain()
+        with use_shard(self.sender_shard):
+            withdrawal = Transaction.objects.get(account_id=self.alice.id)
+        with use_shard(self.recipient_shard):
+            deposit = Transaction.objects.get(account_id=self.bob.id)
+        self.assertEqual((withdrawal.status, deposit.status), ('PENDING', 'PENDING'))
+        return withdrawal, deposit
+
+    def review(self, shard, transaction_obj, action):
+        self.client.force_login(self.staff)
+        url = reverse('banking:admin_approve_transaction', args=[transaction_obj.id])
+        self.client.post(f'{url}?shard={shard}', {'action': action})
+
+    def state(self, shard, obj):
+        with use_shard(shard):
+            return refreshed(obj)
+
+    def test_approved_transfer_is_credited_on_the_recipients_shard(self):
+        withdrawal, deposit = self.send()
+        self.review(self.sender_shard, withdrawal, 'approve')
+        drain()
+        alice, bob = self.state(self.sender_shard, self.alice), self.state(self.recipient_shard, self.bob)
+        self.assertEqual((alice.balance, alice.held_amount, bob.balance), (Decimal('75.00'), 0, Decimal('25.00')))
+        self.assertEqual(self.state(self.recipient_shard, deposit).status, 'COMPLETED')
+
+    def test_rejecting_the_deposit_cancels_the_withdrawal(self):
+        withdrawal, deposit = self.send()
+        self.review(self.recipient_shard, deposit, 'reject')
+        drain()
+        self.assertEqual(self.state(self.sender_shard, withdrawal).status, 'CANCELLED')
+        alice = self.state(self.sender_shard, self.alice)
+        self.assertEqual((alice.balance, alice.held_amount), (Decimal('100.00'), 0))
+
+    def test_withdrawal_approved_before_the_decline_arrives_is_refunded_once(self):
+        withdrawal, deposit = self.send()
+        self.review(self.recipient_shard, deposit, 'reject')
+        self.review(self.sender_shard, withdrawal, 'approve')
+        drain()
+        drain()
+        with use_shard(self.recipient_shard):
+            self.assertEqual(InboundTransfer.objects.get().status, 'CANCELLED')
+        self.assertEqual(self.state(self.recipient_shard, deposit).status, 'CANCELLED')
+        self.assertEqual(self.state(self.recipient_shard, self.bob).balance, Decimal('0.00'))
+        self.assertEqual(self.state(self.sender_shard, self.alice).balance, Decimal('100.00'))
+        with use_shard(self.sender_shard):
+            self.assertEqual(Transaction.objects.filter(description__startswith='Reversal').count(), 1)
+
+    def test_card_network_finds_the_cards_shard(self):
+        with use_shard(self.sender_shard):
+            other = make_card(self.alice.user)
+        with use_shard(self.recipient_shard), self.captureOnCommitCallbacks(execute=True):
+            card = make_card(self.bob.user, credit_limit='500')
+        self.assertEqual(CardDirectory.objects.get(card_number=card.card_number).shard, self.recipient_shard)
+
+        def authorize(card_number):
+            return self.client.post(reverse('banking:api_card_authorizations', args=[card_number]),
+                                    {'amount': '100', 'merchant': 'Shop', 'reference': card_number},
+                                    content_type='application/json', HTTP_X_CARD_NETWORK_KEY='network-secret')
+
+        self.assertEqual(authorize(card.card_number).status_code, 201)
+        self.assertEqual(self.state(self.recipient_shard, card).held_amount, Decimal('100.00'))
+        # Never registered, like a card issued before the directory existed
+        self.assertEqual(authorize(other.card_number).status_code, 404)
+        self.assertEqual(self.state(self.sender_shard, other).held_amount, 0)
+
+class AuditChainTests(TransactionTestCase):
+    # The writer chains entries in a transaction of its own; with shards the log is on the directory
+    databases = '__all__'
+
+    def setUp(self):
+        audit.write_entries([audit.audit_entry('test.action', None, {'n': n}) for n in range(3)])
+
+    def problems(self):
+        return [problem for _, problem in audit.verify_chain() if problem]
+
+    def test_intact_chain_verifies(self):
+        self.assertEqual(AuditEntry.objects.count(), 3)
+        self.assertEqual(self.problems(), [])
+
+    def test_edited_entry_is_detected(self):
+        entry = AuditEntry.objects.order_by('id')[1]
+        AuditEntry.objects.filter(id=entry.id).update(details={'n': 99})
+        self.assertEqual(len(self.problems()), 1)
+
+    def test_removed_entry_is_detected(self):
+        AuditEntry.objects.order_by('id')[1].delete()
+        self.assertEqual(len(self.problems()), 1)
+        with self.assertRaisesMessage(CommandError, '1 broken links in the first 2 entries'):
+            call_command('verify_audit_log', stdout=StringIO(), stderr=StringIO())
+
+    def test_entries_are_written_once_the_change_commits(self):
+        with transaction.atomic():
+            audit.record('test.committed', actor=None, n=3)
+            self.assertFalse(AuditEntry.objects.filter(action='test.committed').exists())
+        audit.writer.flush()
+        entry = AuditEntry.objects.get(action='test.committed')
+        self.assertEqual(entry.details['n'], 3)
+        self.assertEqual(self.problems(), [])
+
+@plain_static
+class ResolverTests(BankTestCase):
+    def setUp(self):
+        self.account = make_account(account_type='CHECKING', is_primary=True)
+        self.user = self.account.user
+        self.savings = BankAccount.objects.create(user=self.user, account_type='SAVINGS', account_number='1000000002',
+                                                  balance=Decimal('10.00'))
+        self.card = make_card(self.user, current_balance='50')
+        self.other = make_account('bob', account_number='2000000002')
+        self.other_card = make_card(self.other.user, current_balance='50')
+
+    def test_accounts_and_cards_are_each_read_once(self):
+        resolver = AccountResolver(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual((resolver.checking, resolver.savings, resolver.primary), (self.account, self.savings, self.account))
+            self.assertEqual(resolver.get_account(str(self.savings.id)), self.savings)
+        with self.assertNumQueries(1):
+            self.assertEqual(resolver.get_card(self.card.id), self.card)
+            self.assertEqual(resolver.cards, [self.card])
+
+    def test_only_the_users_own_rows_are_found(self):
+        resolver = AccountResolver(self.user)
+        with self.assertRaises(BankAccount.DoesNotExist):
+            resolver.get_account(self.other.id)
+        with self.assertRaises(CreditCard.DoesNotExist):
+            resolver.get_card(self.other_card.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(AccountResolver(AnonymousUser()).accounts, [])
+
+    def test_dashboard_queries_do_not_grow_with_cards(self):
+        self.client.force_login(self.user)
+
+        def dashboard_queries():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(reverse('banking:dashboard')).status_code, 200)
+            return len(queries)
+
+        few = dashboard_queries()
+        for _ in range(3):
+            make_card(self.user)
+        self.assertEqual(dashboard_queries(), few)
+
+    def test_another_users_card_cannot_be_paid(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('banking:pay_balance', args=[self.other_card.id]),
+                                    {'amount': '20.00', 'payment_method': 'checking', 'payment_date': 'today'})
+        self.assertRedirects(response, reverse('banking:dashboard'), fetch_redirect_response=False)
+        self.assertEqual(refreshed(self.other_card).current_balance, Decimal('50.00'))
+        self.assertEqual(refreshed(self.account).balance, Decimal('100.00'))
+
+class InternalAccountTests(BankTestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # With shards the filter is loaded from the account directory
+            self.account = make_account()
+
+    def open_account(self, account_id, account_number):
+        # Given ids, so that a later account can commit below an earlier one's
+        if is_sharded():
+            AccountDirectory.objects.create(id=account_id, account_number=account_number, shard=current_shard())
+        else:
+            BankAccount.objects.create(id=account_id, user=User.objects.create_user(account_number),
+                                       account_number=account_number, balance=0)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        numbers = [f'{n:010d}' for n in range(1000)]
+        for number in numbers:
+            bloom.add(number)
+        self.assertTrue(all(number in bloom for number in numbers))
+        false_positives = sum(f'9{n:09d}' in bloom for n in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_accounts_are_found(self):
+        numbers = InternalAccountNumbers()
+        self.assertTrue(numbers.might_exist('1000000001'))
+        with self.captureOnCommitCallbacks(execute=True):
+            make_account('bob', account_number='2000000002')
+        numbers.refresh()
+        self.assertTrue(numbers.might_exist('2000000002'))
+        self.assertTrue(is_internal('2000000002'))
+        self.assertFalse(is_internal('3000000003'))
+
+    def test_ids_committed_out_of_order_are_read_again(self):
+        self.open_account(1000, '4000000004')
+        numbers = InternalAccountNumbers()
+        numbers.refresh()
+        # Took its id before the one above but committed after the refresh
+        self.open_account(900, '5000000005')
+        numbers.refresh()
+        self.assertTrue(numbers.might_exist('5000000005'))
+
+    def test_external_approval_of_one_of_our_accounts_is_refused(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_account('bob', account_number='2000000002')
+        withdrawal = add_transaction(self.account, 'Pending external transfer from 1000000001 to 2000000002: rent',
+                                     transaction_type='WITHDRAWAL', status='PENDING')
+        self.client.force_login(User.objects.create_user('staff', password='secret-pass-123', is_staff=True))
+        self.client.post(reverse('banking:admin_approve_transaction', args=[withdrawal.id]), {'action': 'approve'})
+        self.assertEqual(refreshed(withdrawal).status, 'PENDING')
+        self.assertFalse(ExternalPayout.objects.exists())
+        self.assertEqual(refreshed(self.account).balance, Decimal('100.00'))
+
+calls = []
+
+@jobs.job('tests.record')
+def record_call(value):
+    calls.append(value)
+
+@jobs.job('tests.fail')
+def always_fail():
+    raise RuntimeError('boom')
+
+class JobTests(BankTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_claims_by_priority_then_runs(self):
+        jobs.enqueue('tests.record', value='later')
+        jobs.enqueue('tests.record', priority=1, value='first')
+        job = jobs.claim('worker-1')
+        self.assertEqual((job.kwargs, refreshed(job).status), ({'value': 'first'}, 'RUNNING'))
+        self.assertTrue(jobs.run(job))
+        self.assertEqual(calls, ['first'])
+        self.assertEqual(refreshed(job).status, 'DONE')
+
+    def test_delayed_job_is_not_due(self):
+        jobs.enqueue('tests.record', delay=timedelta(minutes=5), value='x')
+        self.assertIsNone(jobs.claim('worker-1'))
+
+    def test_failure_retries_then_gives_up(self):
+        jobs.enqueue('tests.fail', max_attempts=2)
+        job = jobs.claim('worker-1')
+        self.assertFalse(jobs.run(job))
+        job = refreshed(job)
+        self.assertEqual((job.status, job.attempts), ('PENDING', 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIsNone(jobs.claim('worker-1'))
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        with self.assertLogs('banking.jobs', 'ERROR'):
+            self.assertFalse(jobs.run(jobs.claim('worker-1')))
+        job = refreshed(job)
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+        self.assertIn('boom', job.last_error)
+
+    def test_stale_running_job_is_requeued(self):
+        job = jobs.enqueue('tests.record', value='x')
+        jobs.claim('worker-1')
+        Job.objects.filter(id=job.id).update(started_at=timezone.now() - jobs.STALE_AFTER - timedelta(minutes=1))
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(refreshed(job).status, 'PENDING')
+
+    def test_unknown_job_is_refused(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('tests.missing')
+
+    def test_queued_command_runs_on_the_worker(self):
+        call_command('enqueue_command', 'generate_statements', '--month', '2026-09', stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('enqueue_command', 'no_such_command', stdout=StringIO())
+
+        out = StringIO()
+        with mock.patch.object(jobs, 'call_command') as command:
+            call_command('run_jobs', stdout=out)
+        command.assert_called_once_with('generate_statements', '--month', '2026-09')
+        self.assertIn('Ran 1 jobs, 0 failed attempts', out.getvalue())
+        self.assertEqual(Job.objects.get().status, 'DONE')
@@ -1,28 +1,53 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
+from .ratelimit import client_ip, ratelimit, session_cookie, ip_and_username, login_username
+
+# Credential stuffing: cap attempts per address and per targeted username
+login_limit = ratelimit('login', '5/m', keys=(ip_and_username,))
+login_burst_limit = ratelimit('login-burst', '30/m', keys=(client_ip,))
+# Guessing one password from many addresses; looser, since anyone can spend a victim's tokens
+login_account_limit = ratelimit('login-account', '30/h', keys=(login_username,))
+
+# Money movement: per signed-in session, with a looser per-address ceiling
+money_limit = ratelimit('money', '10/m', keys=(session_cookie,))
+money_burst_limit = ratelimit('money-burst', '60/m', keys=(client_ip,))
+
+def limit_login(view):
+    return login_burst_limit(login_account_limit(login_limit(view)))
+
+def limit_money(view):
+    return money_burst_limit(money_limit(view))
 
 app_name = 'banking'
 
 urlpatterns = [
     path('', views.homepage, name='homepage'),
-    path('login/', views.CustomLoginView.as_view(), name='login'),
+    path('login/', limit_login(views.CustomLoginView.as_view()), name='login'),
     path('register/', views.RegisterView.as_view(), name='register'),
     path('dashboard/', views.DashboardView.as_view(), name='dashboard'),
     path('transactions/', views.transaction_history, name='transaction_history'),
-    path('send-money/', views.send_money, name='send_money'),
+    path('transactions/analytics/', views.spending_analytics, name='spending_analytics'),
+    path('send-money/', limit_money(views.send_money), name='send_money'),
     path('logout/', auth_views.LogoutView.as_view(next_page='banking:login'), name='logout'),
     path('open-savings/', views.open_savings_account, name='open_savings_account'),
     path('setup-direct-deposit/', views.setup_direct_deposit, name='setup_direct_deposit'),
     path('apply-credit-card/', views.apply_for_credit_card, name='apply_credit_card'),
-    path('transfer/', views.transfer_between_accounts, name='transfer'),
-    path('transfer-to-savings/', views.transfer_to_savings, name='transfer_to_savings'),
-    path('transfer-from-savings/', views.transfer_from_savings, name='transfer_from_savings'),
-    path('deposit/', views.deposit, name='deposit'),
+    path('transfer/', limit_money(views.transfer_between_accounts), name='transfer'),
+    path('transfer-to-savings/', limit_money(views.transfer_to_savings), name='transfer_to_savings'),
+    path('transfer-from-savings/', limit_money(views.transfer_from_savings), name='transfer_from_savings'),
+    path('deposit/', limit_money(views.deposit), name='deposit'),
     path('order-checks/', views.order_checks, name='order_checks'),
     path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin_dashboard/stream/', views.admin_review_stream, name='admin_review_stream'),
     path('admin/approve-transaction/<int:transaction_id>/', views.admin_approve_transaction, name='admin_approve_transaction'),
     path('admin/reject-transaction/<int:transaction_id>/', views.admin_reject_transaction, name='admin_reject_transaction'),
-    path('pay-balance/<int:card_id>/', views.pay_balance, name='pay_balance'),
+    path('pay-balance/<int:card_id>/', limit_money(views.pay_balance), name='pay_balance'),
     path('scheduled-payments/', views.scheduled_payments, name='scheduled_payments'),
+    path(f'api/{api.API_VERSION}/accounts/', api.accounts, name='api_accounts'),
+    path(f'api/{api.API_VERSION}/accounts/<int:account_id>/balance-history/', api.balance_history, name='api_balance_history'),
+    path(f'api/{api.API_VERSION}/credit-cards/', api.credit_cards, name='api_credit_cards'),
+    path(f'api/{api.API_VERSION}/transactions/', api.transactions, name='api_transactions'),
+    path(f'api/{api.API_VERSION}/scheduled-payments/', api.scheduled_payments, name='api_scheduled_payments'),
+    path(f'api/{api.API_VERSION}/cards/<str:card_number>/authorizations/', api.card_authorizations, name='api_card_authorizations'),
 ]
\ No newline at end of file
@@ -0,0 +1,103 @@
+from django.core.cache import cache
+from decimal import Decimal
+import time
+
+# Sliding windows, each approximated by fixed sub-buckets: (window seconds, bucket seconds)
+WINDOWS = {
+    '1m': (60, 10),
+    '1h': (60 * 60, 5 * 60),
+    '24h': (24 * 60 * 60, 60 * 60),
+}
+
+# Per window: (max transfers, max amount). Over FLAG_LIMITS the transfer goes
+# through but is reported to reviewers; over BLOCK_LIMITS it is refused.
+FLAG_LIMITS = {
+    'account': {'1m': (3, Decimal('2000')), '1h': (10, Decimal('5000')), '24h': (20, Decimal('10000'))},
+    'recipient': {'1m': (3, Decimal('2000')), '1h': (8, Decimal('5000')), '24h': (15, Decimal('10000'))},
+}
+BLOCK_LIMITS = {
+    'account': {'1m': (5, Decimal('5000')), '1h': (20, Decimal('10000')), '24h': (50, Decimal('25000'))},
+    'recipient': {'1m': (5, Decimal('5000')), '1h': (15, Decimal('10000')), '24h': (40, Decimal('25000'))},
+}
+
+class VelocityDecision:
+    def __init__(self, flags, blocks, counted=()):
+        self.flags = flags
+        self.blocks = blocks
+        # (cache key, delta, timeout) added for this transfer, so it can be taken back out
+        self.counted = counted
+
+    @property
+    def blocked(self):
+        return bool(self.blocks)
+
+    @property
+    def flagged(self):
+        return bool(self.flags)
+
+def bucket_keys(scope, key, window, now):
+    span, step = WINDOWS[window]
+    current = int(now // step)
+    return [f'velocity:{scope}:{key}:{window}:{bucket}' for bucket in range(current - span // step + 1, current + 1)]
+
+def window_totals(scope, key, now):
+    """(count, amount) per window for one key, read in a single cache round trip"""
+    keys = {window: bucket_keys(scope, key, window, now) for window in WINDOWS}
+    wanted = [f'{bucket}:{metric}' for buckets in keys.values() for bucket in buckets for metric in ('n', 'c')]
+    values = cache.get_many(wanted)
+    return {
+        window: (
+            sum(values.get(f'{bucket}:n', 0) for bucket in buckets),
+            Decimal(sum(values.get(f'{bucket}:c', 0) for bucket in buckets)) / 100,
+        )
+        for window, buckets in keys.items()
+    }
+
+def increment(key, delta, timeout):
+    # add() is a no-op when the bucket already exists; incr() is atomic on shared caches
+    cache.add(key, 0, timeout)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, timeout)
+
+def count_transfer(sender_account_number, recipient_account_number, amount, now):
+    """Add a transfer to every window's current bucket; returns what was added"""
+    cents = int(Decimal(str(amount)) * 100)
+    counted = []
+    for scope, key in (('account', sender_account_number), ('recipient', recipient_account_number)):
+        for window, (span, step) in WINDOWS.items():
+            bucket = bucket_keys(scope, key, window, now)[-1]
+            counted += [(f'{bucket}:n', 1, span + step), (f'{bucket}:c', cents, span + step)]
+    for cache_key, delta, timeout in counted:
+        increment(cache_key, delta, timeout)
+    return counted
+
+def reserve_transfer(sender_account_number, recipient_account_number, amount):
+    """Count a transfer, then judge it by totals that include it; a blocked one is taken back out"""
+    now = time.time()
+    # Counted before the check, so two requests racing each see the other and cannot both slip under a limit
+    counted = count_transfer(sender_account_number, recipient_account_number, amount, now)
+    flags, blocks = [], []
+    for scope, key in (('account', sender_account_number), ('recipient', recipient_account_number)):
+        for window, (count, total) in window_totals(scope, key, now).items():
+            block_count, block_amount = BLOCK_LIMITS[scope][window]
+            flag_count, flag_amount = FLAG_LIMITS[scope][window]
+            if count > block_count or total > block_amount:
+                blocks.append(f'{scope} {window}: {count} transfers / ${total}')
+            elif count > flag_count or total > flag_amount:
+                flags.append(f'{scope} {window}: {count} transfers / ${total}')
+    decision = VelocityDecision(flags, blocks, counted)
+    if decision.blocked:
+        release_transfer(decision)
+    return decision
+
+def release_transfer(decision):
+    """Take a reserved transfer back out of the windows, when it was refused or did not go through"""
+    for cache_key, delta, timeout in decision.counted:
+        try:
+            cache.decr(cache_key, delta)
+        except ValueError:
+            # The bucket has expired already
+            pass
+    decision.counted = ()
@@ -6,11 +6,32 @@ from django.views.generic import TemplateView, CreateView, ListView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.contrib.auth.models import User
+from django.conf import settings
 from django.urls import reverse_lazy
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
 from django.db import transaction, models
 from django.utils import timezone
 from datetime import timedelta
-from .models import BankAccount, Transaction, CreditCard, ScheduledPayment
+from .models import BankAccount, Transaction, CreditCard, PaymentSchedule, ScheduledPayment, ExternalPayout
+from .search import search_transactions
+from .archive import archived_transactions
+from .balance_history import balance_series
+from .analytics import INTERVALS, cached_spending_buckets
+from .conditional import conditional_account_page
+from .internal_accounts import internal_accounts, is_internal
+from .outbox import publish
+from . import audit, cards, holds, shard_transfers, velocity
+from .locking import money_movement
+from .review_feed import KEEPALIVE_INTERVAL, STREAM_LIFETIME, feed, format_event
+from .schedules import create_schedule, expand_schedules, stop_schedule
+from .sharding import current_shard, remote_shard, shard_for_user, use_shard
+import asyncio
+from itertools import chain
 import random
 import string
 import datetime
@@ -43,41 +64,45 @@ class RegisterView(CreateView):
         user.set_password(form.cleaned_data['password'])
         user.save()
         
-        # Create checking account for the new user
-        BankAccount.objects.create(
-            user=user,
-            account_type='CHECKING',
-            account_number=generate_account_number(),
-            balance=0.00,
-            is_primary=True
-        )
+        # Create checking account for the new user, on the user's shard
+        with use_shard(shard_for_user(user.pk)):
+            BankAccount.objects.create(
+                user=user,
+                account_type='CHECKING',
+                account_number=generate_account_number(),
+                balance=0.00,
+                is_primary=True
+            )
         
         messages.success(self.request, 'Account created successfully! Please login.')
         return super().form_valid(form)
 
+@method_decorator(conditional_account_page, name='dispatch')
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'banking/dashboard.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user = self.request.user
+        accounts = self.request.accounts
         
         # Get all accounts for the user
-        checking_account = BankAccount.objects.filter(user=user, account_type='CHECKING').first()
-        savings_account = BankAccount.objects.filter(user=user, account_type='SAVINGS').first()
-        credit_cards = CreditCard.objects.filter(user=user)
+        checking_account = accounts.checking
+        savings_account = accounts.savings
+        credit_cards = accounts.cards
         
         # Get primary account for transactions display
-        primary_account = BankAccount.objects.filter(user=user, is_primary=True).first() or checking_account
+        primary_account = accounts.primary
         
         if primary_account:
-            accounts = BankAccount.objects.filter(user=user)
             recent_transactions = Transaction.objects.filter(
-                account__in=accounts
+                account__in=accounts.accounts
             ).order_by('-timestamp')[:5]
         else:
             recent_transactions = []
         
+        # One indexed range read however long the history is
+        series = balance_series(primary_account) if primary_account else None
+
         # Calculate total balances
         total_deposit_balance = sum(account.balance for account in [checking_account, savings_account] if account)
         total_credit_used = sum(card.current_balance for card in credit_cards)
@@ -89,6 +114,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             'credit_cards': credit_cards,
             'primary_account': primary_account,
             'recent_transactions': recent_transactions,
+            'balance_series': series,
             'total_deposit_balance': total_deposit_balance,
             'total_credit_used': total_credit_used,
             'total_credit_available': total_credit_available
@@ -97,17 +123,19 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         return context
 
 @login_required
+@conditional_account_page
 def transaction_history(request):
     user = request.user
     account_id = request.GET.get('account_id')
     
     if account_id:
         account = get_object_or_404(BankAccount, id=account_id, user=user)
+        accounts = [account]
         transactions = account.transactions.all()
         account_name = f"{account.get_account_type_display()} ({account.account_number})"
     else:
         # Get all transactions for all accounts
-        accounts = BankAccount.objects.filter(user=user)
+        accounts = request.accounts.accounts
         transactions = Transaction.objects.filter(account__in=accounts)
         account_name = "All Accounts"
     
@@ -126,11 +154,35 @@ def transaction_history(request):
     if end_date:
         transactions = transactions.filter(timestamp__lte=end_date)
     
+    # Full-text search over descriptions, ranked by relevance
+    query = request.GET.get('q', '').strip()
+    if query:
+        transactions = search_transactions(transactions, query)
+    
+    # Closed months live in TransactionArchive; only a start date reaching back
+    # into them makes us read the archive as well
+    archived = archived_transactions(accounts, start_date, end_date, transaction_type) if start_date else []
+    if query:
+        terms = query.lower().split()
+        archived = [txn for txn in archived if all(term in txn.description.lower() for term in terms)]
+    if archived:
+        # Relevance ranks are not comparable with archived rows, so a merged list is newest first either way
+        transactions = sorted(chain(transactions, archived), key=lambda txn: txn.timestamp, reverse=True)
+    
+    page = Paginator(transactions, 25).get_page(request.GET.get('page'))
+    
+    # Keep the active filters when moving between pages
+    filters = request.GET.copy()
+    filters.pop('page', None)
+    
     # Get all accounts for the filter dropdown
-    all_accounts = BankAccount.objects.filter(user=user)
+    all_accounts = request.accounts.accounts
     
     return render(request, 'banking/transaction_history.html', {
-        'transactions': transactions,
+        'transactions': page.object_list,
+        'page_obj': page,
+        'filter_querystring': filters.urlencode(),
+        'query': query,
         'account_name': account_name,
         'transaction_types': Transaction.TRANSACTION_TYPES,
         'accounts': all_accounts,
@@ -138,7 +190,27 @@ def transaction_history(request):
     })
 
 @login_required
-@transaction.atomic
+def spending_analytics(request):
+    """Time-bucketed totals per account and transaction type, as JSON for charts"""
+    interval = request.GET.get('interval', 'week')
+    if interval not in INTERVALS:
+        return JsonResponse({'error': f'interval must be one of {", ".join(INTERVALS)}'}, status=400)
+    
+    today = timezone.now().date()
+    end = parse_date(request.GET.get('end_date') or '') or today
+    start = parse_date(request.GET.get('start_date') or '') or end - timedelta(days=90)
+    if start > end:
+        return JsonResponse({'error': 'start_date must not be after end_date'}, status=400)
+    
+    return JsonResponse({
+        'interval': interval,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'buckets': cached_spending_buckets(request.user, start, end, interval),
+    })
+
+@login_required
+@money_movement()
 def send_money(request):
     if request.method == 'POST':
         try:
@@ -152,16 +224,36 @@ def send_money(request):
                 return redirect('banking:send_money')
             
             # Get sender account
-            sender_account = get_object_or_404(BankAccount, id=account_id, user=request.user)
+            sender_account = request.accounts.get_account(account_id)
             
-            # Check if sender has sufficient funds
-            if sender_account.balance < amount:
+            # Check if sender has sufficient funds, net of transfers still pending
+            if sender_account.available_balance < amount:
                 messages.error(request, 'Insufficient funds.')
                 return redirect('banking:send_money')
             
+            # Velocity limits on the sender and the recipient, before anything is written
+            decision = velocity.reserve_transfer(sender_account.account_number, recipient_account_number, amount)
+            if decision.blocked:
+                publish('transfer.blocked', from_account=sender_account.account_number,
+                        to_account=recipient_account_number, amount=str(amount), reasons=decision.blocks)
+                messages.error(request, 'This transfer exceeds the allowed transfer frequency or volume. Please try again later or contact support.')
+                return redirect('banking:send_money')
+            
             # Find recipient account
-            # Try to get an internal account first
-            recipient_account_internal = BankAccount.objects.filter(account_number=recipient_account_number).first()
+            # Most recipients are at other banks; the filter rules those out without a query
+            recipient_account_internal = recipient_shard = None
+            if internal_accounts.might_exist(recipient_account_number):
+                # Try to get an internal account first
+                recipient_account_internal = BankAccount.objects.filter(account_number=recipient_account_number).first()
+                # Then one of ours on another shard
+                recipient_shard = remote_shard(recipient_account_number) if not recipient_account_internal else None
+
+            # Reserve the amount until a reviewer decides; the conditional update
+            # also stops concurrent requests from overdrawing the account
+            if not holds.place_hold(sender_account.id, amount):
+                velocity.release_transfer(decision)
+                messages.error(request, 'Insufficient funds.')
+                return redirect('banking:send_money')
 
             if recipient_account_internal:
                 # This is an internal transfer
@@ -171,7 +263,8 @@ def send_money(request):
                     transaction_type='WITHDRAWAL',
                     amount=amount,
                     status='PENDING',
-                    description=f'Pending internal transfer from {sender_account.account_number} to {recipient_account_internal.account_number}: {description}'
+                    description=f'Pending internal transfer from {sender_account.account_number} to {recipient_account_internal.account_number}: {description}',
+                    review_reasons=decision.flags,
                 )
                 
                 # Create deposit transaction for recipient (also pending)
@@ -180,8 +273,23 @@ def send_money(request):
                     transaction_type='DEPOSIT',
                     amount=amount,
                     status='PENDING',
-                    description=f'Pending internal transfer to {recipient_account_internal.account_number} from {sender_account.account_number}: {description}'
+                    description=f'Pending internal transfer to {recipient_account_internal.account_number} from {sender_account.account_number}: {description}',
+                    review_reasons=decision.flags,
+                )
+                messages.success(request, 'Your internal transfer request has been submitted and is pending approval.')
+
+            elif recipient_shard:
+                # Internal transfer to another shard: the recipient's pending deposit
+                # is created there from this shard's outbox
+                withdrawal = Transaction.objects.create(
+                    account=sender_account,
+                    transaction_type='WITHDRAWAL',
+                    amount=amount,
+                    status='PENDING',
+                    description=f'Pending internal transfer from {sender_account.account_number} to {recipient_account_number}: {description}',
+                    review_reasons=decision.flags,
                 )
+                shard_transfers.open_outbound(withdrawal, recipient_shard, recipient_account_number, description)
                 messages.success(request, 'Your internal transfer request has been submitted and is pending approval.')
 
             else:
@@ -192,10 +300,16 @@ def send_money(request):
                     transaction_type='WITHDRAWAL',
                     amount=amount,
                     status='PENDING',
-                    description=f'Pending external transfer from {sender_account.account_number} to {recipient_account_number}: {description}'
+                    description=f'Pending external transfer from {sender_account.account_number} to {recipient_account_number}: {description}',
+                    review_reasons=decision.flags,
                 )
                 messages.warning(request, f'Your transfer request to external account {recipient_account_number} has been submitted and is pending approval for external processing.')
 
+            # Flagged transfers wait in the review queue like any other, marked with the limits they went over
+            if decision.flagged:
+                publish('transfer.flagged', from_account=sender_account.account_number,
+                        to_account=recipient_account_number, amount=str(amount), reasons=decision.flags)
+            
             # Do not update balances here; it will happen upon admin approval for internal transfers
             # For external transfers, only the sender's balance will be updated upon admin approval.
             return redirect('banking:dashboard')
@@ -205,7 +319,7 @@ def send_money(request):
             return redirect('banking:send_money')
     
     # Get user's accounts for the dropdown
-    accounts = BankAccount.objects.filter(user=request.user)
+    accounts = request.accounts.accounts
     
     return render(request, 'banking/send_money.html', {
         'accounts': accounts
@@ -216,7 +330,7 @@ def open_savings_account(request):
     user = request.user
     
     # Check if user already has a savings account
-    if BankAccount.objects.filter(user=user, account_type='SAVINGS').exists():
+    if request.accounts.savings:
         messages.info(request, 'You already have a savings account.')
         return redirect('banking:dashboard')
     
@@ -262,12 +376,12 @@ def apply_for_credit_card(request):
     return render(request, 'banking/apply_credit_card.html')
 
 @login_required
-@transaction.atomic
+@money_movement()
 def transfer_between_accounts(request):
     user = request.user
-    accounts = BankAccount.objects.filter(user=user)
+    accounts = request.accounts.accounts
     
-    if accounts.count() < 2:
+    if len(accounts) < 2:
         messages.error(request, 'You need at least two accounts to make a transfer.')
         return redirect('banking:dashboard')
     
@@ -284,12 +398,17 @@ def transfer_between_accounts(request):
             messages.error(request, 'Please enter a valid amount.')
             return redirect('banking:transfer')
         
-        from_account = get_object_or_404(BankAccount, id=from_account_id, user=user)
-        to_account = get_object_or_404(BankAccount, id=to_account_id, user=user)
+        try:
+            from_account = request.accounts.get_account(from_account_id)
+            to_account = request.accounts.get_account(to_account_id)
+        except BankAccount.DoesNotExist:
+            raise Http404('No such account')
         
-        if from_account.balance < amount:
+        # Checked and debited in one conditional UPDATE, so concurrent requests cannot overdraw
+        if not holds.debit(from_account.id, amount):
             messages.error(request, 'Insufficient funds.')
             return redirect('banking:transfer')
+        holds.credit(to_account.id, amount)
         
         # Create transactions
         Transaction.objects.create(
@@ -308,11 +427,8 @@ def transfer_between_accounts(request):
             description=f'Transfer from {from_account.get_account_type_display()}'
         )
         
-        # Update balances
-        from_account.balance -= amount
-        to_account.balance += amount
-        from_account.save()
-        to_account.save()
+        publish('transfer.completed', kind='between_accounts', user_id=user.id,
+                from_account=from_account.account_number, to_account=to_account.account_number, amount=str(amount))
         
         messages.success(request, 'Transfer completed successfully.')
         return redirect('banking:dashboard')
@@ -362,12 +478,46 @@ def admin_dashboard(request):
         'pending_count': pending_count,
         'completed_count': completed_count,
         'rejected_count': rejected_count,
+        # Staff review one shard at a time; ShardMiddleware switches on ?shard=
+        'shards': settings.SHARDS,
+        'current_shard': current_shard(),
     }
     
     return render(request, 'banking/admin_dashboard.html', context)
 
+async def admin_review_stream(request):
+    """Server-sent events for the review queue: new PENDING transfers and decisions on them"""
+    is_staff = await sync_to_async(lambda: request.user.is_authenticated and request.user.is_staff)()
+    if not is_staff:
+        return HttpResponse(status=403)
+    
+    # A WSGI worker would be tied up for the whole stream; 204 tells EventSource not to retry
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    async def events():
+        queue = feed.subscribe()
+        loop = asyncio.get_running_loop()
+        closes_at = loop.time() + STREAM_LIFETIME
+        try:
+            yield 'retry: 5000\n\n'
+            while loop.time() < closes_at:
+                try:
+                    name, data = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                    yield format_event(name, data)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+        finally:
+            feed.unsubscribe(queue)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 @login_required
-@transaction.atomic
+@money_movement()
 def transfer_to_savings(request):
     if request.method == 'POST':
         try:
@@ -378,12 +528,15 @@ def transfer_to_savings(request):
                 return redirect('banking:transfer_to_savings')
             
             # Get user's accounts
-            checking_account = BankAccount.objects.get(user=request.user, account_type='CHECKING')
-            savings_account = BankAccount.objects.get(user=request.user, account_type='SAVINGS')
+            checking_account = request.accounts.checking
+            savings_account = request.accounts.savings
+            if not (checking_account and savings_account):
+                raise BankAccount.DoesNotExist
             
-            if checking_account.balance < amount:
+            if not holds.debit(checking_account.id, amount):
                 messages.error(request, 'Insufficient funds in checking account.')
                 return redirect('banking:transfer_to_savings')
+            holds.credit(savings_account.id, amount)
             
             # Create withdrawal transaction for checking account
             Transaction.objects.create(
@@ -403,12 +556,6 @@ def transfer_to_savings(request):
                 description=f'Transfer from checking account'
             )
             
-            # Update balances
-            checking_account.balance -= amount
-            savings_account.balance += amount
-            checking_account.save()
-            savings_account.save()
-            
             messages.success(request, 'Transfer to savings completed successfully.')
             return redirect('banking:dashboard')
             
@@ -419,7 +566,7 @@ def transfer_to_savings(request):
     return render(request, 'banking/transfer_to_savings.html')
 
 @login_required
-@transaction.atomic
+@money_movement()
 def transfer_from_savings(request):
     if request.method == 'POST':
         try:
@@ -430,12 +577,15 @@ def transfer_from_savings(request):
                 return redirect('banking:transfer_from_savings')
             
             # Get user's accounts
-            checking_account = BankAccount.objects.get(user=request.user, account_type='CHECKING')
-            savings_account = BankAccount.objects.get(user=request.user, account_type='SAVINGS')
+            checking_account = request.accounts.checking
+            savings_account = request.accounts.savings
+            if not (checking_account and savings_account):
+                raise BankAccount.DoesNotExist
             
-            if savings_account.balance < amount:
+            if not holds.debit(savings_account.id, amount):
                 messages.error(request, 'Insufficient funds in savings account.')
                 return redirect('banking:transfer_from_savings')
+            holds.credit(checking_account.id, amount)
             
             # Create withdrawal transaction for savings account
             Transaction.objects.create(
@@ -455,12 +605,6 @@ def transfer_from_savings(request):
                 description=f'Transfer from savings account'
             )
             
-            # Update balances
-            savings_account.balance -= amount
-            checking_account.balance += amount
-            savings_account.save()
-            checking_account.save()
-            
             messages.success(request, 'Transfer from savings completed successfully.')
             return redirect('banking:dashboard')
             
@@ -470,9 +614,25 @@ def transfer_from_savings(request):
     
     return render(request, 'banking/transfer_from_savings.html')
 
+def reject_transfer(request, transaction_obj, status):
+    """Close a pending transfer without moving money, on this shard and on the recipient's"""
+    transaction_obj.status = status
+    transaction_obj.save()
+    holds.release_hold(transaction_obj)
+    recipient_shard = shard_transfers.outbound_shard(transaction_obj)
+    if recipient_shard:
+        shard_transfers.cancel_outbound(transaction_obj, recipient_shard)
+    elif transaction_obj.transaction_type == 'DEPOSIT':
+        # The receiving side of a transfer from another shard
+        shard_transfers.decline_inbound(transaction_obj)
+    publish('transfer.rejected', transaction_id=transaction_obj.id, status=transaction_obj.status,
+            amount=str(transaction_obj.amount), rejected_by=request.user.id)
+    audit.record('transfer.rejected', actor=request.user.id, transaction_id=transaction_obj.id,
+                 amount=transaction_obj.amount)
+
 @login_required
 @user_passes_test(lambda u: u.is_staff) # Only staff can approve transactions
-@transaction.atomic
+@money_movement()
 def admin_approve_transaction(request, transaction_id):
     transaction_obj = get_object_or_404(Transaction, id=transaction_id)
 
@@ -491,8 +651,22 @@ def admin_approve_transaction(request, transaction_id):
                     # Handle Internal Transfer Approval
                     sender_acc_num = internal_match.group(1)
                     recipient_acc_num = internal_match.group(2)
+                    recipient_shard = shard_transfers.outbound_shard(transaction_obj)
                     
-                    if transaction_obj.transaction_type == 'WITHDRAWAL':
+                    if recipient_shard:
+                        # Recipient on another shard: debit here, credit there through the outbox
+                        holds.capture_hold(transaction_obj.account_id, transaction_obj.amount)
+                        transaction_obj.status = 'COMPLETED'
+                        transaction_obj.save()
+                        shard_transfers.settle_outbound(transaction_obj, recipient_shard)
+
+                        publish('transfer.completed', kind='internal', transaction_id=transaction_obj.id,
+                                from_account=sender_acc_num, to_account=recipient_acc_num,
+                                amount=str(transaction_obj.amount), approved_by=request.user.id)
+
+                        messages.success(request, 'Internal transfer approved; the recipient is credited on their shard.')
+
+                    elif transaction_obj.transaction_type == 'WITHDRAWAL':
                         try:
                             sender_account = BankAccount.objects.get(account_number=sender_acc_num)
                             recipient_account = BankAccount.objects.get(account_number=recipient_acc_num)
@@ -506,16 +680,18 @@ def admin_approve_transaction(request, transaction_id):
                             ).exclude(id=transaction_obj.id).first()
 
                             if recipient_transaction:
-                                sender_account.balance -= transaction_obj.amount
-                                recipient_account.balance += transaction_obj.amount
-                                sender_account.save()
-                                recipient_account.save()
+                                holds.capture_hold(sender_account.id, transaction_obj.amount)
+                                holds.credit(recipient_account.id, transaction_obj.amount)
 
                                 transaction_obj.status = 'COMPLETED'
                                 transaction_obj.save()
                                 recipient_transaction.status = 'COMPLETED'
                                 recipient_transaction.save()
 
+                                publish('transfer.completed', kind='internal', transaction_id=transaction_obj.id,
+                                        from_account=sender_acc_num, to_account=recipient_acc_num,
+                                        amount=str(transaction_obj.amount), approved_by=request.user.id)
+
                                 messages.success(request, 'Internal transfer approved and balances updated.')
                             else:
                                 messages.error(request, 'Corresponding deposit transaction not found for internal transfer. Approval failed.')
@@ -536,16 +712,18 @@ def admin_approve_transaction(request, transaction_id):
                             ).exclude(id=transaction_obj.id).first()
 
                             if sender_transaction:
-                                sender_account.balance -= transaction_obj.amount
-                                recipient_account.balance += transaction_obj.amount
-                                sender_account.save()
-                                recipient_account.save()
+                                holds.capture_hold(sender_account.id, transaction_obj.amount)
+                                holds.credit(recipient_account.id, transaction_obj.amount)
 
                                 transaction_obj.status = 'COMPLETED'
                                 transaction_obj.save()
                                 sender_transaction.status = 'COMPLETED'
                                 sender_transaction.save()
 
+                                publish('transfer.completed', kind='internal', transaction_id=sender_transaction.id,
+                                        from_account=sender_acc_num, to_account=recipient_acc_num,
+                                        amount=str(transaction_obj.amount), approved_by=request.user.id)
+
                                 messages.success(request, 'Internal transfer approved and balances updated.')
                             else:
                                 messages.error(request, 'Corresponding withdrawal transaction not found for internal transfer. Approval failed.')
@@ -559,18 +737,32 @@ def admin_approve_transaction(request, transaction_id):
                     sender_acc_num = external_match.group(1)
                     external_recipient_acc_num = external_match.group(2) # This is just for logging/description
 
-                    if transaction_obj.transaction_type == 'WITHDRAWAL':
+                    if transaction_obj.transaction_type == 'WITHDRAWAL' and is_internal(external_recipient_acc_num):
+                        # send_money's filter lagged behind a new account; never pay one of ours out externally
+                        messages.error(request, f'{external_recipient_acc_num} is an account of this bank. Reject this transfer and ask the customer to send it again.')
+                    elif transaction_obj.transaction_type == 'WITHDRAWAL':
                         try:
                             sender_account = BankAccount.objects.get(account_number=sender_acc_num)
                             
                             # Update sender's balance
-                            sender_account.balance -= transaction_obj.amount
-                            sender_account.save()
+                            holds.capture_hold(sender_account.id, transaction_obj.amount)
 
                             # Mark transaction as completed
                             transaction_obj.status = 'COMPLETED'
                             transaction_obj.save()
 
+                            # Queue the payout for the next settlement batch
+                            ExternalPayout.objects.create(
+                                transaction=transaction_obj,
+                                account=sender_account,
+                                recipient_account_number=external_recipient_acc_num,
+                                amount=transaction_obj.amount,
+                            )
+
+                            publish('transfer.completed', kind='external', transaction_id=transaction_obj.id,
+                                    from_account=sender_acc_num, to_account=external_recipient_acc_num,
+                                    amount=str(transaction_obj.amount), approved_by=request.user.id)
+
                             messages.success(request, f'External transfer to {external_recipient_acc_num} approved and sender\'s balance updated.')
                         except BankAccount.DoesNotExist:
                             messages.error(request, 'Sender account not found for external transfer. Approval failed.')
@@ -580,9 +772,12 @@ def admin_approve_transaction(request, transaction_id):
                 else:
                     messages.error(request, 'Could not parse account numbers from description. Unknown transfer type.')
 
+                if transaction_obj.status == 'COMPLETED':
+                    audit.record('transfer.approved', actor=request.user.id, transaction_id=transaction_obj.id,
+                                 amount=transaction_obj.amount)
+
             elif action == 'reject':
-                transaction_obj.status = 'CANCELLED'
-                transaction_obj.save()
+                reject_transfer(request, transaction_obj, 'CANCELLED')
                 messages.info(request, 'Transfer request rejected.')
             else:
                 messages.error(request, 'Invalid action.')
@@ -593,13 +788,12 @@ def admin_approve_transaction(request, transaction_id):
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
-@transaction.atomic
+@money_movement()
 def admin_reject_transaction(request, transaction_id):
     transaction_obj = get_object_or_404(Transaction, id=transaction_id)
     
     if transaction_obj.status == 'PENDING':
-        transaction_obj.status = 'REJECTED'
-        transaction_obj.save()
+        reject_transfer(request, transaction_obj, 'REJECTED')
         messages.info(request, 'Transaction has been rejected.')
     else:
         messages.warning(request, 'Transaction is not pending.')
@@ -607,14 +801,11 @@ def admin_reject_transaction(request, transaction_id):
     return redirect('banking:admin_dashboard')
 
 @login_required
-@transaction.atomic
+@money_movement()
 def deposit(request):
-    user = request.user
-    accounts = []
-    if hasattr(user, 'bankaccount'):
-        accounts.append(user.bankaccount)
-    if hasattr(user, 'savingsaccount'):
-        accounts.append(user.savingsaccount)
+    # Both are BankAccount rows; the legacy SavingsAccount model is not shown or credited here
+    checking_account = request.accounts.checking
+    savings_account = request.accounts.savings
 
     if request.method == 'POST':
         account_type = request.POST.get('account_type')
@@ -628,46 +819,32 @@ def deposit(request):
             messages.error(request, 'Invalid amount.')
             return redirect('banking:deposit')
 
-        if account_type == 'checking' and hasattr(user, 'bankaccount'):
-            account = user.bankaccount
-            Transaction.objects.create(
-                account=account,
-                transaction_type='DEPOSIT',
-                amount=amount,
-                status='COMPLETED',
-                description='Deposit to checking account'
-            )
-            account.balance += amount
-            account.save()
-            messages.success(request, f'Successfully deposited ${amount:.2f} to your checking account.')
-        elif account_type == 'savings' and hasattr(user, 'savingsaccount'):
-            account = user.savingsaccount
-            Transaction.objects.create(
-                savings_account=account,
-                transaction_type='DEPOSIT',
-                amount=amount,
-                status='COMPLETED',
-                description='Deposit to savings account'
-            )
-            account.balance += amount
-            account.save()
-            messages.success(request, f'Successfully deposited ${amount:.2f} to your savings account.')
-        else:
+        account = {'checking': checking_account, 'savings': savings_account}.get(account_type)
+        if not account:
             messages.error(request, 'Invalid account selection.')
             return redirect('banking:deposit')
+
+        Transaction.objects.create(
+            account=account,
+            transaction_type='DEPOSIT',
+            amount=amount,
+            status='COMPLETED',
+            description=f'Deposit to {account_type} account'
+        )
+        holds.credit(account.id, amount)
+        messages.success(request, f'Successfully deposited ${amount:.2f} to your {account_type} account.')
         return redirect('banking:dashboard')
 
     return render(request, 'banking/deposit.html', {
-        'has_checking': hasattr(user, 'bankaccount'),
-        'has_savings': hasattr(user, 'savingsaccount'),
-        'checking_balance': user.bankaccount.balance if hasattr(user, 'bankaccount') else None,
-        'savings_balance': user.savingsaccount.balance if hasattr(user, 'savingsaccount') else None,
+        'has_checking': checking_account is not None,
+        'has_savings': savings_account is not None,
+        'checking_balance': checking_account.balance if checking_account else None,
+        'savings_balance': savings_account.balance if savings_account else None,
     })
 
 @login_required
 def setup_direct_deposit(request):
-    user = request.user
-    checking_account = BankAccount.objects.filter(user=user, account_type='CHECKING').first()
+    checking_account = request.accounts.checking
     
     if not checking_account:
         messages.error(request, 'You need a checking account to set up direct deposit.')
@@ -692,8 +869,7 @@ def setup_direct_deposit(request):
 
 @login_required
 def order_checks(request):
-    user = request.user
-    checking_account = BankAccount.objects.filter(user=user, account_type='CHECKING').first()
+    checking_account = request.accounts.checking
     
     if not checking_account:
         messages.error(request, 'You need a checking account to order checks.')
@@ -736,15 +912,16 @@ def order_checks(request):
 @login_required
 def pay_balance(request, card_id):
     try:
-        credit_card = CreditCard.objects.get(id=card_id, user=request.user)
-        checking_account = BankAccount.objects.filter(user=request.user, account_type='CHECKING').first()
-        savings_account = BankAccount.objects.filter(user=request.user, account_type='SAVINGS').first()
+        credit_card = request.accounts.get_card(card_id)
+        checking_account = request.accounts.checking
+        savings_account = request.accounts.savings
         
         if request.method == 'POST':
             amount = Decimal(request.POST.get('amount', 0))
             payment_method = request.POST.get('payment_method')
             payment_date = request.POST.get('payment_date')
             scheduled_date = request.POST.get('scheduled_date')
+            repeat = request.POST.get('repeat')
             
             # Validate amount
             if amount <= 0 or amount > credit_card.current_balance:
@@ -763,35 +940,49 @@ def pay_balance(request, card_id):
                 return redirect('banking:pay_balance', card_id=card_id)
             
             # Check sufficient funds
-            if source_account.balance < amount:
+            if source_account.available_balance < amount:
                 messages.error(request, 'Insufficient funds in selected account.')
                 return redirect('banking:pay_balance', card_id=card_id)
             
             # Process payment
-            with transaction.atomic():
+            with money_movement():
                 if payment_date == 'today':
-                    # Deduct from source account
-                    source_account.balance -= amount
-                    source_account.save()
+                    # Deduct from source account, unless another request spent it since the check above
+                    if not holds.debit(source_account.id, amount):
+                        messages.error(request, 'Insufficient funds in selected account.')
+                        return redirect('banking:pay_balance', card_id=card_id)
                     
                     # Update credit card balance
-                    credit_card.current_balance -= amount
-                    credit_card.available_credit += amount
-                    credit_card.save()
+                    cards.apply_payment(credit_card.id, amount)
                     
                     # Create transaction record
                     Transaction.objects.create(
-                        user=request.user,
+                        account=source_account,
+                        transaction_type='WITHDRAWAL',
                         amount=amount,
-                        transaction_type='PAYMENT',
                         status='COMPLETED',
-                        description=f'Credit card payment for card ending in {credit_card.card_number[-4:]}',
-                        source_account=source_account,
-                        destination_account=None,
-                        credit_card=credit_card
+                        description=f'Credit card payment for card ending in {credit_card.card_number[-4:]}'
                     )
                     
+                    publish('card.payment', user_id=request.user.id, card_id=credit_card.id,
+                            source_account=source_account.account_number, amount=str(amount))
+                    
                     messages.success(request, 'Payment processed successfully.')
+                elif repeat in dict(PaymentSchedule.FREQUENCIES):
+                    # Recurring payment: occurrences are created as they come due
+                    start_date = parse_date(scheduled_date or '')
+                    if start_date is None:
+                        messages.error(request, 'Choose the date of the first payment.')
+                        return redirect('banking:pay_balance', card_id=card_id)
+                    day_of_month = request.POST.get('day_of_month', '')
+                    if day_of_month and not (day_of_month.isdigit() and 1 <= int(day_of_month) <= 31):
+                        messages.error(request, 'Day of month must be between 1 and 31.')
+                        return redirect('banking:pay_balance', card_id=card_id)
+                    create_schedule(
+                        request.user, credit_card, source_account, amount, repeat, start_date,
+                        day_of_month=int(day_of_month) if day_of_month else None,
+                    )
+                    messages.success(request, 'Recurring payment scheduled successfully.')
                 else:
                     # Schedule payment
                     ScheduledPayment.objects.create(
@@ -810,6 +1001,7 @@ def pay_balance(request, card_id):
             'credit_card': credit_card,
             'checking_account': checking_account,
             'savings_account': savings_account,
+            'frequencies': PaymentSchedule.FREQUENCIES,
             'today': timezone.now()
         }
         return render(request, 'banking/pay_balance.html', context)
@@ -821,12 +1013,20 @@ def pay_balance(request, card_id):
 @login_required
 def scheduled_payments(request):
     user = request.user
-    scheduled_payments = ScheduledPayment.objects.filter(user=user).order_by('scheduled_date')
     
     if request.method == 'POST':
         payment_id = request.POST.get('payment_id')
         action = request.POST.get('action')
         
+        if action == 'stop':
+            schedule = PaymentSchedule.objects.filter(id=request.POST.get('schedule_id'), user=user, is_active=True).first()
+            if schedule:
+                stop_schedule(schedule)
+                messages.success(request, 'Recurring payment stopped.')
+            else:
+                messages.error(request, 'Recurring payment not found.')
+            return redirect('banking:scheduled_payments')
+        
         try:
             payment = ScheduledPayment.objects.get(id=payment_id, user=user)
             
@@ -835,34 +1035,28 @@ def scheduled_payments(request):
                 payment.save()
                 messages.success(request, 'Payment cancelled successfully.')
             elif action == 'process' and payment.status == 'PENDING':
-                with transaction.atomic():
-                    # Check if source account has sufficient funds
-                    if payment.source_account.balance < payment.amount:
+                with money_movement():
+                    # Check the source account has the funds and take them in one step
+                    if not holds.debit(payment.source_account_id, payment.amount):
                         payment.status = 'FAILED'
                         payment.save()
                         messages.error(request, 'Insufficient funds for scheduled payment.')
                         return redirect('banking:scheduled_payments')
                     
-                    # Process the payment
-                    payment.source_account.balance -= payment.amount
-                    payment.source_account.save()
-                    
-                    payment.credit_card.current_balance -= payment.amount
-                    payment.credit_card.available_credit += payment.amount
-                    payment.credit_card.save()
+                    cards.apply_payment(payment.credit_card_id, payment.amount)
                     
                     # Create transaction record
                     Transaction.objects.create(
-                        user=user,
+                        account=payment.source_account,
+                        transaction_type='WITHDRAWAL',
                         amount=payment.amount,
-                        transaction_type='PAYMENT',
                         status='COMPLETED',
-                        description=f'Scheduled credit card payment for card ending in {payment.credit_card.card_number[-4:]}',
-                        source_account=payment.source_account,
-                        destination_account=None,
-                        credit_card=payment.credit_card
+                        description=f'Scheduled credit card payment for card ending in {payment.credit_card.card_number[-4:]}'
                     )
                     
+                    publish('card.payment', user_id=user.id, card_id=payment.credit_card_id,
+                            source_account=payment.source_account.account_number, amount=str(payment.amount))
+                    
                     payment.status = 'COMPLETED'
                     payment.save()
                     messages.success(request, 'Scheduled payment processed successfully.')
@@ -872,8 +1066,20 @@ def scheduled_payments(request):
         
         return redirect('banking:scheduled_payments')
     
+    # Recurring payments create their occurrences lazily, when someone looks
+    schedules = PaymentSchedule.objects.filter(user=user)
+    expand_schedules(schedules)
+    
+    # Upcoming occurrences first, then history, a page at a time
+    payments = ScheduledPayment.objects.filter(user=user).select_related(
+        'credit_card', 'source_account', 'schedule'
+    ).order_by('-scheduled_date', '-id')
+    page = Paginator(payments, 25).get_page(request.GET.get('page'))
+    
     context = {
-        'scheduled_payments': scheduled_payments,
+        'scheduled_payments': page.object_list,
+        'page_obj': page,
+        'schedules': schedules.filter(is_active=True).select_related('credit_card', 'source_account'),
         'today': timezone.now().date()
     }
     return render(request, 'banking/scheduled_payments.html', context)
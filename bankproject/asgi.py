@@ -3,6 +3,9 @@ ASGI config for bankproject project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The admin review queue stream (banking:admin_review_stream) only streams when
+served through this entry point, e.g. under uvicorn or gunicorn's uvicorn worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
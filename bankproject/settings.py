@@ -28,6 +28,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'banking.resolver.AccountResolverMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,6 +68,47 @@ else:
         }
     }
 
+# User sharding (banking/sharding.py): every banking row of a user lives on one
+# shard, while 'default' keeps users, sessions and the account directory.
+# SHARD_DATABASE_URLS lists one database per shard; for local testing,
+# SQLITE_SHARDS=N puts N SQLite files next to the default database.
+if os.environ.get('SHARD_DATABASE_URLS'):
+    for number, url in enumerate(os.environ['SHARD_DATABASE_URLS'].split(',')):
+        DATABASES[f'shard{number}'] = dj_database_url.parse(url.strip())
+elif os.environ.get('SQLITE_SHARDS'):
+    default_name = Path(DATABASES['default']['NAME'])
+    for number in range(int(os.environ['SQLITE_SHARDS'])):
+        DATABASES[f'shard{number}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': default_name.with_name(f'{default_name.stem}_shard{number}.sqlite3'),
+        }
+SHARDS = [alias for alias in DATABASES if alias.startswith('shard')]
+if SHARDS:
+    # A second connection to the default database, untouched when a shard is swapped in as
+    # 'default'; under test it mirrors the test 'default' instead of getting a database of its own
+    DATABASES['directory'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    DATABASE_ROUTERS = ['banking.sharding.ShardRouter']
+    MIDDLEWARE.insert(MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+                      'banking.sharding.ShardMiddleware')
+
+# Opt-in tuning for branches that run on SQLite with concurrent users: WAL,
+# busy waiting and BEGIN IMMEDIATE for money movement (bankproject/sqlite)
+if os.environ.get('SQLITE_HIGH_CONCURRENCY') == 'True':
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database['ENGINE'] = 'bankproject.sqlite'
+
+# Cache configuration
+# Rate limits and cached analytics are only shared between processes with a
+# shared cache. Set REDIS_URL (needs the redis package) to use one.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        }
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -97,11 +139,21 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
-# WhiteNoise configuration for static files
+# WhiteNoise configuration for static files. collectstatic fingerprints every
+# file and precompresses it (gzip, plus brotli when the Brotli package is
+# installed); fingerprinted names are served with a far-future immutable
+# Cache-Control, so repeat page loads only fetch the HTML.
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Proxies in front of the app that append to X-Forwarded-For (Vercel adds one); the client
+# address is taken that many entries from the right, and 0 ignores the header altogether
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', '1'))
+
+# Shared secret the card network sends to the authorization endpoint; unset disables it
+CARD_NETWORK_KEY = os.environ.get('CARD_NETWORK_KEY', '')
+
 LOGIN_REDIRECT_URL = 'banking:dashboard'
 LOGIN_URL = 'banking:login'
 
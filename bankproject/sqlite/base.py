@@ -0,0 +1,31 @@
+from django.db.backends.sqlite3 import base
+
+# Applied to every new connection. WAL lets readers carry on while one writer
+# commits; NORMAL sync is still durable against application crashes in WAL mode.
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA mmap_size=268435456',
+    'PRAGMA cache_size=-65536',
+]
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite tuned for concurrent writers; see banking.locking.money_movement for BEGIN IMMEDIATE"""
+
+    # Set by money_movement for the next outermost transaction on this connection
+    begin_immediate = False
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # Taking the write lock up front means a busy writer waits out busy_timeout
+        # instead of failing when a read-only transaction tries to upgrade
+        if self.begin_immediate:
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()
@@ -1,4 +1,28 @@
 #!/bin/bash
 # build_files.sh
+set -e
 pip install -r requirements.txt
-python manage.py collectstatic --noinput 
\ No newline at end of file
+
+# Front-end libraries are served from our own static files, pinned here.
+# static/vendor is not committed; this fills it in on a fresh checkout.
+BOOTSTRAP_VERSION=5.3.0
+FONTAWESOME_VERSION=6.0.0
+VENDOR=static/vendor
+
+if [ ! -f "$VENDOR/bootstrap/css/bootstrap.min.css" ]; then
+    mkdir -p "$VENDOR/bootstrap"
+    curl -fsSL "https://registry.npmjs.org/bootstrap/-/bootstrap-$BOOTSTRAP_VERSION.tgz" \
+        | tar -xz -C "$VENDOR/bootstrap" --strip-components=2 \
+            package/dist/css/bootstrap.min.css package/dist/css/bootstrap.min.css.map \
+            package/dist/js/bootstrap.bundle.min.js package/dist/js/bootstrap.bundle.min.js.map
+fi
+
+if [ ! -f "$VENDOR/fontawesome/css/all.min.css" ]; then
+    mkdir -p "$VENDOR/fontawesome"
+    curl -fsSL "https://registry.npmjs.org/@fortawesome/fontawesome-free/-/fontawesome-free-$FONTAWESOME_VERSION.tgz" \
+        | tar -xz -C "$VENDOR/fontawesome" --strip-components=1 --wildcards \
+            package/css/all.min.css 'package/webfonts/*'
+fi
+
+# Fingerprints every file and writes .gz and .br copies next to it
+python manage.py collectstatic --noinput
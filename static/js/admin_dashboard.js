@@ -0,0 +1,67 @@
+// Live review queue: the server pushes new PENDING transfers and decisions made by other reviewers
+(function() {
+    if (!window.EventSource) return;
+    const rows = document.getElementById('pending-rows');
+    const counter = document.getElementById('pending-count');
+    const config = document.currentScript.dataset;
+    const approveUrl = config.approveUrl;
+    const rejectUrl = config.rejectUrl;
+
+    function setCount(delta) {
+        const count = Math.max(0, parseInt(counter.dataset.count, 10) + delta);
+        counter.dataset.count = count;
+        counter.textContent = count + ' pending';
+    }
+
+    function cell(text, className) {
+        const td = document.createElement('td');
+        if (className) td.className = className;
+        td.textContent = text;
+        return td;
+    }
+
+    const source = new EventSource(config.streamUrl);
+
+    source.addEventListener('pending', function(event) {
+        const txn = JSON.parse(event.data);
+        // The empty-state card has no table to add to
+        if (!rows) { window.location.reload(); return; }
+        if (rows.querySelector('[data-transaction-id="' + txn.id + '"]')) return;
+
+        const row = document.createElement('tr');
+        row.dataset.transactionId = txn.id;
+        row.appendChild(cell(new Date(txn.timestamp).toLocaleString()));
+        const type = cell('');
+        const badge = document.createElement('span');
+        badge.className = 'badge bg-primary';
+        badge.textContent = txn.transaction_type;
+        type.appendChild(badge);
+        if (txn.review_reasons && txn.review_reasons.length) {
+            const flag = document.createElement('span');
+            flag.className = 'badge bg-danger ms-1';
+            flag.title = txn.review_reasons.join('; ');
+            flag.textContent = 'Velocity flag';
+            type.appendChild(flag);
+        }
+        row.appendChild(type);
+        row.appendChild(cell('$' + parseFloat(txn.amount).toFixed(2), 'fw-bold'));
+        row.appendChild(cell(txn.account_number || '', 'text-muted'));
+        row.appendChild(cell(txn.description));
+        const actions = cell('', 'text-end');
+        actions.innerHTML =
+            '<a class="btn btn-sm btn-success me-2" href="' + approveUrl.replace('/0/', '/' + txn.id + '/') + '"><i class="fas fa-check me-1"></i>Approve</a>' +
+            '<a class="btn btn-sm btn-danger" href="' + rejectUrl.replace('/0/', '/' + txn.id + '/') + '"><i class="fas fa-times me-1"></i>Reject</a>';
+        row.appendChild(actions);
+        rows.prepend(row);
+        setCount(1);
+    });
+
+    source.addEventListener('status', function(event) {
+        const txn = JSON.parse(event.data);
+        const row = rows && rows.querySelector('[data-transaction-id="' + txn.id + '"]');
+        if (row) {
+            row.remove();
+            setCount(-1);
+        }
+    });
+})();
@@ -0,0 +1,22 @@
+function showCVV() {
+    // This is a placeholder for the actual CVV display logic
+    // In a real application, this would require additional security measures
+    alert('For security reasons, please contact customer service to view your CVV.');
+}
+
+function drawBalanceChart() {
+    // Daily closing balances from the dashboard's balance-series JSON, oldest first
+    const data = document.getElementById('balance-series');
+    const chart = document.getElementById('balance-chart');
+    if (!data || !chart) {
+        return;
+    }
+    const balances = JSON.parse(data.textContent).balances.map(Number);
+    const low = Math.min(...balances);
+    const span = (Math.max(...balances) - low) || 1;
+    const step = 600 / Math.max(balances.length - 1, 1);
+    const points = balances.map((balance, i) => `${i * step},${145 - (balance - low) / span * 140}`);
+    chart.querySelector('polyline').setAttribute('points', points.join(' '));
+}
+
+document.addEventListener('DOMContentLoaded', drawBalanceChart);
@@ -0,0 +1,12 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const scheduledRadio = document.getElementById('scheduled');
+    const scheduledDate = document.getElementById('scheduledDate');
+
+    scheduledRadio.addEventListener('change', function() {
+        scheduledDate.style.display = this.checked ? 'block' : 'none';
+    });
+
+    // Set minimum date for scheduled payments
+    const today = new Date().toISOString().split('T')[0];
+    document.querySelector('input[name="scheduled_date"]').min = today;
+});
@@ -0,0 +1,25 @@
+// Handle account filter change to update URL
+document.getElementById('account_filter').addEventListener('change', function() {
+    const selectedValue = this.value;
+    const form = this.closest('form');
+
+    // Clear the other parameter if it exists
+    if (selectedValue.startsWith('c')) {
+        // It's a credit card
+        const cardId = selectedValue.substring(1);
+        const hiddenInput = document.createElement('input');
+        hiddenInput.type = 'hidden';
+        hiddenInput.name = 'card_id';
+        hiddenInput.value = cardId;
+        form.appendChild(hiddenInput);
+
+        // Remove account_id parameter
+        const accountInput = form.querySelector('input[name="account_id"]');
+        if (accountInput) {
+            form.removeChild(accountInput);
+        }
+
+        // Set account_id select to empty
+        this.value = '';
+    }
+});
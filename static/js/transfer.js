@@ -0,0 +1,44 @@
+// Prevent selecting the same account for both from and to fields
+document.getElementById('from_account').addEventListener('change', function() {
+    const fromAccount = this.value;
+    const toAccountSelect = document.getElementById('to_account');
+
+    // Enable all options first
+    Array.from(toAccountSelect.options).forEach(option => {
+        option.disabled = false;
+    });
+
+    // Disable the selected 'from' account in the 'to' dropdown
+    Array.from(toAccountSelect.options).forEach(option => {
+        if (option.value === fromAccount) {
+            option.disabled = true;
+        }
+    });
+
+    // If the currently selected 'to' account is the same as the 'from' account, reset it
+    if (toAccountSelect.value === fromAccount) {
+        toAccountSelect.value = "";
+    }
+});
+
+document.getElementById('to_account').addEventListener('change', function() {
+    const toAccount = this.value;
+    const fromAccountSelect = document.getElementById('from_account');
+
+    // Enable all options first
+    Array.from(fromAccountSelect.options).forEach(option => {
+        option.disabled = false;
+    });
+
+    // Disable the selected 'to' account in the 'from' dropdown
+    Array.from(fromAccountSelect.options).forEach(option => {
+        if (option.value === toAccount) {
+            option.disabled = true;
+        }
+    });
+
+    // If the currently selected 'from' account is the same as the 'to' account, reset it
+    if (fromAccountSelect.value === toAccount) {
+        fromAccountSelect.value = "";
+    }
+});